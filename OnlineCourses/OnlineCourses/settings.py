@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 import environ
@@ -47,20 +48,28 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'PAGE_SIZE': env.int('PAGE_SIZE', default=50),
 }
 
+# PAGE_SIZE is consumed by the keyset pagination classes set on each viewset.
+SILENCED_SYSTEM_CHECKS = ['rest_framework.W001']
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Online Courses API',
     'DESCRIPTION': 'API для онлайн-курсов',
     'VERSION': '1.0.0',
     'SERVE_INCLUDE_SCHEMA': False,
     'COMPONENT_SPLIT_REQUEST': True,
+    'ENUM_NAME_OVERRIDES': {
+        'EnrollmentStatusEnum': 'courses.models.Enrollment.Status',
+        'BulkMarkStatusEnum': ['updated', 'unchanged', 'not_found'],
+    },
     'SWAGGER_UI_SETTINGS': {
         'deepLinking': True,
     },
@@ -84,9 +93,13 @@ SPECTACULAR_SETTINGS = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    # Access tokens carry role, is_staff and full_name; see accounts.authentication.ClaimsJWTAuthentication.
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.serializers.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.TokenRefreshSerializer',
 }
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -131,6 +144,25 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Course access sets and cached responses are invalidated through this cache, so
+# every worker process must share it: with more than one gunicorn/uvicorn worker
+# set CACHE_URL to a Redis or Memcached server, e.g. redis://redis:6379/0. The
+# local-memory default only suits a single process (see `check --deploy`).
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# The test suite runs against SQLite so it does not need a Postgres server.
+if 'test' in sys.argv:
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+    }
+    CACHES['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -177,6 +209,20 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Attachment downloads can be handed to the front server: 'X-Accel-Redirect' (nginx,
+# served from an internal location mapped to ATTACHMENT_SENDFILE_PREFIX) or 'X-Sendfile'.
+ATTACHMENT_SENDFILE_HEADER = env('ATTACHMENT_SENDFILE_HEADER', default=None)
+ATTACHMENT_SENDFILE_PREFIX = env('ATTACHMENT_SENDFILE_PREFIX', default='/protected/')
+
+# Largest file accepted through the chunked upload endpoints.
+ATTACHMENT_UPLOAD_MAX_SIZE = env.int('ATTACHMENT_UPLOAD_MAX_SIZE', default=5 * 1024 ** 3)
+# Seconds after which uploads are deleted, with the partial files of unfinished ones.
+ATTACHMENT_UPLOAD_EXPIRY = env.int('ATTACHMENT_UPLOAD_EXPIRY', default=24 * 3600)
+
+# Server-Timing response header with per-phase timings and query counts. It is
+# sent to every client, so production deployments opt in explicitly.
+SERVER_TIMING_HEADER = env.bool('SERVER_TIMING_HEADER', default=DEBUG)
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
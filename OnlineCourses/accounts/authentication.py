@@ -0,0 +1,126 @@
+from django.db import router
+from django.http import HttpResponse
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import ClaimsUser
+from .tokens import USER_CLAIMS, aclaims_revoked, claims_revoked
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that builds the user from the claims of UserAccessToken without a query.
+
+    Permissions and queryset filters only read the id, role and is_staff, so
+    most requests never touch the users table; other fields are loaded on first
+    access (see ClaimsUser). Tokens without the claims, and every token when
+    CHECK_REVOKE_TOKEN is on, still load the user.
+
+    The claims can go stale: saving or deleting a user (accounts/signals.py)
+    revokes them for the tokens issued before, which then load the user, so
+    a deactivated or demoted user loses access and privileges at once. That
+    costs a cache lookup per request instead of a query. Queryset update()s
+    send no signals; code that changes users that way calls revoke_claims(),
+    or the old claims are trusted until the tokens expire (ACCESS_TOKEN_LIFETIME).
+    """
+
+    def get_user(self, validated_token):
+        user = self.get_claims_user(validated_token)
+        if user is None or claims_revoked(validated_token):
+            return super().get_user(validated_token)
+        return user
+
+    def get_claims_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD != 'id':
+            return None
+        if api_settings.USER_ID_CLAIM not in validated_token or not all(
+                claim in validated_token for claim in USER_CLAIMS):
+            return None
+        values = {claim: validated_token[claim] for claim in USER_CLAIMS}
+        values['id'] = ClaimsUser._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        # from_db() takes the loaded fields in model order and defers the rest.
+        names = [field.attname for field in ClaimsUser._meta.concrete_fields if field.attname in values]
+        return ClaimsUser.from_db(router.db_for_read(ClaimsUser), names, [values[name] for name in names])
+
+
+class AsyncJWTAuthentication(ClaimsJWTAuthentication):
+    """JWTAuthentication for plain async Django views: the user is loaded with the async ORM.
+
+    Token parsing and validation need no I/O and are inherited unchanged, and
+    tokens with claims need no query at all.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user = self.get_claims_user(validated_token)
+        if user is not None and not await aclaims_revoked(validated_token):
+            return user
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+class AsyncAuthenticatedView(View):
+    """Base of plain async Django views that require a JWT, like DRF's IsAuthenticated.
+
+    Subclasses implement ``async def handle(request, user, **kwargs)`` returning
+    an HttpResponse; ``render()`` builds JSON responses the way DRF does.
+    """
+    http_method_names = ['get']
+    authentication_class = AsyncJWTAuthentication
+
+    async def get(self, request, **kwargs):
+        try:
+            auth = await self.authentication_class().aauthenticate(request)
+        except APIException as exc:
+            return self.unauthorized(request, exc)
+        if auth is None:
+            return self.unauthorized(request, NotAuthenticated())
+        return await self.handle(request, auth[0], **kwargs)
+
+    async def handle(self, request, user, **kwargs):
+        """Answer the authenticated request; views that do not override it answer 405."""
+        return await self.http_method_not_allowed(request, **kwargs)
+
+    def unauthorized(self, request, exc):
+        response = self.render_exception(exc)
+        response['WWW-Authenticate'] = self.authentication_class().authenticate_header(request)
+        return response
+
+    @classmethod
+    def render_exception(cls, exc):
+        """Render an APIException like DRF's exception handler."""
+        return cls.render(exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail},
+                          status=exc.status_code)
+
+    @staticmethod
+    def render(data, status=200, renderer_class=JSONRenderer):
+        renderer = renderer_class()
+        return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
@@ -39,3 +39,26 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.email
+
+
+class ClaimsUser(User):
+    """A User built from access token claims without a query, see ClaimsJWTAuthentication.
+
+    Only the claimed fields are set. The first access to any other field
+    loads all of them with one query.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.intersection(fields):
+            fields = list(deferred.union(fields))
+        super().refresh_from_db(using, fields, from_queryset)
+
+    async def aload(self):
+        """Load the fields that did not come with the token, for async code that reads them."""
+        deferred = self.get_deferred_fields()
+        if deferred:
+            await self.arefresh_from_db(fields=list(deferred))
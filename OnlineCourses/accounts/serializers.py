@@ -1,5 +1,9 @@
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
 from .models import User
+from .tokens import UserAccessToken, UserRefreshToken, add_user_claims
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -15,4 +19,21 @@ class UserSerializer(serializers.ModelSerializer):
             role=validated_data['role'],
             password=password
         )
-        return user
\ No newline at end of file
+        return user
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    token_class = UserRefreshToken
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """Signs the user's current claims into the new access token instead of those of the refresh token."""
+    token_class = UserRefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = UserAccessToken(data['access'], verify=False)
+        user = User.objects.filter(**{jwt_settings.USER_ID_FIELD: access[jwt_settings.USER_ID_CLAIM]}).first()
+        if user is not None:
+            data['access'] = str(add_user_claims(access, user))
+        return data
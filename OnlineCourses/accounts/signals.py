@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import ClaimsUser, User
+from .tokens import revoke_claims
+
+
+# Access tokens carry the user's role, is_staff and full_name; any change to
+# the user, e.g. deactivation or a new role, revokes the claims issued before.
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=ClaimsUser)
+def user_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if not created and not raw and update_fields != frozenset(['last_login']):
+        revoke_claims(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=ClaimsUser)
+def user_deleted(sender, instance, **kwargs):
+    revoke_claims(instance.pk)
@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+# User fields signed into access tokens, read back by ClaimsJWTAuthentication.
+USER_CLAIMS = ('role', 'is_staff', 'full_name')
+
+
+def _revoked_key(user_id):
+    return f'accounts:claims-revoked:{user_id}'
+
+
+def revoke_claims(user_id):
+    """Make the access tokens issued to a user until now load the user instead of trusting their claims."""
+    cache.set(_revoked_key(user_id), int(timezone.now().timestamp()),
+              api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+def claims_revoked(token):
+    """Whether revoke_claims() was called for the token's user since it was issued."""
+    revoked_at = cache.get(_revoked_key(token[api_settings.USER_ID_CLAIM]))
+    # iat has a resolution of seconds, so a token from the same second is revoked too.
+    return revoked_at is not None and token.get('iat', 0) <= revoked_at
+
+
+async def aclaims_revoked(token):
+    """claims_revoked for async code."""
+    revoked_at = await cache.aget(_revoked_key(token[api_settings.USER_ID_CLAIM]))
+    return revoked_at is not None and token.get('iat', 0) <= revoked_at
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class UserAccessToken(AccessToken):
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+class UserRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the USER_CLAIMS."""
+    access_token_class = UserAccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
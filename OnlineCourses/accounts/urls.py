@@ -1,8 +1,9 @@
 from django.urls import path
 
-from accounts.views import RegisterView, ProfileView
+from accounts.views import RegisterView, ProfileView, AsyncProfileView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('profile/', ProfileView.as_view(), name='profile'),
+    path('async/profile/', AsyncProfileView.as_view(), name='async-profile'),
 ]
\ No newline at end of file
@@ -3,6 +3,9 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from core.metrics import TimedViewMixin, timed
+from .authentication import AsyncAuthenticatedView
+from .models import ClaimsUser
 from .serializers import UserSerializer
 
 @extend_schema(summary="Register user",
@@ -10,11 +13,11 @@ from .serializers import UserSerializer
     request=UserSerializer,
     responses={201: UserSerializer}
 )
-class RegisterView(APIView):
+class RegisterView(TimedViewMixin, APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        serializer = UserSerializer(data=request.data)
+        serializer = timed(UserSerializer(data=request.data))
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -24,10 +27,18 @@ class RegisterView(APIView):
     tags=['Auth'],
     responses={200: UserSerializer}
 )
-class ProfileView(APIView):
+class ProfileView(TimedViewMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        serializer = timed(UserSerializer(request.user))
         return Response(serializer.data)
 
+
+class AsyncProfileView(AsyncAuthenticatedView):
+    """ProfileView for ASGI deployments; the user is loaded with the async ORM."""
+
+    async def handle(self, request, user):
+        if isinstance(user, ClaimsUser):
+            await user.aload()
+        return self.render(timed(UserSerializer(user)).data)
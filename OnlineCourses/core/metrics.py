@@ -0,0 +1,217 @@
+"""Per-request timings (SQL, permissions, serialization, rendering) and their latency histograms.
+
+ServerTimingMiddleware (core/middleware.py) opens a RequestTimings for each
+request; record_query, TimedViewMixin and timed() below add to it.
+Histograms are kept per process, like prometheus_client without its
+multiprocess mode: with several workers each scrape sees the worker that
+served it.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+PHASES = ('db', 'permissions', 'serialize', 'render', 'total')
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.view = None
+        self.timing = None
+
+    def add(self, phase, seconds):
+        self.durations[phase] += seconds
+
+    def finish(self):
+        self.durations['total'] = time.perf_counter() - self.started
+
+    def header(self):
+        """The Server-Timing header value, durations in milliseconds."""
+        entries = []
+        for phase in PHASES:
+            entry = f'{phase};dur={self.durations[phase] * 1000:.1f}'
+            if phase == 'db':
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        return ', '.join(entries)
+
+
+class phase_timer:
+    """Add the time spent in the block to ``phase`` of the current request; nested blocks count once."""
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        timings = current.get()
+        self.timings = timings if timings is not None and timings.timing is None else None
+        if self.timings is not None:
+            self.timings.timing = self.phase
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.timing = None
+            self.timings.add(self.phase, time.perf_counter() - self.started)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - started)
+        timings.queries += 1
+
+
+def instrument_connection(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_connections():
+    """Add record_query to the open connections of this thread; new ones get it as they connect."""
+    for connection in connections.all(initialized_only=True):
+        instrument_connection(connection)
+
+
+def install():
+    """Hook record_query into the database connections of this process as they connect."""
+    connection_created.connect(instrument_connection, dispatch_uid='core.metrics.instrument_connection')
+
+
+class TimedViewMixin:
+    """Adds authentication, permission and throttle checks to the ``permissions`` phase
+    and the serializers from get_serializer() to the ``serialize`` phase.
+
+    Goes before the DRF base class, e.g. ``class SearchView(TimedViewMixin, APIView)``.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        # Schema generation names components after the serializer classes.
+        return serializer if getattr(self, 'swagger_fake_view', False) else timed(serializer)
+
+    def initial(self, request, *args, **kwargs):
+        with phase_timer('permissions'):
+            return super().initial(request, *args, **kwargs)
+
+    def check_object_permissions(self, request, obj):
+        with phase_timer('permissions'):
+            return super().check_object_permissions(request, obj)
+
+
+def timed(serializer):
+    """Return ``serializer`` with building its ``.data``, and the queries that runs, added to the ``serialize`` phase.
+
+    Views get this for every serializer from get_serializer() through
+    TimedViewMixin; serializers built by hand are passed through it.
+    """
+    cls = type(serializer)
+    if not getattr(cls, 'timed', False):
+        if cls not in _timed_classes:
+            _timed_classes[cls] = type(cls.__name__, (cls,), {
+                '__module__': cls.__module__, '__qualname__': cls.__qualname__,
+                'timed': True, 'data': property(_timed_data(cls)),
+            })
+        serializer.__class__ = _timed_classes[cls]
+    return serializer
+
+
+_timed_classes = {}
+
+
+def _timed_data(cls):
+    def data(self):
+        with phase_timer('serialize'):
+            return cls.data.__get__(self)
+    return data
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """(le, cumulative count) pairs, ending with +Inf."""
+        total = 0
+        for le, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield le, total
+
+
+class Registry:
+    """Request histograms per view and phase, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.queries = {}
+
+    def observe(self, timings):
+        with self.lock:
+            for phase in PHASES:
+                key = (timings.view, phase)
+                if key not in self.durations:
+                    self.durations[key] = Histogram(DURATION_BUCKETS)
+                self.durations[key].observe(timings.durations[phase])
+            if timings.view not in self.queries:
+                self.queries[timings.view] = Histogram(QUERY_BUCKETS)
+            self.queries[timings.view].observe(timings.queries)
+
+    def render(self):
+        lines = [
+            '# HELP http_request_duration_seconds Request time per view and phase.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            for (view, phase), histogram in sorted(self.durations.items()):
+                lines += render_histogram('http_request_duration_seconds', histogram,
+                                          f'view="{escape(view)}",phase="{phase}"')
+            lines += [
+                '# HELP http_request_db_queries SQL queries per request and view.',
+                '# TYPE http_request_db_queries histogram',
+            ]
+            for view, histogram in sorted(self.queries.items()):
+                lines += render_histogram('http_request_db_queries', histogram, f'view="{escape(view)}"')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            self.durations.clear()
+            self.queries.clear()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_histogram(name, histogram, labels):
+    lines = [f'{name}_bucket{{{labels},le="{le}"}} {count}' for le, count in histogram.samples()]
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6g}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+registry = Registry()
@@ -0,0 +1,79 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+
+class ServerTimingMiddleware:
+    """Time each request by phase, report it in a Server-Timing header and in the /api/_metrics histograms.
+
+    Put it first in MIDDLEWARE so ``total`` covers the whole stack. DRF
+    views are labelled by viewset and action, e.g. ``CourseViewSet.list``,
+    other views by URL name. The header shows every client the timings and
+    query counts, so it is only sent with SERVER_TIMING_HEADER, which
+    defaults to DEBUG; the histograms are always kept.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = getattr(settings, 'SERVER_TIMING_HEADER', settings.DEBUG)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        metrics.install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics.instrument_connections()
+        timings = metrics.RequestTimings()
+        token = metrics.current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = metrics.RequestTimings()
+        token = metrics.current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self.finish(request, response, timings)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = metrics.current.get()
+        if timings is not None:
+            timings.view = view_label(request, view_func)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook.
+        timings = metrics.current.get()
+        if timings is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda response: timings.add('render', time.perf_counter() - started))
+        return response
+
+    def finish(self, request, response, timings):
+        timings.finish()
+        if timings.view is None:
+            timings.view = 'unmatched'
+        metrics.registry.observe(timings)
+        if self.header:
+            response['Server-Timing'] = timings.header()
+        return response
+
+
+def view_label(request, view_func):
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    actions = getattr(view_func, 'actions', None)
+    if cls is not None and actions:
+        return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    if cls is not None:
+        return f'{cls.__name__}.{request.method.lower()}'
+    return request.resolver_match.view_name if request.resolver_match else view_func.__name__
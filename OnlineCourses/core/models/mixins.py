@@ -5,6 +5,12 @@ class CreatedAtMixin(models.Model):
 
     class Meta:
         abstract = True
+class UpdatedAtMixin(models.Model):
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
 class UploadedAtMixin(models.Model):
     uploaded_at = models.DateTimeField(auto_now=True)
 
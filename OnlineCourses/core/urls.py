@@ -1,6 +1,9 @@
 from django.urls import path, include
 
+from .views import MetricsView
+
 urlpatterns = [
     path('accounts/', include(('accounts.urls', 'accounts'), namespace='accounts')),
     path('courses/', include(('courses.urls', 'courses'), namespace='courses')),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,35 @@
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiResponse, extend_schema
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import metrics
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data.encode()
+
+
+@extend_schema(
+    summary="Request latency and query histograms in Prometheus text format (staff only)",
+    tags=['Metrics'],
+    responses={(200, 'text/plain'): OpenApiResponse(OpenApiTypes.STR)}
+)
+class MetricsView(metrics.TimedViewMixin, APIView):
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PrometheusRenderer, JSONRenderer]
+
+    def handle_exception(self, exc):
+        # Errors, e.g. 403 for non-staff, are JSON whatever the client accepts.
+        self.request.accepted_renderer, self.request.accepted_media_type = JSONRenderer(), JSONRenderer.media_type
+        return super().handle_exception(exc)
+
+    def get(self, request):
+        return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from accounts.models import User
+from .models import Course, Enrollment
+
+ACCESS_CACHE_TIMEOUT = getattr(settings, 'COURSE_ACCESS_CACHE_TIMEOUT', 300)
+
+
+def _cache_key(user_id):
+    return f'courses:access:{user_id}'
+
+
+def accessible_course_ids(user):
+    """Return the ids of the courses whose content the user may read.
+
+    Teachers get the courses they created, students the courses they have an
+    approved enrollment in. The result is cached per user and dropped by the
+    signal handlers in signals.py whenever an Enrollment or Course changes.
+    """
+    key = _cache_key(user.pk)
+    course_ids = cache.get(key)
+    if course_ids is None:
+        course_ids = sorted(_course_ids_query(user))
+        cache.set(key, course_ids, ACCESS_CACHE_TIMEOUT)
+    return course_ids
+
+
+async def aaccessible_course_ids(user):
+    """accessible_course_ids for async views; both share the cached sets."""
+    key = _cache_key(user.pk)
+    course_ids = await cache.aget(key)
+    if course_ids is None:
+        course_ids = sorted([pk async for pk in _course_ids_query(user)])
+        await cache.aset(key, course_ids, ACCESS_CACHE_TIMEOUT)
+    return course_ids
+
+
+def _course_ids_query(user):
+    if getattr(user, 'role', None) == User.RoleTypes.TEACHER:
+        return Course.objects.filter(created_by=user.pk).values_list('pk', flat=True)
+    return Enrollment.objects.filter(
+        student=user.pk, status=Enrollment.Status.APPROVED
+    ).values_list('course_id', flat=True)
+
+
+def invalidate_course_access(*user_ids):
+    keys = [_cache_key(user_id) for user_id in user_ids]
+
+    def drop():
+        cache.delete_many(keys)
+
+    drop()
+    # Requests between the change and its commit may cache the old set;
+    # dropping it again once committed removes what they stored.
+    transaction.on_commit(drop)
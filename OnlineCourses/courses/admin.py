@@ -1,5 +1,7 @@
 from django.contrib import admin
 
-from courses.models import Course, Lecture, Task, Solution, Comment, Attachment, Enrollment
+from courses.models import (
+    Course, Lecture, Task, Solution, Comment, Attachment, Blob, Enrollment, Job, TaskSubmissionState
+)
 
-admin.site.register([Course, Lecture, Task, Solution, Comment, Attachment, Enrollment])
\ No newline at end of file
+admin.site.register([Course, Lecture, Task, Solution, Comment, Attachment, Blob, Enrollment, Job, TaskSubmissionState])
\ No newline at end of file
@@ -0,0 +1,161 @@
+import hashlib
+
+from django.db import models
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from accounts.authentication import AsyncAuthenticatedView
+from core.metrics import timed
+from .access import aaccessible_course_ids
+from .fastpath import FastJSONRenderer, Unsupported, row_shaper
+from .feeds import Topic, parse_cursor, stream_comments
+from .models import Course, Lecture, Task
+from .pagination import CreatedAtPagination
+from .prefetch import with_tree, COURSE_TREE, COURSE_LIST_TREE, LECTURE_TREE, TASK_TREE
+from .serializers import CourseSerializer, CourseListSerializer, LectureSerializer, TaskSerializer
+
+
+class AsyncReadView(AsyncAuthenticatedView):
+    """List (without ``pk``) and retrieve (with ``pk``) of a model through the async ORM.
+
+    DRF views are synchronous, so under ASGI each request to a viewset holds a
+    worker thread for its whole duration. These views render the same JSON as
+    the viewset's list/retrieve and answer conditional requests from the same
+    content versions, but await the database instead. ?fields=/?expand= and
+    the response cache are left to the viewsets.
+    """
+    model = None
+    serializer_class = None
+    list_serializer_class = None
+    prefetch_tree = None
+    list_prefetch_tree = None
+    pagination_class = CreatedAtPagination
+    course_path = ''
+
+    async def get_queryset(self, user):
+        return self.model.objects.all()
+
+    async def handle(self, request, user, pk=None):
+        queryset = await self.get_queryset(user)
+        etag, last_modified = await self.get_validators(queryset, pk)
+        if etag is None:
+            return self.not_found()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            # Pagination links and file URLs are built from a DRF request, as in the viewsets.
+            request = Request(request)
+            response = await (self.list(request, queryset) if pk is None else self.retrieve(request, queryset, pk))
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    async def get_validators(self, queryset, pk):
+        """ConditionalGetMixin.get_validators with aget/aaggregate; (None, None) if ``pk`` is not found."""
+        version, changed_at = self.course_path + 'content__version', self.course_path + 'content__updated_at'
+        if pk is not None:
+            row = await queryset.filter(pk=pk).values_list(version, changed_at).afirst()
+            if row is None:
+                return None, None
+            return self.make_etag(row[0]), None if row[1] is None else int(row[1].timestamp())
+        totals = await queryset.aaggregate(count=models.Count('pk'), version=models.Sum(version),
+                                           changed_at=models.Max(changed_at))
+        return self.make_etag(totals['count'], totals['version'], totals['changed_at']), None
+
+    def make_etag(self, *parts):
+        key = '|'.join([self.request.get_full_path(), *map(str, parts)])
+        return '"%s"' % hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+    def not_found(self):
+        return self.render({'detail': f"No {self.model._meta.object_name} matches the given query."}, status=404)
+
+    async def list(self, request, queryset):
+        serializer_class = self.list_serializer_class or self.serializer_class
+        paginator = self.pagination_class()
+        shaper = row_shaper(serializer_class)
+        if shaper is not None:
+            paths = shaper.paths + [field.lstrip('-') for field in paginator.ordering]
+            rows = await paginator.apaginate_queryset(queryset.values(*dict.fromkeys(paths)), request, self)
+            tz = timezone.get_current_timezone()
+            try:
+                data = [shaper.shape(row, tz) for row in rows]
+            except Unsupported:
+                pass
+            else:
+                return self.render(paginator.get_paginated_response(data).data, renderer_class=FastJSONRenderer)
+
+        tree = self.list_prefetch_tree if self.list_prefetch_tree is not None else self.prefetch_tree
+        page = await paginator.apaginate_queryset(with_tree(queryset, tree), request, self)
+        data = timed(serializer_class(page, many=True, context={'request': request})).data
+        return self.render(paginator.get_paginated_response(data).data)
+
+    async def retrieve(self, request, queryset, pk):
+        try:
+            instance = await with_tree(queryset, self.prefetch_tree).aget(pk=pk)
+        except self.model.DoesNotExist:
+            return self.not_found()
+        return self.render(timed(self.serializer_class(instance, context={'request': request})).data)
+
+
+class AsyncCourseView(AsyncReadView):
+    model = Course
+    serializer_class = CourseSerializer
+    list_serializer_class = CourseListSerializer
+    prefetch_tree = COURSE_TREE
+    list_prefetch_tree = COURSE_LIST_TREE
+
+
+class AsyncLectureView(AsyncReadView):
+    model = Lecture
+    serializer_class = LectureSerializer
+    prefetch_tree = LECTURE_TREE
+    course_path = 'course__'
+
+    async def get_queryset(self, user):
+        if user.is_staff:
+            return Lecture.objects.all()
+        return Lecture.objects.filter(course__in=await aaccessible_course_ids(user))
+
+
+class AsyncTaskView(AsyncReadView):
+    model = Task
+    serializer_class = TaskSerializer
+    prefetch_tree = TASK_TREE
+    course_path = 'lecture__course__'
+
+    async def get_queryset(self, user):
+        if user.is_staff:
+            return Task.objects.all()
+        return Task.objects.filter(lecture__course__in=await aaccessible_course_ids(user))
+
+
+class CommentStreamView(AsyncAuthenticatedView):
+    """Server-Sent Events with the comments of a solution (?solution=) or course (?course=) as they are posted.
+
+    Each event is a comment as CommentViewSet renders it, with its feed cursor
+    as the event id. ?since= or the Last-Event-ID header of a reconnecting
+    client first replays the comments after that cursor. All streams of a
+    process share one CommentHub, so they cost one query per poll together.
+    Access is checked again with every keepalive interval and the stream ends
+    once the user has lost it. Only useful under ASGI; a WSGI worker would be held for the whole stream.
+    """
+
+    async def handle(self, request, user):
+        try:
+            topic = Topic.from_params(request.GET)
+            since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+            position = parse_cursor(since) if since else None
+            await topic.aauthorize(user)
+        except APIException as exc:
+            return self.render_exception(exc)
+        response = StreamingHttpResponse(stream_comments(topic, position, user), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Keeps nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,48 @@
+from django.db.models import F, OuterRef, Subquery
+from rest_framework import serializers
+from rest_framework.exceptions import PermissionDenied
+
+from .models import Enrollment, Solution, Task
+
+# Path from a model to the course it belongs to.
+COURSE_PATHS = {
+    Task: 'lecture__course',
+    Solution: 'task__lecture__course',
+}
+
+
+def with_course_access(queryset, user):
+    """Annotate the tasks or solutions in ``queryset`` with what the write paths check about ``user``.
+
+    Each object gets ``course_id``, ``teacher_id`` (the course's creator) and
+    ``enrollment_status``, the status of the user's enrollment in the course
+    or None if there is none, so loading an object also authorizes it: one
+    query instead of walking task.lecture.course and fetching the Enrollment.
+    """
+    course = COURSE_PATHS[queryset.model]
+    return queryset.annotate(
+        course_id=F(f'{course}_id'),
+        teacher_id=F(f'{course}__created_by_id'),
+        enrollment_status=Subquery(
+            Enrollment.objects.filter(student=user.pk, course=OuterRef(f'{course}_id')).values('status')[:1]
+        ),
+    )
+
+
+class CourseAccessRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField that loads the object through with_course_access() for the requesting user."""
+
+    def get_queryset(self):
+        return with_course_access(super().get_queryset(), self.context['request'].user)
+
+
+def is_course_teacher(obj, user):
+    return obj.teacher_id == user.pk or user.is_staff
+
+
+def require_approved_enrollment(obj, action):
+    """Raise PermissionDenied unless ``obj`` (from with_course_access) is in a course the user is approved in."""
+    if obj.enrollment_status is None:
+        raise PermissionDenied("You are not enrolled in this course.")
+    if obj.enrollment_status != Enrollment.Status.APPROVED:
+        raise PermissionDenied(f"Your enrollment is not approved; you cannot {action}.")
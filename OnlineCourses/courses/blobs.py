@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import jobs
+from .models import Blob
+
+
+def blob_name(sha256):
+    """Storage name of a blob: blobs/ab/cd/abcd..., fanned out to keep directories small."""
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+def file_digest(file):
+    """Return (sha256 hexdigest, size) of a Django File, read chunk by chunk."""
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return digest.hexdigest(), size
+
+
+def _acquire(sha256, size, write):
+    """Take a reference to the blob with this digest, calling ``write(name)`` if its file is missing.
+
+    Existing blobs, including released ones awaiting collection, are locked
+    while their count is raised, so the collect job either runs first and
+    the file is written again, or sees the new reference and keeps the file.
+    """
+    name = blob_name(sha256)
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None:
+            if not default_storage.exists(name):
+                write(name)
+            try:
+                with transaction.atomic():
+                    return Blob.objects.create(sha256=sha256, file=name, size=size, ref_count=1)
+            except IntegrityError:
+                # Someone stored the same content first; take a reference to theirs.
+                blob = Blob.objects.select_for_update().get(sha256=sha256)
+        if blob.ref_count == 0 and not default_storage.exists(name):
+            write(name)
+        Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        blob.ref_count += 1
+    return blob
+
+
+def store_file(file):
+    """Return a referenced Blob holding the content of ``file``, storing it only if unseen."""
+    sha256, size = file_digest(file)
+
+    def write(name):
+        saved = default_storage.save(name, file)
+        if saved != name:
+            # A concurrent writer got there first with the same bytes.
+            default_storage.delete(saved)
+
+    return _acquire(sha256, size, write)
+
+
+def adopt_path(path, sha256, size):
+    """Like store_file for a complete file already on local disk, which is moved or removed.
+
+    Used by chunked uploads, whose digest is known by the time they finish.
+    """
+    def write(name):
+        target = default_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    blob = _acquire(sha256, size, write)
+    if os.path.exists(path):
+        os.remove(path)
+    return blob
+
+
+@jobs.register('collect_blob')
+def collect(sha256, name):
+    """Delete a released blob and its file, unless the same content was stored again since."""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(sha256=sha256, ref_count=0).first()
+        if blob is not None:
+            default_storage.delete(name)
+            blob.delete()
+
+
+def release(blob_id):
+    """Drop one reference to a blob; the last one leaves it at zero for a job to collect."""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None or blob.ref_count == 0:
+            return
+        Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+        if blob.ref_count == 1:
+            jobs.enqueue('collect_blob', {'sha256': blob.sha256, 'name': blob.file.name},
+                         dedupe_key=f'blob:{blob.sha256}')
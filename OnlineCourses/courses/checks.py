@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Access sets and cached responses are only invalidated in the worker that made the change."""
+    if settings.CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache':
+        return [Warning(
+            "The default cache is local to each process, so enrollment and content changes "
+            "stay invisible to other workers for up to COURSE_ACCESS_CACHE_TIMEOUT seconds.",
+            hint="Set CACHE_URL to a shared Redis or Memcached server when running more than one worker.",
+            id='courses.W001',
+        )]
+    return []
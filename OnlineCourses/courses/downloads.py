@@ -0,0 +1,136 @@
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.renderers import JSONRenderer
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class PassthroughRenderer(JSONRenderer):
+    """Lets file downloads pass content negotiation for any Accept header.
+
+    File responses bypass rendering; only error payloads reach this renderer
+    and they are still rendered as JSON.
+    """
+    media_type = '*/*'
+    format = 'bin'
+
+
+class FileRange:
+    """File-like view of ``length`` bytes of ``file`` starting at ``start``."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def attachment_validators(attachment):
+    """Return the (ETag, Last-Modified timestamp) of an attachment's file.
+
+    ``uploaded_at`` changes whenever the row is saved, which covers every
+    replacement of the file, so no file I/O is needed to answer conditional
+    requests.
+    """
+    version = int(attachment.uploaded_at.timestamp() * 1_000_000)
+    return f'"{attachment.pk}-{version}"', int(attachment.uploaded_at.timestamp())
+
+
+def parse_range(header, size):
+    """Return (start, end) for a single satisfiable byte range, None to ignore it, or False if unsatisfiable.
+
+    Following RFC 9110, invalid ranges are ignored and only a range starting
+    at or past the end of the file (or an empty suffix) is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Malformed or multi-range requests get the full file.
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            # Invalid, e.g. bytes=5-3.
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_attachment(request, attachment):
+    """Serve an attachment's file honouring conditional and Range requests.
+
+    With ATTACHMENT_SENDFILE_HEADER set the transfer is handed to the front
+    server (X-Accel-Redirect for nginx, X-Sendfile for Apache/lighttpd), which
+    then also handles Range itself. Otherwise the file is streamed with
+    FileResponse, which the WSGI server can send with sendfile().
+    """
+    etag, last_modified = attachment_validators(attachment)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    filename = attachment.filename
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    sendfile_header = getattr(settings, 'ATTACHMENT_SENDFILE_HEADER', None)
+
+    if sendfile_header:
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header == 'X-Accel-Redirect':
+            response[sendfile_header] = quote(settings.ATTACHMENT_SENDFILE_PREFIX + attachment.file.name)
+        else:
+            response[sendfile_header] = attachment.file.path
+        response['Content-Disposition'] = f"attachment; filename*=utf-8''{quote(filename)}"
+    else:
+        file = attachment.file.open('rb')
+        size = attachment.file.size
+        byte_range = None
+        if 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, last_modified):
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        if byte_range is False:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range:
+            start, end = byte_range
+            response = FileResponse(FileRange(file, start, end - start + 1), status=206, as_attachment=True,
+                                    filename=filename, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
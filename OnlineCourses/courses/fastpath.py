@@ -0,0 +1,153 @@
+import orjson
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601, fields as drf_fields, relations
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer, ListSerializer
+from rest_framework.settings import api_settings
+
+# A fast list fetches exactly the columns its serializer renders with
+# .values(), turning each row into the serializer's output with a function
+# generated from the serializer's fields, and renders it with orjson. The
+# bytes are the same as the serializer + JSONRenderer path, which stays in
+# charge of everything the shaper cannot reproduce exactly.
+
+# Field classes whose to_representation() returns database values unchanged.
+_PASSTHROUGH = (
+    drf_fields.IntegerField, drf_fields.CharField, drf_fields.BooleanField, relations.PrimaryKeyRelatedField,
+)
+
+
+class Unsupported(Exception):
+    """The serializer or a value cannot be shaped byte for byte; use the regular path."""
+
+
+def _datetime(value, tz):
+    # DateTimeField.to_representation with the ISO 8601 format.
+    if not value:
+        return None
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _float(value):
+    if value is None:
+        return None
+    value = float(value)
+    # json writes exponents as 1e-05/1e+16 and orjson as 1e-5/1e16; the ranges
+    # in between print identically. NaN and infinity are rejected by DRF.
+    if value and not 1e-4 <= abs(value) < 1e16:
+        raise Unsupported(value)
+    return value
+
+
+class RowShaper:
+    """Turns .values() rows into the output of a serializer class without instantiating fields.
+
+    ``paths`` are the value lookups to fetch, ``shape(row, tz)`` builds one
+    item; ``tz`` is the current time zone datetimes are rendered in.
+    """
+
+    def __init__(self, name, paths, source):
+        self.paths = paths
+        self.source = source
+        namespace = {'_datetime': _datetime, '_float': _float}
+        exec(compile(source, f'<shaper of {name}>', 'exec'), namespace)
+        self.shape = namespace['shape']
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        paths = []
+        body = _dict_expr(serializer, serializer.Meta.model, '', paths)
+        source = f'def shape(row, tz):\n    return {body}\n'
+        return cls(type(serializer).__name__, paths, source)
+
+
+def _lookup(model, source_attrs):
+    """Return the model field a dotted source points at, walking forward relations."""
+    field = None
+    for i, attr in enumerate(source_attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise Unsupported(attr)
+        if not field.concrete or field.many_to_many:
+            raise Unsupported(attr)
+        if i < len(source_attrs) - 1:
+            if not field.many_to_one:
+                raise Unsupported(attr)
+            model = field.related_model
+    return field
+
+
+def _dict_expr(serializer, model, prefix, paths):
+    items = []
+    for field in serializer._readable_fields:
+        if field.source == '*':
+            raise Unsupported(field.field_name)
+        model_field = _lookup(model, field.source_attrs)
+        path = prefix + '__'.join(field.source_attrs)
+        if isinstance(field, ListSerializer):
+            raise Unsupported(field.field_name)
+        if isinstance(field, BaseSerializer):
+            related = model_field.related_model
+            pk_path = f'{path}__{related._meta.pk.name}'
+            nested = _dict_expr(field, related, path + '__', paths)
+            if pk_path not in paths:
+                paths.append(pk_path)
+            expr = f'(None if row[{pk_path!r}] is None else {nested})' if model_field.null else nested
+        else:
+            paths.append(path)
+            expr = _value_expr(field, path)
+        items.append(f'{field.field_name!r}: {expr}')
+    return '{' + ', '.join(items) + '}'
+
+
+def _value_expr(field, path):
+    value = f'row[{path!r}]'
+    if type(field) is drf_fields.DateTimeField:
+        if (getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601 or hasattr(field, 'timezone')
+                or not settings.USE_TZ):
+            raise Unsupported(field.field_name)
+        return f'_datetime({value}, tz)'
+    if type(field) is drf_fields.FloatField:
+        return f'_float({value})'
+    if type(field) is drf_fields.ChoiceField and all(isinstance(key, str) for key in field.choices):
+        return value
+    if isinstance(field, _PASSTHROUGH) and not isinstance(field, relations.HyperlinkedRelatedField):
+        return value
+    raise Unsupported(field.field_name)
+
+
+_shapers = {}
+
+
+def row_shaper(serializer_class):
+    """Return the cached RowShaper of a serializer class, or None if it has fields the shaper cannot reproduce."""
+    if serializer_class not in _shapers:
+        try:
+            _shapers[serializer_class] = RowShaper.for_serializer(serializer_class())
+        except Unsupported:
+            _shapers[serializer_class] = None
+    return _shapers[serializer_class]
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer using orjson for data made of dicts, lists, str, int, None and shaped floats.
+
+    Only fast lists hand data to this renderer; indented output and non-default
+    JSON settings go through JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (data is None or self.get_indent(accepted_media_type, renderer_context or {})
+                or not self.compact or self.ensure_ascii):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer, escape the line separators that are invalid in JavaScript strings.
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
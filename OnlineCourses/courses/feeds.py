@@ -0,0 +1,269 @@
+import asyncio
+import json
+import weakref
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from .access import aaccessible_course_ids, accessible_course_ids
+from .models import Comment, Course, Solution
+from .serializers import CommentSerializer
+
+FEED_PAGE_SIZE = 100
+# How often a process looks for comments created by other processes. Comments
+# saved in this process wake the streams up at once.
+POLL_INTERVAL = getattr(settings, 'COMMENT_FEED_POLL_INTERVAL', 1.0)
+# Comments that commit this long after their created_at are still delivered
+# to streams that are connected.
+COMMIT_LAG = timedelta(seconds=getattr(settings, 'COMMENT_FEED_COMMIT_LAG', 5))
+# Undelivered events a stream may hold; a stream that falls behind is closed
+# and the client resumes from its Last-Event-ID.
+STREAM_BACKLOG = 1000
+
+
+def format_cursor(comment):
+    return f'{comment.created_at.isoformat()}|{comment.pk}'
+
+
+def parse_cursor(value):
+    """Parse a cursor from format_cursor() into (created_at, id)."""
+    timestamp, _, pk = value.rpartition('|')
+    try:
+        created_at = parse_datetime(timestamp) if timestamp else None
+    except ValueError:
+        # Well formed but out of range, e.g. month 13.
+        created_at = None
+    if created_at is None or not pk.isdigit():
+        raise ValidationError({'since': "Invalid cursor."})
+    return created_at, int(pk)
+
+
+def after(position):
+    """Comments after (created_at, id) ``position``, in feed order.
+
+    The created_at__gte bound is redundant but gives the index a range start;
+    with the OR alone, every poll would scan the comments from the first one.
+    """
+    created_at, pk = position
+    return models.Q(created_at__gte=created_at) & (
+        models.Q(created_at__gt=created_at) | models.Q(created_at=created_at, pk__gt=pk))
+
+
+class Topic:
+    """The comments of one solution or one course, as requested with ?solution= or ?course=."""
+
+    def __init__(self, solution_id=None, course_id=None):
+        self.solution_id = solution_id
+        self.course_id = course_id
+
+    @classmethod
+    def from_params(cls, params):
+        names = [name for name in ('solution', 'course') if params.get(name)]
+        if len(names) != 1:
+            raise ValidationError({'detail': "Pass exactly one of solution and course."})
+        value = params[names[0]]
+        if not value.isdigit():
+            raise ValidationError({names[0]: "A valid integer is required."})
+        return cls(**{f'{names[0]}_id': int(value)})
+
+    def comments(self):
+        if self.solution_id is not None:
+            return Comment.objects.filter(solution=self.solution_id)
+        return Comment.objects.filter(solution__task__lecture__course=self.course_id)
+
+    def matches(self, comment):
+        """Whether ``comment``, annotated with its course_id, belongs to the topic."""
+        if self.solution_id is not None:
+            return comment.solution_id == self.solution_id
+        return comment.course_id == self.course_id
+
+    def authorize(self, user):
+        """Raise unless ``user`` may read the topic, with the rules of CommentViewSet.get_queryset."""
+        self.check(user, self.owner_query().first(), None if user.is_staff else accessible_course_ids(user))
+
+    async def aauthorize(self, user):
+        self.check(user, await self.owner_query().afirst(),
+                   None if user.is_staff else await aaccessible_course_ids(user))
+
+    def owner_query(self):
+        """(submitter or None, course id) of the topic."""
+        if self.solution_id is not None:
+            return Solution.objects.filter(pk=self.solution_id).values_list(
+                'submitted_by_id', 'task__lecture__course_id')
+        return Course.objects.filter(pk=self.course_id).values_list(
+            models.Value(None, output_field=models.IntegerField()), 'pk')
+
+    def check(self, user, owner, course_ids):
+        if owner is None:
+            raise NotFound()
+        submitted_by, course_id = owner
+        if course_ids is not None and submitted_by != user.pk and course_id not in course_ids:
+            raise PermissionDenied("You do not have access to these comments.")
+
+
+def feed_queryset(topic, position=None):
+    queryset = topic.comments().select_related('author').order_by('created_at', 'pk')
+    if position is not None:
+        queryset = queryset.filter(after(position))
+    return queryset
+
+
+def feed_page(topic, position=None, limit=FEED_PAGE_SIZE):
+    """Return the first ``limit`` comments after ``position`` and whether there are more.
+
+    Without a position this is the latest ``limit`` comments, so a client
+    starts from the recent history and polls with the returned cursor.
+    """
+    if position is None:
+        comments = list(topic.comments().select_related('author').order_by('-created_at', '-pk')[:limit])
+        return comments[::-1], False
+    comments = list(feed_queryset(topic, position)[:limit + 1])
+    return comments[:limit], len(comments) > limit
+
+
+def sse_event(comment):
+    data = json.dumps(CommentSerializer(comment).data, cls=JSONEncoder, separators=(',', ':'))
+    return f'id: {format_cursor(comment)}\nevent: comment\ndata: {data}\n\n'.encode()
+
+
+class Subscription:
+    def __init__(self, hub, topic, position):
+        self.hub = hub
+        self.topic = topic
+        # The hub routes only comments after this (created_at, id) position.
+        self.position = position
+        self.queue = asyncio.Queue(STREAM_BACKLOG)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.hub.subscriptions.discard(self)
+        if not self.hub.subscriptions:
+            self.hub.notify()
+
+
+class CommentHub:
+    """Fans new comments out to the comment streams of one event loop.
+
+    However many streams are open, each poll is one query for the comments
+    created since the previous one, across all topics. Every comment is
+    serialized once and routed to the streams of its solution and course. The
+    poll looks COMMIT_LAG back and skips what it has delivered, so comments
+    whose transaction commits late are not lost.
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.watermark = None
+        self.delivered = {}
+
+    def subscribe(self, topic, position=None):
+        """Subscribe to the comments of ``topic`` after ``position``, by default those created from now on."""
+        now = timezone.now()
+        subscription = Subscription(self, topic, position or (now, 0))
+        self.subscriptions.add(subscription)
+        if self.task is None or self.task.done():
+            self.watermark, self.delivered = now, {}
+            self.task = asyncio.ensure_future(self.run())
+        return subscription
+
+    def notify(self):
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if not self.subscriptions:
+                break
+            await self.poll()
+
+    async def poll(self):
+        comments = [
+            comment async for comment in
+            Comment.objects.filter(created_at__gt=self.watermark - COMMIT_LAG)
+            .annotate(course_id=models.F('solution__task__lecture__course_id'))
+            .select_related('author').order_by('created_at', 'pk')
+        ]
+        for comment in comments:
+            if comment.pk in self.delivered:
+                continue
+            self.delivered[comment.pk] = comment.created_at
+            self.watermark = max(self.watermark, comment.created_at)
+            event, key = None, (comment.created_at, comment.pk)
+            for subscription in list(self.subscriptions):
+                if subscription.topic.matches(comment) and key > subscription.position:
+                    event = event or sse_event(comment)
+                    try:
+                        subscription.queue.put_nowait((comment.pk, event))
+                    except asyncio.QueueFull:
+                        subscription.close()
+        horizon = self.watermark - COMMIT_LAG
+        self.delivered = {pk: created_at for pk, created_at in self.delivered.items() if created_at > horizon}
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """The CommentHub of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = CommentHub()
+    return _hubs[loop]
+
+
+def notify_comment_saved():
+    """Wake the hubs of all event loops; called from any thread once a comment is committed."""
+    for loop, hub in list(_hubs.items()):
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(hub.notify)
+
+
+async def stream_comments(topic, position, user=None, keepalive=15):
+    """Yield SSE events: the comments after ``position`` if given, then new ones as they are committed.
+
+    The access of ``user`` to the topic is checked again every ``keepalive``
+    seconds, so the stream ends within that time of the user losing access,
+    e.g. by an enrollment being rejected.
+    """
+    subscription = get_hub().subscribe(topic, position)
+    loop = asyncio.get_running_loop()
+    checked = loop.time()
+    try:
+        # Subscribed first, so nothing committed meanwhile is missed; what
+        # both the history and the hub deliver is sent once.
+        sent = set()
+        while position is not None:
+            page = [comment async for comment in feed_queryset(topic, position)[:FEED_PAGE_SIZE]]
+            for comment in page:
+                sent.add(comment.pk)
+                yield sse_event(comment)
+            position = (page[-1].created_at, page[-1].pk) if len(page) == FEED_PAGE_SIZE else None
+
+        while not (subscription.closed and subscription.queue.empty()):
+            if user is not None and loop.time() - checked >= keepalive:
+                try:
+                    await topic.aauthorize(user)
+                except (NotFound, PermissionDenied):
+                    return
+                checked = loop.time()
+            try:
+                pk, event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if pk not in sent:
+                yield event
+    finally:
+        subscription.close()
@@ -0,0 +1,173 @@
+import csv
+import warnings
+
+import numpy as np
+
+from .models import Enrollment, Task, TaskSubmissionState
+
+ITERATOR_CHUNK_SIZE = 2000
+PERCENTILES = (25, 75, 90)
+
+
+def gradebook_tasks(course):
+    """Return the (id, lecture name, title) of a course's tasks in gradebook column order."""
+    return list(
+        Task.objects.filter(lecture__course=course)
+        .order_by('lecture__created_at', 'lecture_id', 'created_at', 'id')
+        .values_list('id', 'lecture__name', 'title')
+    )
+
+
+def gradebook_rows(course, task_ids):
+    """Yield (student id, email, full name, marks, average grade) per approved enrollment.
+
+    ``marks`` lists the mark of the student's latest solution per task in
+    ``task_ids`` order, None where there is no solution or it is ungraded.
+    Enrollments and submission states are read with two server-side cursors,
+    both ordered by student, and merged, so memory does not grow with the
+    size of the course.
+    """
+    column = {task_id: i for i, task_id in enumerate(task_ids)}
+    enrollments = (
+        Enrollment.objects.filter(course=course, status=Enrollment.Status.APPROVED)
+        .order_by('student_id')
+        .values_list('student_id', 'student__email', 'student__full_name', 'average_grade')
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+    states = (
+        # A deleted solution leaves its state behind with no latest solution.
+        TaskSubmissionState.objects.filter(task__lecture__course=course, latest_solution__isnull=False)
+        .order_by('student_id')
+        .values_list('student_id', 'task_id', 'latest_solution__mark')
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+
+    state = next(states, None)
+    for student_id, email, full_name, average_grade in enrollments:
+        marks = [None] * len(task_ids)
+        while state is not None and state[0] <= student_id:
+            if state[0] == student_id and state[1] in column:
+                marks[column[state[1]]] = state[2]
+            state = next(states, None)
+        yield student_id, email, full_name, marks, average_grade
+
+
+class _Echo:
+    """File-like object whose write() hands the formatted line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _text(value):
+    # Keep spreadsheet applications from evaluating user-provided text as a formula.
+    if value and value[0] in '=+-@\t\r':
+        return "'" + value
+    return value
+
+
+def iter_gradebook_csv(course):
+    """Yield the course gradebook as CSV lines: one row per student, one column per task."""
+    tasks = gradebook_tasks(course)
+    writer = csv.writer(_Echo())
+    yield writer.writerow(
+        ['student_id', 'email', 'full_name'] +
+        [_text(f'{lecture} / {title}') for _, lecture, title in tasks] +
+        ['average_grade']
+    )
+    for student_id, email, full_name, marks, average_grade in gradebook_rows(course, [task[0] for task in tasks]):
+        yield writer.writerow(
+            [student_id, _text(email), _text(full_name)] +
+            ['' if mark is None else mark for mark in marks] +
+            ['' if average_grade is None else round(average_grade, 2)]
+        )
+
+
+def _axis_stats(marks, submitted, axis):
+    """Mark statistics along ``axis`` of the matrix; cells without a mark are NaN and skipped."""
+    with warnings.catch_warnings():
+        # Rows or columns without any mark yield NaN, which is what we report.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        stats = {
+            'mean': np.nanmean(marks, axis=axis),
+            'median': np.nanmedian(marks, axis=axis),
+            'stddev': np.nanstd(marks, axis=axis),
+        }
+        if marks.shape[axis]:
+            percentiles = np.nanpercentile(marks, PERCENTILES, axis=axis)
+        else:
+            percentiles = np.full((len(PERCENTILES), marks.shape[1 - axis]), np.nan)
+        for q, values in zip(PERCENTILES, percentiles):
+            stats[f'p{q}'] = values
+        stats['submission_rate'] = submitted.mean(axis=axis)
+    stats['graded'] = np.count_nonzero(~np.isnan(marks), axis=axis)
+    return stats
+
+
+def _to_json(values):
+    """Round to two decimals and turn NaN into None."""
+    values = np.asarray(values, dtype=float)
+    result = np.round(values, 2).astype(object)
+    result[np.isnan(values)] = None
+    return result.tolist()
+
+
+def _marks_to_json(marks):
+    result = np.nan_to_num(marks).astype(np.int64).astype(object)
+    result[np.isnan(marks)] = None
+    return result.tolist()
+
+
+def _records(labels, stats):
+    columns = {name: _to_json(values) if name != 'graded' else values.tolist() for name, values in stats.items()}
+    return [
+        {**label, **{name: column[i] for name, column in columns.items()}}
+        for i, label in enumerate(labels)
+    ]
+
+
+def gradebook_matrix(course):
+    """Return the course's student x task matrix of latest marks with per-task and per-student statistics.
+
+    All cells come from a single values_list query over submission states
+    which is loaded into NumPy arrays; the statistics are computed on whole
+    axes at once. Two more queries fetch the row and column labels.
+    """
+    tasks = gradebook_tasks(course)
+    students = list(
+        Enrollment.objects.filter(course=course, status=Enrollment.Status.APPROVED)
+        .order_by('student_id')
+        .values_list('student_id', 'student__email', 'student__full_name', 'average_grade')
+    )
+    cells = np.array(
+        TaskSubmissionState.objects.filter(
+            task__lecture__course=course, latest_solution__isnull=False,
+            student__enrollments__course=course, student__enrollments__status=Enrollment.Status.APPROVED,
+        ).values_list('student_id', 'task_id', 'latest_solution__mark'),
+        dtype=float,
+    ).reshape(-1, 3)
+
+    student_ids = np.array([student[0] for student in students], dtype=np.int64)
+    task_ids = np.array([task[0] for task in tasks], dtype=np.int64)
+    task_order = np.argsort(task_ids)
+    rows = np.searchsorted(student_ids, cells[:, 0].astype(np.int64))
+    columns = task_order[np.searchsorted(task_ids, cells[:, 1].astype(np.int64), sorter=task_order)]
+
+    marks = np.full((len(students), len(tasks)), np.nan)
+    submitted = np.zeros(marks.shape, dtype=bool)
+    marks[rows, columns] = cells[:, 2]
+    submitted[rows, columns] = True
+
+    return {
+        'tasks': _records(
+            [{'id': task_id, 'lecture': lecture, 'title': title} for task_id, lecture, title in tasks],
+            _axis_stats(marks, submitted, axis=0),
+        ),
+        'students': _records(
+            [{'id': student_id, 'email': email, 'full_name': full_name,
+              'average_grade': None if average_grade is None else round(average_grade, 2)}
+             for student_id, email, full_name, average_grade in students],
+            _axis_stats(marks, submitted, axis=1),
+        ),
+        'marks': _marks_to_json(marks),
+    }
@@ -0,0 +1,114 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Enrollment, Job
+
+# Attempts before a job is left as failed; between them it waits
+# RETRY_DELAY, doubled on every attempt up to MAX_RETRY_DELAY.
+MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 5)
+RETRY_DELAY = timedelta(seconds=getattr(settings, 'JOB_RETRY_DELAY', 10))
+MAX_RETRY_DELAY = timedelta(hours=1)
+# A job running this long is taken to belong to a dead worker and runs again.
+TIMEOUT = timedelta(seconds=getattr(settings, 'JOB_TIMEOUT', 600))
+BATCH_SIZE = 20
+
+HANDLERS = {}
+
+
+def register(name):
+    """Register the decorated function as the handler of jobs called ``name``; it gets the job args."""
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, args=None, dedupe_key=None, delay=None):
+    """Queue a job in the current transaction, so it runs only if the transaction commits.
+
+    With a ``dedupe_key``, a job with that key which is still waiting absorbs
+    this one: bursts of the same work coalesce into a single run. A job with
+    the key that is already running does not, since it may have read the data
+    before the change that queued this one.
+    """
+    job = Job(name=name, args=args or {}, dedupe_key=dedupe_key, run_at=timezone.now() + (delay or timedelta()))
+    if dedupe_key is None:
+        job.save()
+    else:
+        Job.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def claim(limit=BATCH_SIZE):
+    """Mark up to ``limit`` due jobs as running and return them.
+
+    SKIP LOCKED lets workers claim concurrently without waiting on or taking
+    each other's jobs. SQLite locks the whole database instead.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                Q(status=Job.Status.QUEUED, run_at__lte=now) |
+                Q(status=Job.Status.RUNNING, started_at__lt=now - TIMEOUT)
+            ).order_by('run_at', 'id')[:limit]
+        )
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=Job.Status.RUNNING, started_at=now, attempts=F('attempts') + 1)
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def run(job):
+    """Run a claimed job in its own transaction; return whether it succeeded."""
+    try:
+        with transaction.atomic():
+            HANDLERS[job.name](**job.args)
+            Job.objects.filter(pk=job.pk).delete()
+        return True
+    except Exception:
+        error = traceback.format_exc()
+    if job.attempts >= MAX_ATTEMPTS:
+        Job.objects.filter(pk=job.pk).update(status=Job.Status.FAILED, last_error=error)
+        return False
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(status=Job.Status.QUEUED, last_error=error,
+                                                 run_at=timezone.now() + retry_delay(job.attempts))
+    except IntegrityError:
+        # The same work was queued again meanwhile; that job runs it.
+        Job.objects.filter(pk=job.pk).delete()
+    return False
+
+
+def work(limit=BATCH_SIZE):
+    """Claim and run one batch of due jobs; return how many were claimed."""
+    jobs = claim(limit)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+def recompute_grades_later(enrollments=None, course=None):
+    """Queue a grade recompute of enrollment ids, or of all enrollments of a course."""
+    if course is not None:
+        enqueue('recompute_grades', {'course': course}, dedupe_key=f'grades:course:{course}')
+    for pk in enrollments or ():
+        enqueue('recompute_grades', {'enrollment': pk}, dedupe_key=f'grades:enrollment:{pk}')
+
+
+@register('recompute_grades')
+def recompute_grades(enrollment=None, course=None):
+    if course is not None:
+        Enrollment.objects.filter(course=course).recompute_grades()
+    else:
+        Enrollment.objects.filter(pk=enrollment).recompute_grades()
@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.db import transaction
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples_ms):
+    return {
+        'p50_ms': round(statistics.median(samples_ms), 3),
+        'p95_ms': round(percentile(samples_ms, 95), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+        'mean_ms': round(statistics.fmean(samples_ms), 3),
+    }
+
+
+def time_calls(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+class maybe_rollback:
+    """Run the block in a transaction that is rolled back when ``enabled``.
+
+    Benchmarks seed throwaway data this way and leave the database untouched.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+
+    def __enter__(self):
+        if self.enabled:
+            self.atomic = transaction.atomic()
+            self.atomic.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        if exc_type is None:
+            transaction.set_rollback(True)
+        return self.atomic.__exit__(exc_type, exc, tb)
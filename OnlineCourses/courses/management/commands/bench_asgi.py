@@ -0,0 +1,163 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from accounts.models import User
+from accounts.tokens import UserAccessToken
+from courses.seeding import seed_dataset
+from ._bench import summarize
+
+# (name, path served by the WSGI deployment, path served by the async views)
+ENDPOINTS = [
+    ('profile', '/api/accounts/profile/', '/api/accounts/async/profile/'),
+    ('courses', '/api/courses/courses/', '/api/courses/async/courses/'),
+    ('lectures', '/api/courses/lectures/?page_size=2', '/api/courses/async/lectures/?page_size=2'),
+]
+SEED_PREFIX = 'loadtest'
+
+
+class Command(BaseCommand):
+    help = ("Compare throughput and latency of the WSGI deployment (sync viewsets on a fixed thread pool) with "
+            "the sync viewsets and the async views under ASGI at rising client concurrency. The requests are sent "
+            "in-process; --io-wait adds a delay to every query to stand in for a remote database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help=f"Seed a small dataset ({SEED_PREFIX}-* users) and delete it afterwards. The data "
+                                 f"is committed, since the requests run on other connections.")
+        parser.add_argument('--email', help="User to send the requests as (default: a student).")
+        parser.add_argument('--concurrency', default='1,8,32,64',
+                            help="Comma-separated numbers of concurrent clients.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and concurrency.")
+        parser.add_argument('--wsgi-threads', type=int, default=8,
+                            help="Worker threads of the WSGI deployment, e.g. gunicorn --threads.")
+        parser.add_argument('--io-wait', type=float, default=20, help="Milliseconds added to every query.")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            seed_dataset(teachers=2, students=100, courses=5, lectures=5, tasks=2, enrollments=30,
+                         prefix=SEED_PREFIX)
+        try:
+            # Every request should reach the database, not the response cache.
+            with override_settings(RESPONSE_CACHE_TIMEOUT=0):
+                self.run(options)
+        finally:
+            if options['seed']:
+                User.objects.filter(email__startswith=f'{SEED_PREFIX}-').delete()
+
+    def run(self, options):
+        user = self.get_user(options['email'])
+        headers = {'Authorization': f'Bearer {UserAccessToken.for_user(user)}', 'Host': 'localhost'}
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        self.add_io_wait(options['io_wait'] / 1000)
+        # Connections are per thread; the requests open their own.
+        connections.close_all()
+
+        wsgi, asgi = get_wsgi_application(), get_asgi_application()
+        for name, wsgi_path, asgi_path in ENDPOINTS:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {name} =="))
+            for concurrency in levels:
+                for label, path, run in (
+                    (f"wsgi ({options['wsgi_threads']} threads)", wsgi_path,
+                     lambda path: self.run_wsgi(wsgi, path, headers, concurrency, options)),
+                    ('asgi sync viewsets', wsgi_path,
+                     lambda path: asyncio.run(self.run_asgi(asgi, path, headers, concurrency, options))),
+                    ('asgi async views', asgi_path,
+                     lambda path: asyncio.run(self.run_asgi(asgi, path, headers, concurrency, options))),
+                ):
+                    samples, statuses, elapsed = run(path)
+                    if statuses != {200}:
+                        raise CommandError(f"{path} answered {sorted(statuses)}.")
+                    self.stdout.write(
+                        f"c={concurrency:<3} {label:<20} {len(samples) / elapsed:8.1f} req/s  {summarize(samples)}")
+
+    def get_user(self, email):
+        if email:
+            return User.objects.get(email=email)
+        user = User.objects.filter(role=User.RoleTypes.STUDENT, enrollments__isnull=False).first()
+        if user is None:
+            raise CommandError("No enrolled students; run with --seed or pass --email.")
+        return user
+
+    def add_io_wait(self, seconds):
+        if not seconds:
+            return
+
+        def wait(execute, sql, params, many, context):
+            time.sleep(seconds)
+            return execute(sql, params, many, context)
+
+        def install(sender, connection, **kwargs):
+            # The wrapper object of a thread outlives its connections; wait only once per query.
+            if wait not in connection.execute_wrappers:
+                connection.execute_wrappers.append(wait)
+
+        connection_created.connect(install, weak=False)
+
+    def run_wsgi(self, application, path, headers, concurrency, options):
+        """Send the requests from ``concurrency`` client threads to a server pool of --wsgi-threads threads."""
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(),
+            **{'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()},
+        }
+        statuses = set()
+
+        def serve():
+            response = application(dict(environ), lambda status, response_headers: statuses.add(int(status[:3])))
+            b''.join(response)
+            response.close()
+
+        def client(server):
+            start = time.perf_counter()
+            server.submit(serve).result()
+            return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(options['wsgi_threads']) as server, ThreadPoolExecutor(concurrency) as clients:
+            start = time.perf_counter()
+            samples = list(clients.map(lambda _: client(server), range(options['requests'])))
+            elapsed = time.perf_counter() - start
+        return samples, statuses, elapsed
+
+    async def run_asgi(self, application, path, headers, concurrency, options):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }
+        statuses = set()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.add(message['status'])
+
+        async def client():
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # The client never disconnects; Django stops listening once it has responded.
+                await asyncio.Event().wait()
+
+            async with slots:
+                start = time.perf_counter()
+                await application(dict(scope), receive, send)
+                return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        samples = await asyncio.gather(*(client() for _ in range(options['requests'])))
+        return samples, statuses, time.perf_counter() - start
@@ -0,0 +1,148 @@
+import json
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from accounts import urls as accounts_urls
+from accounts.models import User
+from accounts.tokens import UserAccessToken
+from courses import urls as courses_urls
+from courses.models import Comment, Course, Enrollment, Lecture, Solution, Task
+from ._bench import summarize
+
+ROLES = ('student', 'teacher', 'staff')
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every GET endpoint of the courses router (list and detail) and of accounts/urls.py as a "
+            "student, a teacher and a staff user. Reports p50/p95/p99 latency, queries per request and response "
+            "bytes, and saves them as JSON so runs can be compared. Run seed_bench first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help="Prefix of the seed_bench users (default bench).")
+        parser.add_argument('--requests', type=int, default=30, help="Timed requests per endpoint and role.")
+        parser.add_argument('--warmup', type=int, default=5, help="Untimed requests before timing.")
+        parser.add_argument('--roles', default=','.join(ROLES), help="Comma-separated roles to run as.")
+        parser.add_argument('--filter', help="Only endpoints whose name contains this.")
+        parser.add_argument('--with-cache', action='store_true',
+                            help="Leave the response cache on; by default every request reaches the views.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="JSON file of an earlier run to compare p50 and queries with.")
+
+    def handle(self, *args, **options):
+        users = self.get_users(options['prefix'], options['roles'].split(','))
+        settings = {'ALLOWED_HOSTS': ['testserver']}
+        if not options['with_cache']:
+            settings['RESPONSE_CACHE_TIMEOUT'] = 0
+
+        results = []
+        with override_settings(**settings):
+            for role, user in users.items():
+                client = Client(headers={'Authorization': f'Bearer {UserAccessToken.for_user(user)}'})
+                for name, path in self.get_endpoints(client):
+                    if options['filter'] and options['filter'] not in name:
+                        continue
+                    results.append({'endpoint': name, 'role': role, 'path': path,
+                                    **self.measure(client, path, options)})
+                    self.report(results[-1])
+
+        run = {
+            'started_at': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'dataset': {model._meta.model_name: model.objects.count()
+                        for model in (User, Course, Lecture, Task, Enrollment, Solution, Comment)},
+            'requests': options['requests'],
+            'response_cache': options['with_cache'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(run, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved {len(results)} results to {options['output']}."))
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.compare(json.load(file), run)
+
+    def get_users(self, prefix, roles):
+        users = User.objects.filter(email__startswith=f'{prefix}-')
+        candidates = {
+            'student': users.filter(role=User.RoleTypes.STUDENT, enrollments__isnull=False),
+            'teacher': users.filter(role=User.RoleTypes.TEACHER, is_staff=False, course__isnull=False),
+            'staff': users.filter(is_staff=True),
+        }
+        found = {}
+        for role in roles:
+            if role not in candidates:
+                raise CommandError(f"Unknown role {role!r}; choose from {', '.join(ROLES)}.")
+            found[role] = candidates[role].order_by('pk').first()
+            if found[role] is None:
+                raise CommandError(f"No {role} with the prefix {prefix!r}; run seed_bench first.")
+        return found
+
+    def get_endpoints(self, client):
+        """(name, path) of the GET endpoints; detail paths use the first object the user's list returns."""
+        for prefix, viewset, basename in courses_urls.router.registry:
+            path = f'/api/courses/{prefix}/'
+            yield f'{basename}-list', path
+            response = client.get(path, {'page_size': 1})
+            results = response.json() if response.status_code == 200 else []
+            if isinstance(results, dict):
+                results = results.get('results', [])
+            if results:
+                yield f'{basename}-detail', f"{path}{results[0]['id']}/"
+        for pattern in accounts_urls.urlpatterns:
+            view_class = getattr(pattern.callback, 'view_class', None) or getattr(pattern.callback, 'cls', None)
+            if view_class is not None and hasattr(view_class, 'get'):
+                yield pattern.name, f'/api/accounts/{pattern.pattern}'
+
+    def measure(self, client, path, options):
+        for _ in range(options['warmup']):
+            client.get(path)
+        # Queries are counted on a separate request, so the timed ones do not pay for counting.
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            response = client.get(path)
+        size = len(b''.join(response.streaming_content) if response.streaming else response.content)
+
+        samples = []
+        for _ in range(options['requests']):
+            start = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            samples.append((time.perf_counter() - start) * 1000)
+        return {'status': response.status_code, **summarize(samples), 'queries': len(queries), 'bytes': size}
+
+    def report(self, result):
+        self.stdout.write(
+            f"{result['endpoint']:<22} {result['role']:<8} {result['status']}  p50 {result['p50_ms']:8.2f} ms  "
+            f"p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f}  {result['queries']:3d} queries  "
+            f"{result['bytes']:8d} bytes"
+        )
+
+    def compare(self, before, after):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"== against {before.get('commit') or 'previous run'} =="))
+        previous = {(result['endpoint'], result['role']): result for result in before['results']}
+        for result in after['results']:
+            old = previous.get((result['endpoint'], result['role']))
+            if old is None:
+                continue
+            change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+            self.stdout.write(
+                f"{result['endpoint']:<22} {result['role']:<8} p50 {old['p50_ms']:8.2f} -> {result['p50_ms']:8.2f} ms "
+                f"({change:+.0f}%)  queries {old['queries']} -> {result['queries']}"
+            )
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
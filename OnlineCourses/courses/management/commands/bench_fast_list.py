@@ -0,0 +1,63 @@
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import User
+from courses.seeding import seed_dataset
+from courses.views import CourseViewSet, EnrollmentViewSet
+from ._bench import maybe_rollback, summarize, time_calls
+
+VIEWSETS = {'courses': CourseViewSet, 'enrollments': EnrollmentViewSet}
+
+
+class Command(BaseCommand):
+    help = ("Check that fast list responses are byte-identical to the serializer path on every page "
+            "and compare their throughput.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help="Seed a throwaway dataset inside a transaction that is rolled back.")
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--page-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        # Measure the views, not the response cache.
+        with maybe_rollback(options['seed']), override_settings(RESPONSE_CACHE_TIMEOUT=0):
+            if options['seed']:
+                seed_dataset(teachers=20, students=2000, courses=10, lectures=1, tasks=1, enrollments=100)
+            user = User.objects.filter(is_staff=True).first() or User.objects.first()
+            if user is None:
+                raise CommandError("No users; run with --seed.")
+
+            def get(view, url):
+                request = factory.get(url)
+                force_authenticate(request, user)
+                return view(request).render()
+
+            for name, viewset in VIEWSETS.items():
+                regular = viewset.as_view({'get': 'list'}, fast_list=False)
+                fast = viewset.as_view({'get': 'list'}, fast_list=True)
+                first_page = f'/?page_size={options["page_size"]}'
+
+                url, pages, rows = first_page, 0, 0
+                while url:
+                    expected, actual = get(regular, url), get(fast, url)
+                    if expected.content != actual.content:
+                        raise CommandError(f"{name}: page {pages + 1} differs from the serializer output ({url}).")
+                    pages += 1
+                    rows += len(expected.data['results'])
+                    url = expected.data['next']
+
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f"== {name}: {rows} rows on {pages} pages byte-identical =="))
+                page_rows = len(get(regular, first_page).data['results'])
+                means = {}
+                for label, view in (('serializer', regular), ('fast', fast)):
+                    samples = time_calls(lambda: get(view, first_page), options['repeat'])
+                    means[label] = statistics.fmean(samples)
+                    rate = page_rows / means[label] * 1000 if means[label] else 0
+                    self.stdout.write(f"{label}: {summarize(samples)}, {rate:.0f} rows/s")
+                self.stdout.write(f"speedup: {means['serializer'] / means['fast']:.2f}x")
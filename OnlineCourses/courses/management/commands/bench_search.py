@@ -0,0 +1,70 @@
+from functools import reduce
+from operator import and_, or_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+
+from accounts.models import User
+from courses.access import accessible_course_ids
+from courses.models import Course, Enrollment, Lecture
+from courses.search import SEARCH_FIELDS, search
+from courses.seeding import corpus_vocabulary, seed_corpus
+from ._bench import maybe_rollback, summarize, time_calls
+
+
+def like_search(queryset, query):
+    """Substring search as a client would have to do it without the index, newest first."""
+    fields = SEARCH_FIELDS[queryset.model]
+    return queryset.filter(reduce(and_, (
+        reduce(or_, (models.Q(**{f'{field}__icontains': word}) for field in fields)) for word in query.split()
+    ))).order_by('-created_at', '-id')
+
+
+class Command(BaseCommand):
+    help = ("Compare lecture search through the full-text index (courses.search) with substring matching, "
+            "as a student who can read a tenth of the courses.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help="Seed a throwaway corpus inside a transaction that is rolled back.")
+        parser.add_argument('--lectures', type=int, default=100000, help="Lectures in the seeded corpus.")
+        parser.add_argument('--courses', type=int, default=100, help="Courses the seeded lectures are spread over.")
+        parser.add_argument('--student', help="Email of the student to search as (default: the seeded one).")
+        parser.add_argument('--query', action='append',
+                            help="Query to time; repeatable (default: a common, a medium, a rare and a two-word "
+                                 "query from the seeded vocabulary).")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=20, help="Results fetched per query.")
+
+    def handle(self, *args, **options):
+        with maybe_rollback(options['seed']):
+            if options['seed']:
+                counts = seed_corpus(lectures=options['lectures'], courses=options['courses'], tasks=0)
+                self.stdout.write(f"seeded {counts}")
+                user = self.seed_student(options['courses'])
+            elif options['student']:
+                user = User.objects.get(email=options['student'])
+            else:
+                raise CommandError("Pass --student or run with --seed.")
+            words = corpus_vocabulary()
+            queries = options['query'] or [words[0], words[100], words[3000], f'{words[10]} {words[200]}']
+
+            lectures = Lecture.objects.filter(course__in=accessible_course_ids(user))
+            limit = options['limit']
+            for query in queries:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"== {query!r} =="))
+                indexed, like = search(lectures, query), like_search(lectures, query)
+                self.stdout.write(f"matches: {indexed.count()} indexed, {like.count()} substring")
+                for label, queryset in (('full-text index', indexed), ('icontains', like)):
+                    stats = summarize(time_calls(lambda: list(queryset[:limit]), options['repeat']))
+                    self.stdout.write(f"{label}: {stats}")
+                self.stdout.write(indexed[:limit].explain())
+
+    def seed_student(self, courses):
+        student = User.objects.create(email='bench-search-student@example.com', full_name='Search Student',
+                                      role=User.RoleTypes.STUDENT)
+        Enrollment.objects.bulk_create([
+            Enrollment(student=student, course=course, status=Enrollment.Status.APPROVED)
+            for course in Course.objects.filter(name__startswith='Corpus course ').order_by('pk')[:max(1, courses // 10)]
+        ])
+        return student
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from accounts.models import User
+from courses.access import accessible_course_ids
+from courses.models import Lecture, Task, Comment, Enrollment
+from courses.seeding import seed_dataset
+from ._bench import maybe_rollback, summarize, time_calls
+
+
+def join_distinct_querysets(user):
+    """The student visibility filters as they were before the access-set layer."""
+    return {
+        'lectures': Lecture.objects.filter(
+            course__enrollments__student=user,
+            course__enrollments__status='approved'
+        ).distinct(),
+        'tasks': Task.objects.filter(
+            lecture__course__enrollments__student=user,
+            lecture__course__enrollments__status='approved'
+        ).distinct(),
+        'comments': Comment.objects.filter(
+            models.Q(solution__submitted_by=user) |
+            models.Q(solution__task__lecture__course__enrollments__student=user,
+                     solution__task__lecture__course__enrollments__status='approved')
+        ).distinct(),
+    }
+
+
+def access_set_querysets(user):
+    course_ids = accessible_course_ids(user)
+    return {
+        'lectures': Lecture.objects.filter(course__in=course_ids),
+        'tasks': Task.objects.filter(lecture__course__in=course_ids),
+        'comments': Comment.objects.filter(
+            models.Q(solution__submitted_by=user) |
+            models.Q(solution__task__lecture__course__in=course_ids)
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare query plans and latency of the student visibility filters with and without access sets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help="Seed a throwaway dataset inside a transaction that is rolled back.")
+        parser.add_argument('--student', help="Email of the student to benchmark (default: most enrollments).")
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with maybe_rollback(options['seed']):
+            if options['seed']:
+                seed_dataset(teachers=10, students=2000, courses=5, lectures=20, enrollments=400)
+            user = self.get_student(options['student'])
+            page = options['page_size']
+            before, after = join_distinct_querysets(user), access_set_querysets(user)
+            for name in before:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"== {name} =="))
+                for label, queryset in (('join + DISTINCT', before[name]), ('course_id IN', after[name])):
+                    queryset = queryset.order_by('-created_at', '-id')
+                    stats = summarize(time_calls(lambda: list(queryset[:page]), options['repeat']))
+                    self.stdout.write(f"{label}: {stats}")
+                    self.stdout.write(queryset[:page].explain())
+
+    def get_student(self, email):
+        if email:
+            return User.objects.get(email=email)
+        top = Enrollment.objects.filter(status=Enrollment.Status.APPROVED).values('student').annotate(
+            n=models.Count('id')).order_by('-n').first()
+        if top is None:
+            raise SystemExit("No approved enrollments; run with --seed.")
+        return User.objects.get(pk=top['student'])
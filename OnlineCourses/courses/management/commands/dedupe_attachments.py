@@ -0,0 +1,33 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses import blobs
+from courses.models import Attachment, Course
+
+
+class Command(BaseCommand):
+    help = "Move attachments stored before deduplication into shared content-addressed blobs."
+
+    def handle(self, *args, **options):
+        moved = missing = freed = 0
+        for attachment in Attachment.objects.filter(blob__isnull=True).iterator(chunk_size=500):
+            old_name = attachment.file.name
+            if not default_storage.exists(old_name):
+                missing += 1
+                continue
+            with transaction.atomic():
+                with default_storage.open(old_name, 'rb') as file:
+                    blob = blobs.store_file(file)
+                Attachment.objects.filter(pk=attachment.pk).update(
+                    file=blob.file.name, blob=blob, name=attachment.name or os.path.basename(old_name))
+                Course.objects.with_attachments([attachment.pk]).bump_content_version()
+            if not Attachment.objects.filter(file=old_name).exists():
+                freed += default_storage.size(old_name)
+                default_storage.delete(old_name)
+            moved += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} attachments into blobs and deleted {freed} bytes of legacy copies; "
+            f"{missing} files were missing."))
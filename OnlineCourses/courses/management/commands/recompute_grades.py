@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Enrollment
+
+
+class Command(BaseCommand):
+    help = "Rebuild enrollment mark totals and average grades from graded solutions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help="Only repair enrollments of this course id (repeatable).")
+
+    def handle(self, *args, **options):
+        enrollments = Enrollment.objects.all()
+        if options['courses']:
+            enrollments = enrollments.filter(course__in=options['courses'])
+        updated = enrollments.recompute_grades()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed grades for {updated} enrollments."))
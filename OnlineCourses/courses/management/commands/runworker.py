@@ -0,0 +1,75 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from courses import jobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (grade recomputes, blob file deletion) until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Number of worker processes (default 1).")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to wait when no job is due (default 1).")
+        parser.add_argument('--once', action='store_true',
+                            help="Run the jobs that are due and exit, e.g. from cron.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            done = 0
+            while claimed := jobs.work():
+                done += claimed
+            self.stdout.write(self.style.SUCCESS(f"Ran {done} jobs."))
+            return
+
+        if options['processes'] <= 1:
+            work_forever(options['interval'])
+            return
+
+        # Forked children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=work_forever, args=(options['interval'],))
+                   for _ in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Started {len(workers)} workers.")
+
+        def stop(signum, frame):
+            for worker in workers:
+                worker.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for worker in workers:
+            worker.join()
+
+
+def work_forever(interval):
+    """Run jobs until SIGTERM or SIGINT, finishing the current batch first."""
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while not stopping:
+        try:
+            claimed = jobs.work()
+        except DatabaseError:
+            # A dropped connection, or a locked database on SQLite: retry with a new connection.
+            logger.warning("Claiming jobs failed.", exc_info=True)
+            connections.close_all()
+            claimed = 0
+        if not claimed:
+            time.sleep(interval)
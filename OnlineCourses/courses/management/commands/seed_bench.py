@@ -0,0 +1,60 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import User
+from courses.seeding import seed_dataset
+
+# Dataset sizes for --scale; any option given explicitly overrides them. With
+# the default solution rate and one comment per solution, there are about
+#   small:  10 courses, 300 tasks, 500 enrollments, 10k solutions and comments;
+#   medium: 200 courses, 16k tasks, 40k enrollments, 2.2M solutions and comments;
+#   large:  1000 courses, 60k tasks, 200k enrollments, 8.4M solutions and comments.
+SCALES = {
+    'small': dict(teachers=5, students=500, courses=2, lectures=10, tasks=3, enrollments=50),
+    'medium': dict(teachers=50, students=10000, courses=4, lectures=20, tasks=4, enrollments=200),
+    'large': dict(teachers=200, students=100000, courses=5, lectures=20, tasks=3, enrollments=200),
+}
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic dataset for benchmarks: teachers, courses, lectures, tasks, enrollments, marked "
+            "solutions, comments and attachments. Courses are per teacher, lectures per course, tasks per lecture "
+            "and enrollments per course. Rows are bulk inserted, through COPY on Postgres. All users are "
+            "<prefix>-*@example.com with the prefix as password, plus a staff user <prefix>-staff@example.com.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        for name in ('teachers', 'students', 'courses', 'lectures', 'tasks', 'enrollments'):
+            parser.add_argument(f'--{name}', type=int, help="Overrides --scale.")
+        parser.add_argument('--solution-rate', type=float, default=0.7,
+                            help="Chance that an enrolled student solved a task (default 0.7).")
+        parser.add_argument('--comments', type=int, default=1, help="Comments per solution (default 1).")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible datasets.")
+        parser.add_argument('--prefix', default='bench', help="Prefix of the generated users (default bench).")
+        parser.add_argument('--replace', action='store_true',
+                            help="Delete the users with this prefix and everything they own first.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        sizes = {name: options[name] if options[name] is not None else default
+                 for name, default in SCALES[options['scale']].items()}
+        existing = User.objects.filter(email__startswith=f'{prefix}-')
+        if existing.exists() and not options['replace']:
+            raise CommandError(f"Users with the prefix {prefix!r} exist; pass --replace or another --prefix.")
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options['replace']:
+                existing.delete()
+            counts = seed_dataset(**sizes, solution_rate=options['solution_rate'], comments=options['comments'],
+                                  seed=options['seed'], prefix=prefix)
+            User.objects.create(email=f'{prefix}-staff@example.com', full_name='Staff', role=User.RoleTypes.TEACHER,
+                                is_staff=True, password=make_password(prefix))
+        elapsed = time.perf_counter() - started
+
+        rows = sum(counts.values())
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in counts.items()))
+        self.stdout.write(self.style.SUCCESS(f"Seeded {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)."))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:55
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_mark_totals(apps, schema_editor):
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    Solution = apps.get_model('courses', 'Solution')
+    graded = Solution.objects.filter(
+        submitted_by=OuterRef('student'),
+        task__lecture__course=OuterRef('course'),
+        mark__isnull=False
+    ).order_by().values('submitted_by')
+    Enrollment.objects.update(
+        mark_sum=Coalesce(Subquery(graded.annotate(total=Sum('mark')).values('total')), 0),
+        mark_count=Coalesce(Subquery(graded.annotate(count=Count('id')).values('count')), 0),
+        average_grade=Subquery(graded.annotate(avg=Avg('mark')).values('avg')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='mark_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='mark_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_mark_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_enrollment_mark_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['solution', 'created_at'], name='comment_solution_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['student', 'status'], name='enrollment_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solution',
+            index=models.Index(fields=['task', 'submitted_by', 'submitted_at'], name='solution_task_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solution',
+            index=models.Index(condition=models.Q(('mark__isnull', True)), fields=['task'], name='solution_ungraded_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_submission_states(apps, schema_editor):
+    Solution = apps.get_model('courses', 'Solution')
+    TaskSubmissionState = apps.get_model('courses', 'TaskSubmissionState')
+    latest = {}
+    solutions = Solution.objects.order_by('submitted_at', 'id').values_list('task_id', 'submitted_by_id', 'id', 'mark')
+    for task_id, student_id, solution_id, mark in solutions.iterator(chunk_size=2000):
+        latest[task_id, student_id] = (solution_id, mark)
+    TaskSubmissionState.objects.bulk_create([
+        TaskSubmissionState(task_id=task_id, student_id=student_id, latest_solution_id=solution_id,
+                            graded=mark is not None)
+        for (task_id, student_id), (solution_id, mark) in latest.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_hot_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskSubmissionState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graded', models.BooleanField(default=False)),
+                ('latest_solution', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.solution')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_states', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_states', to='courses.task')),
+            ],
+            options={
+                'unique_together': {('task', 'student')},
+            },
+        ),
+        migrations.RunPython(fill_submission_states, migrations.RunPython.noop),
+    ]
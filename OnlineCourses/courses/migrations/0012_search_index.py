@@ -0,0 +1,80 @@
+from django.db import migrations
+
+# Lecture and task search, see courses/search.py. Postgres keeps a weighted
+# tsvector in a stored generated column behind a GIN index; SQLite keeps an
+# external-content FTS5 table in sync with triggers. SQLite drops the triggers
+# when a later migration rebuilds courses_lecture or courses_task, so such a
+# migration has to run SQLITE_TRIGGERS again.
+TABLES = {
+    'courses_lecture': ('name', 'text'),
+    'courses_task': ('title', 'description'),
+}
+
+POSTGRES_SQL = [
+    """ALTER TABLE "{table}" ADD COLUMN "search_vector" tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce("{title}", '')), 'A') ||
+        setweight(to_tsvector('english', coalesce("{body}", '')), 'B')
+    ) STORED""",
+    'CREATE INDEX "{table}_search_idx" ON "{table}" USING gin ("search_vector")',
+]
+POSTGRES_REVERSE_SQL = ['ALTER TABLE "{table}" DROP COLUMN "search_vector"']
+
+SQLITE_SQL = [
+    """CREATE VIRTUAL TABLE "{table}_fts" USING fts5(
+        "{title}", "{body}", content='{table}', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """INSERT INTO "{table}_fts" ("{table}_fts") VALUES ('rebuild')""",
+]
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS "{table}_fts_insert" AFTER INSERT ON "{table}" BEGIN
+        INSERT INTO "{table}_fts" (rowid, "{title}", "{body}") VALUES (new.id, new."{title}", new."{body}");
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "{table}_fts_delete" AFTER DELETE ON "{table}" BEGIN
+        INSERT INTO "{table}_fts" ("{table}_fts", rowid, "{title}", "{body}")
+        VALUES ('delete', old.id, old."{title}", old."{body}");
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "{table}_fts_update" AFTER UPDATE OF "{title}", "{body}" ON "{table}" BEGIN
+        INSERT INTO "{table}_fts" ("{table}_fts", rowid, "{title}", "{body}")
+        VALUES ('delete', old.id, old."{title}", old."{body}");
+        INSERT INTO "{table}_fts" (rowid, "{title}", "{body}") VALUES (new.id, new."{title}", new."{body}");
+    END""",
+]
+SQLITE_REVERSE_SQL = [
+    'DROP TRIGGER IF EXISTS "{table}_fts_insert"',
+    'DROP TRIGGER IF EXISTS "{table}_fts_delete"',
+    'DROP TRIGGER IF EXISTS "{table}_fts_update"',
+    'DROP TABLE "{table}_fts"',
+]
+
+
+def run(schema_editor, statements):
+    for table, (title, body) in TABLES.items():
+        for statement in statements:
+            schema_editor.execute(statement.format(table=table, title=title, body=body))
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run(schema_editor, POSTGRES_SQL)
+    elif vendor == 'sqlite':
+        run(schema_editor, SQLITE_SQL + SQLITE_TRIGGERS)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run(schema_editor, POSTGRES_REVERSE_SQL)
+    elif vendor == 'sqlite':
+        run(schema_editor, SQLITE_REVERSE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_content_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
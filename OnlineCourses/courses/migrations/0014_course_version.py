@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 08:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_versions(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    CourseVersion = apps.get_model('courses', 'CourseVersion')
+    CourseVersion.objects.bulk_create([
+        CourseVersion(course_id=pk, version=version, updated_at=updated_at)
+        for pk, version, updated_at in Course.objects.values_list('pk', 'content_version', 'content_updated_at')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseVersion',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='courses.course')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(copy_versions, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='course',
+            name='content_updated_at',
+        ),
+        migrations.RemoveField(
+            model_name='course',
+            name='content_version',
+        ),
+    ]
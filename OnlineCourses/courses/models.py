@@ -1,44 +1,144 @@
+import os
+import uuid
+
 from django.core.files.uploadedfile import UploadedFile
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
-from django.db.models import Avg
+from django.db import models, transaction
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Cast, Coalesce, Now
+from django.dispatch import Signal
+from django.utils import timezone
 
 from accounts.models import User
-from core.models.mixins import CreatedAtMixin, SubmittedAtMixin, RequestedAtMixin, UploadedAtMixin
+from core.models.mixins import CreatedAtMixin, UpdatedAtMixin, SubmittedAtMixin, RequestedAtMixin, UploadedAtMixin
+
+
+# Sent with the ids of the courses whose content tree changed.
+content_changed = Signal()
+
 
+class CourseQuerySet(models.QuerySet):
+    def bump_content_version(self):
+        """Mark the content tree of the courses (lectures, tasks, solutions, ...) as changed.
 
-class Course(CreatedAtMixin):
+        Returns the ids of the affected courses and sends ``content_changed``.
+        The versions are raised once the transaction commits, so writers do
+        not hold a lock on them until then; the update is registered before
+        the signal so it runs ahead of the response cache invalidation.
+        """
+        course_ids = list(self.values_list('pk', flat=True))
+        if course_ids:
+            transaction.on_commit(lambda: CourseVersion.objects.filter(course__in=course_ids).update(
+                version=F('version') + 1, updated_at=Now()))
+            content_changed.send(sender=Course, course_ids=course_ids)
+        return course_ids
+
+    def with_attachments(self, attachment_ids):
+        """Courses whose lectures or solutions use any of the attachments."""
+        return self.filter(
+            Q(pk__in=Lecture.attachments.through.objects.filter(
+                attachment__in=attachment_ids).values('lecture__course')) |
+            Q(pk__in=Solution.attachments.through.objects.filter(
+                attachment__in=attachment_ids).values('solution__task__lecture__course'))
+        )
+
+
+class Course(CreatedAtMixin, UpdatedAtMixin):
     name = models.CharField(max_length=255)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    objects = CourseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['created_at', 'id'], name='course_created_id_idx')]
+
     def __str__(self):
         return self.name
 
 
-class Lecture(CreatedAtMixin):
+class CourseVersion(models.Model):
+    """Content version of a course, bumped on every change below it (see signals.py) and used as HTTP validators.
+
+    Kept out of the Course row, which submissions and comments would
+    otherwise all update, and so queue behind each other on.
+    """
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.course_id}@{self.version}'
+
+
+class Lecture(CreatedAtMixin, UpdatedAtMixin):
     name = models.CharField(max_length=255)
     text = models.TextField(blank=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='lectures')
     attachments = models.ManyToManyField('Attachment', blank=True, related_name='lectures')
 
+    class Meta:
+        indexes = [models.Index(fields=['created_at', 'id'], name='lecture_created_id_idx')]
+
     def __str__(self):
         return self.name
 
 
+class Blob(CreatedAtMixin):
+    """A unique file content, stored once under its sha256 and shared by attachments."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField()
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.sha256
+
+
 class Attachment(UploadedAtMixin):
     file = models.FileField(upload_to='attachments/')
+    name = models.CharField(max_length=255, blank=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='attachments')
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [models.Index(fields=['uploaded_at', 'id'], name='attachment_uploaded_id_idx')]
+
     def __str__(self):
-        return self.file.name
+        return self.filename
+
+    @property
+    def filename(self):
+        """The uploaded file's name; blob-backed files are stored under their digest."""
+        return self.name or os.path.basename(self.file.name)
+
+
+class AttachmentUpload(CreatedAtMixin):
+    """A resumable chunked upload that becomes an Attachment once finalized."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attachment_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    attachment = models.OneToOneField(Attachment, null=True, blank=True, on_delete=models.SET_NULL,
+                                      related_name='+')
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def partial_name(self):
+        return f'uploads/partial/{self.pk}'
 
 
-class Task(CreatedAtMixin):
+class Task(CreatedAtMixin, UpdatedAtMixin):
     title = models.CharField(max_length=255)
     description = models.TextField()
     deadline = models.DateTimeField()
     lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE, related_name='tasks')
 
+    class Meta:
+        indexes = [models.Index(fields=['created_at', 'id'], name='task_created_id_idx')]
+
     def __str__(self):
         return self.title
 
@@ -50,19 +150,87 @@ class Solution(SubmittedAtMixin):
     mark = models.IntegerField(null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(10)])
     attachments = models.ManyToManyField(Attachment, blank=True, related_name='solutions')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['submitted_at', 'id'], name='solution_submitted_id_idx'),
+            # Latest submission of a student for a task.
+            models.Index(fields=['task', 'submitted_by', 'submitted_at'], name='solution_task_student_idx'),
+            models.Index(fields=['task'], condition=models.Q(mark__isnull=True), name='solution_ungraded_idx'),
+        ]
+
     def __str__(self):
         return f"Solution by {self.submitted_by} for {self.task}"
 
 
+class TaskSubmissionState(models.Model):
+    """Latest solution of a student for a task, locked while a new one is submitted."""
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='submission_states')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='submission_states')
+    latest_solution = models.OneToOneField(Solution, null=True, blank=True, on_delete=models.SET_NULL,
+                                           related_name='+')
+    graded = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('task', 'student')
+
+    def __str__(self):
+        return f"{self.student} on {self.task}"
+
+
 class Comment(CreatedAtMixin):
     text = models.TextField()
     solution = models.ForeignKey(Solution, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='comment_created_id_idx'),
+            models.Index(fields=['solution', 'created_at'], name='comment_solution_created_idx'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author}"
 
 
+def mark_delta(old_mark, new_mark):
+    """Return the (sum, count) change of a running mark total when a mark changes."""
+    return (new_mark or 0) - (old_mark or 0), (new_mark is not None) - (old_mark is not None)
+
+
+class EnrollmentQuerySet(models.QuerySet):
+    def record_mark_change(self, old_mark, new_mark):
+        """Shift the running mark total of the enrollments by a single mark change."""
+        sum_delta, count_delta = mark_delta(old_mark, new_mark)
+        if not sum_delta and not count_delta:
+            return 0
+        return self.apply_mark_delta(sum_delta, count_delta)
+
+    def apply_mark_delta(self, sum_delta, count_delta):
+        mark_sum = F('mark_sum') + sum_delta
+        mark_count = F('mark_count') + count_delta
+        return self.update(
+            mark_sum=mark_sum,
+            mark_count=mark_count,
+            average_grade=Case(
+                When(mark_count__gt=-count_delta, then=Cast(mark_sum, FloatField()) / mark_count),
+                default=None,
+            ),
+        )
+
+    def recompute_grades(self):
+        """Rebuild mark totals and averages from the graded solutions in one UPDATE."""
+        graded = Solution.objects.filter(
+            submitted_by=OuterRef('student'),
+            task__lecture__course=OuterRef('course'),
+            mark__isnull=False
+        ).order_by().values('submitted_by')
+        return self.update(
+            mark_sum=Coalesce(Subquery(graded.annotate(total=Sum('mark')).values('total')), 0),
+            mark_count=Coalesce(Subquery(graded.annotate(count=Count('id')).values('count')), 0),
+            average_grade=Subquery(graded.annotate(avg=Avg('mark')).values('avg')),
+        )
+
+
 class Enrollment(RequestedAtMixin):
     class Status(models.TextChoices):
         PENDING = 'pending', 'Pending'
@@ -74,18 +242,52 @@ class Enrollment(RequestedAtMixin):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
     status = models.CharField(max_length=8, choices=Status.choices, default=Status.PENDING)
     average_grade = models.FloatField(null=True, blank=True)
+    mark_sum = models.PositiveIntegerField(default=0)
+    mark_count = models.PositiveIntegerField(default=0)
+
+    objects = EnrollmentQuerySet.as_manager()
 
     class Meta:
         unique_together = ('student', 'course')
+        indexes = [
+            models.Index(fields=['requested_at', 'id'], name='enrollment_requested_id_idx'),
+            models.Index(fields=['student', 'status'], name='enrollment_student_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student} in {self.course} ({self.status})"
 
     def update_average_grade(self):
-        avg = Solution.objects.filter(
-            submitted_by=self.student,
-            task__lecture__course=self.course,
-            mark__isnull=False
-        ).aggregate(avg_mark=Avg('mark'))['avg_mark']
-        self.average_grade = avg
-        self.save(update_fields=['average_grade'])
+        Enrollment.objects.filter(pk=self.pk).recompute_grades()
+        self.refresh_from_db(fields=['mark_sum', 'mark_count', 'average_grade'])
+
+
+class Job(CreatedAtMixin):
+    """A unit of deferred work for ``manage.py runworker``, see courses/jobs.py."""
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        FAILED = 'failed', 'Failed'
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=dict)
+    # Queued jobs with the same key are one job: enqueueing it again while it
+    # waits is a no-op.
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=8, choices=Status.choices, default=Status.QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=Q(status='queued'),
+                                    name='job_queued_dedupe_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
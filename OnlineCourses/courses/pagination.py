@@ -0,0 +1,135 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination over a (timestamp, id) key backed by a composite index.
+
+    DRF's CursorPagination positions on the first ordering field only and falls
+    back to OFFSET for ties. Here the position is the full (timestamp, id) pair,
+    which is unique, so every page is an index range scan starting at the
+    cursor and page N costs the same as page 1. The page size defaults to
+    REST_FRAMEWORK['PAGE_SIZE'] and can be changed per request with ?page_size=
+    up to max_page_size.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, fetching the page with the async ORM."""
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([obj async for obj in queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """Return the unevaluated queryset of the requested page plus one row, or None if not paginated."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self._after(current_position, reverse))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """Take the rows fetched from page_queryset() as the current page and set up the links."""
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _after(self, position, reverse):
+        """(timestamp, id) after position in the walking direction.
+
+        The OR alone gives the index no range start, so every page would scan
+        all rows before the cursor; the redundant timestamp bound AND-ed with it
+        turns each page into an index range scan from the cursor.
+        """
+        try:
+            timestamp, pk = position.rsplit('|', 1)
+            timestamp, pk = parse_datetime(timestamp), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        order, id_order = self.ordering[0], self.ordering[1]
+        lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+        order_attr, id_attr = order.lstrip('-'), id_order.lstrip('-')
+        return Q(**{f'{order_attr}__{lookup}e': timestamp}) & (
+            Q(**{f'{order_attr}__{lookup}': timestamp}) | Q(**{order_attr: timestamp, f'{id_attr}__{lookup}': pk}))
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            values = [instance[field.lstrip('-')] for field in ordering[:2]]
+        else:
+            values = [getattr(instance, field.lstrip('-')) for field in ordering[:2]]
+        return '{}|{}'.format(*values)
+
+
+class CreatedAtPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class SubmittedAtPagination(KeysetPagination):
+    ordering = ('-submitted_at', '-id')
+
+
+class RequestedAtPagination(KeysetPagination):
+    ordering = ('-requested_at', '-id')
+
+
+class UploadedAtPagination(KeysetPagination):
+    ordering = ('-uploaded_at', '-id')
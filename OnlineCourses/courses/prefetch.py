@@ -0,0 +1,76 @@
+from django.db.models import Prefetch
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+# Relation trees mirroring the nesting of the read serializers in serializers.py.
+# Keys are relation names, values are the subtree of the related model
+# (None for leaves such as nested UserSerializer).
+ATTACHMENT_TREE = {'uploaded_by': None}
+COMMENT_TREE = {'author': None}
+SOLUTION_TREE = {'submitted_by': None, 'comments': COMMENT_TREE, 'attachments': ATTACHMENT_TREE}
+TASK_TREE = {'solutions': SOLUTION_TREE}
+LECTURE_TREE = {'tasks': TASK_TREE, 'attachments': ATTACHMENT_TREE}
+COURSE_TREE = {'created_by': None, 'lectures': LECTURE_TREE}
+COURSE_LIST_TREE = {'created_by': None}
+ENROLLMENT_TREE = {'student': None, 'course': COURSE_LIST_TREE}
+
+
+def _is_forward(field):
+    return field.many_to_one or (field.one_to_one and not field.auto_created)
+
+
+def _select_paths(model, tree, prefix=''):
+    """Collect select_related paths for the forward FK chains of the tree."""
+    paths = []
+    for name, subtree in (tree or {}).items():
+        field = model._meta.get_field(name)
+        if _is_forward(field):
+            path = prefix + name
+            nested = _select_paths(field.related_model, subtree, path + '__')
+            paths.extend(nested or [path])
+    return paths
+
+
+def _prefetches(model, tree, prefix=''):
+    """Build Prefetch objects for the multi-valued relations of the tree.
+
+    Forward FK chains are followed with select_related inside the same query,
+    so every multi-valued relation costs exactly one query regardless of the
+    number of rows.
+    """
+    prefetches = []
+    for name, subtree in (tree or {}).items():
+        field = model._meta.get_field(name)
+        if _is_forward(field):
+            prefetches.extend(_prefetches(field.related_model, subtree, prefix + name + '__'))
+            continue
+        related = field.related_model
+        queryset = related.objects.select_related(*_select_paths(related, subtree))
+        queryset = queryset.prefetch_related(*_prefetches(related, subtree))
+        prefetches.append(Prefetch(prefix + name, queryset=queryset))
+    return prefetches
+
+
+def with_tree(queryset, tree):
+    """Apply a fixed-depth select_related/prefetch_related plan to a queryset."""
+    model = queryset.model
+    select = _select_paths(model, tree)
+    if select:
+        queryset = queryset.select_related(*select)
+    prefetches = _prefetches(model, tree)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset
+
+
+def prune_tree(tree, serializer):
+    """Drop the branches of a tree whose fields the serializer does not render."""
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    fields = serializer.fields
+    pruned = {}
+    for name, subtree in (tree or {}).items():
+        if name not in fields:
+            continue
+        field = fields[name]
+        pruned[name] = prune_tree(subtree, field) if subtree and isinstance(field, BaseSerializer) else subtree
+    return pruned
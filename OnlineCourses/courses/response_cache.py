@@ -0,0 +1,90 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Entries are never deleted one by one. Each entry records the tokens of the
+# generations it was built under: ``course:<id>`` for a course and its lectures,
+# ``list:<basename>`` for list pages, plus the ``course:<id>`` of every course a
+# lecture page can show. Signal handlers replace a token, which turns every
+# entry built under it into a miss.
+
+
+def timeout():
+    """Lifetime of an entry in seconds; 0 turns the response cache off."""
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def _generation_key(name):
+    return f'courses:response:gen:{name}'
+
+
+def generations(names):
+    """Return the current tokens of the generations as {name: token}, starting new ones if unknown.
+
+    A fresh random token (instead of a fixed initial value) keeps an evicted
+    token from bringing back entries that were invalidated before.
+    """
+    keys = {_generation_key(name): name for name in names}
+    tokens = cache.get_many(keys)
+    missing = [key for key in keys if key not in tokens]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)
+        tokens.update(cache.get_many(missing))
+    return {keys[key]: token for key, token in tokens.items()}
+
+
+def invalidate(*names):
+    keys = [_generation_key(name) for name in names]
+
+    def bump():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    bump()
+    # Readers between the write and its commit may have stored the old content
+    # under the new token; bumping again once committed drops those entries.
+    transaction.on_commit(bump)
+
+
+def entry_key(basename, action, visibility, request):
+    url = hashlib.md5(request.build_absolute_uri().encode(), usedforsecurity=False).hexdigest()
+    return f'courses:response:{basename}:{action}:{visibility}:{url}'
+
+
+def lookup(key):
+    """Return the entry stored under ``key`` if all its generations are still current."""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    tokens = entry['tokens']
+    current = cache.get_many([_generation_key(name) for name in tokens])
+    if all(current.get(_generation_key(name)) == token for name, token in tokens.items()):
+        return entry
+    return None
+
+
+def store(key, tokens, data, headers, course_id=None):
+    if not tokens:
+        return
+    cache.set(key, {'tokens': tokens, 'course': course_id, 'data': data, 'headers': headers}, timeout())
+
+
+def record(outcome):
+    key = f'courses:response:stats:{outcome}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted between add() and incr().
+        cache.set(key, 1, None)
+
+
+def stats():
+    counts = cache.get_many(['courses:response:stats:hits', 'courses:response:stats:misses'])
+    hits = counts.get('courses:response:stats:hits', 0)
+    misses = counts.get('courses:response:stats:misses', 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else None}
@@ -0,0 +1,71 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+from .models import Lecture, Task
+
+# Text search configuration of the Postgres search vectors, see migration 0012.
+SEARCH_CONFIG = 'english'
+# Searched fields per model, title-like field first. The title weighs 1.0 and
+# the body 0.4 in the rank, as Postgres weights A and B do.
+SEARCH_FIELDS = {
+    Lecture: ('name', 'text'),
+    Task: ('title', 'description'),
+}
+BM25_WEIGHTS = (1.0, 0.4)
+
+
+def search(queryset, query):
+    """Filter lectures or tasks to those matching ``query`` and annotate ``rank``, best match first.
+
+    On Postgres this matches the stored ``search_vector`` column through its
+    GIN index and ranks with ts_rank; on SQLite it uses the FTS5 table of the
+    model and bm25. Both are maintained by the database, see migration 0012.
+    The query is plain words, all of which must match (stemmed).
+    """
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+    if vendor == 'postgresql':
+        vector = RawSQL(f'"{table}"."search_vector"', [], output_field=SearchVectorField())
+        tsquery = SearchQuery(query, config=SEARCH_CONFIG, search_type='plain')
+        queryset = queryset.alias(search_vector=vector).filter(search_vector=tsquery).annotate(
+            rank=SearchRank(vector, tsquery))
+    elif vendor == 'sqlite':
+        match = fts5_query(query)
+        if not match:
+            return queryset.annotate(rank=models.Value(0.0)).none()
+        fts = f'{table}_fts'
+        weights = ', '.join(map(str, BM25_WEIGHTS))
+        # A join, so that the match and bm25() run once per query rather than once per row; bm25() is lower
+        # for better matches.
+        queryset = queryset.extra(
+            tables=[fts], where=[f'"{fts}".rowid = "{table}"."id"', f'"{fts}" MATCH %s'], params=[match],
+            select={'rank': f'-bm25("{fts}", {weights})'},
+        )
+    else:
+        condition = models.Q()
+        for word in query.split():
+            condition &= models.Q(*(models.Q(**{f'{field}__icontains': word})
+                                    for field in SEARCH_FIELDS[queryset.model]), _connector=models.Q.OR)
+        queryset = queryset.filter(condition).annotate(rank=models.Value(1.0))
+    return queryset.order_by('-rank', '-id')
+
+
+def scale_ranks(results):
+    """Scale the ``rank`` of each result dict so the best one is 1.0.
+
+    bm25 and ts_rank scores depend on the term statistics of the table that
+    was searched, so lecture and task ranks are only comparable once each
+    type is scaled on its own.
+    """
+    top = max((result['rank'] for result in results), default=0)
+    for result in results:
+        result['rank'] = result['rank'] / top if top > 0 else 0.0
+    return results
+
+
+def fts5_query(query):
+    """Quote each word of ``query`` so FTS5 reads them as terms, not as query syntax."""
+    return ' '.join('"%s"' % word for word in re.findall(r'\w+', query))
@@ -0,0 +1,194 @@
+import io
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router
+from django.utils import timezone
+
+from accounts.models import User
+from .models import (
+    Course, CourseVersion, Lecture, Task, Solution, Comment, Attachment, Enrollment, TaskSubmissionState
+)
+
+
+COPY_BATCH_SIZE = 50000
+
+
+def copy_create(model, objs):
+    """Insert ``objs`` like bulk_create, but faster, and return how many there were.
+
+    ``objs`` may be any iterable, e.g. a generator; it is consumed in batches
+    of COPY_BATCH_SIZE, so only one batch is held in memory. The objects do
+    not get their ids. Rows go through COPY on Postgres and executemany()
+    elsewhere, skipping the per-batch INSERT compilation of bulk_create, which
+    dominates seeding millions of rows.
+    """
+    connection = connections[router.db_for_write(model)]
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    if connection.vendor == 'postgresql':
+        sql = f'COPY {table} ({columns}) FROM STDIN'
+    else:
+        sql = f'INSERT INTO {table} ({columns}) VALUES ({", ".join(["%s"] * len(fields))})'
+
+    objs = iter(objs)
+    count = 0
+    with connection.cursor() as cursor:
+        while batch := list(islice(objs, COPY_BATCH_SIZE)):
+            count += len(batch)
+            rows = [[field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields]
+                    for obj in batch]
+            if connection.vendor != 'postgresql':
+                cursor.executemany(sql, rows)
+                continue
+            buffer = io.StringIO()
+            for values in rows:
+                buffer.write('\t'.join(map(copy_text, values)) + '\n')
+            buffer.seek(0)
+            if hasattr(cursor.cursor, 'copy_expert'):
+                cursor.cursor.copy_expert(sql, buffer)
+            else:
+                with cursor.cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+    return count
+
+
+def copy_text(value):
+    """A value in COPY's text format."""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def seed_dataset(teachers=2, students=200, courses=2, lectures=10, tasks=3, enrollments=30,
+                 solution_rate=0.7, comments=1, seed=0, prefix='bench'):
+    """Bulk-create a synthetic dataset and return the number of rows per model.
+
+    Every teacher gets ``courses`` courses with ``lectures`` lectures of
+    ``tasks`` tasks each. Every course enrolls ``enrollments`` random students,
+    each of whom solves a task with probability ``solution_rate``; solutions get
+    a mark most of the time and ``comments`` teacher comments.
+    """
+    rng = random.Random(seed)
+    password = make_password(prefix)
+    now = timezone.now()
+
+    teacher_rows = User.objects.bulk_create([
+        User(email=f'{prefix}-teacher{i}@example.com', full_name=f'Teacher {i}', role=User.RoleTypes.TEACHER,
+             password=password)
+        for i in range(teachers)
+    ])
+    student_rows = User.objects.bulk_create([
+        User(email=f'{prefix}-student{i}@example.com', full_name=f'Student {i}', role=User.RoleTypes.STUDENT,
+             password=password)
+        for i in range(students)
+    ], batch_size=1000)
+
+    course_rows = Course.objects.bulk_create([
+        Course(name=f'Course {t}.{c}', created_by=teacher)
+        for t, teacher in enumerate(teacher_rows) for c in range(courses)
+    ])
+    CourseVersion.objects.bulk_create([CourseVersion(course=course) for course in course_rows])
+    lecture_rows = Lecture.objects.bulk_create([
+        Lecture(name=f'Lecture {i} of {course.name}', text=f'Notes for lecture {i}.', course=course)
+        for course in course_rows for i in range(lectures)
+    ], batch_size=1000)
+    slides = Attachment.objects.bulk_create([
+        Attachment(file=f'attachments/{prefix}-slides-{course.pk}.pdf', uploaded_by=course.created_by)
+        for course in course_rows
+    ])
+    Lecture.attachments.through.objects.bulk_create([
+        Lecture.attachments.through(lecture_id=lecture.pk, attachment_id=slides[i // lectures].pk)
+        for i, lecture in enumerate(lecture_rows)
+    ], batch_size=1000)
+    task_rows = Task.objects.bulk_create([
+        Task(title=f'Task {i} of {lecture.name}', description='Solve it.', deadline=now + timedelta(days=30),
+             lecture=lecture)
+        for lecture in lecture_rows for i in range(tasks)
+    ], batch_size=1000)
+
+    enrolled = {
+        course.pk: rng.sample(student_rows, min(enrollments, len(student_rows))) for course in course_rows
+    }
+    enrollment_count = copy_create(Enrollment, (
+        Enrollment(student=student, course_id=course_id, status=Enrollment.Status.APPROVED)
+        for course_id, students in enrolled.items() for student in students
+    ))
+
+    # Solutions, their states and comments are streamed: the large scale makes millions of each.
+    course_of_lecture = {lecture.pk: lecture.course_id for lecture in lecture_rows}
+    solution_count = copy_create(Solution, (
+        Solution(text='My answer.', task=task, submitted_by=student,
+                 mark=rng.randint(1, 10) if rng.random() < 0.8 else None)
+        for task in task_rows for student in enrolled[course_of_lecture[task.lecture_id]]
+        if rng.random() < solution_rate
+    ))
+
+    def solution_rows():
+        # COPY does not return ids; read the solutions back.
+        return Solution.objects.filter(task__lecture__course__in=course_rows).values_list(
+            'pk', 'task_id', 'submitted_by_id', 'mark').iterator(chunk_size=COPY_BATCH_SIZE)
+
+    copy_create(TaskSubmissionState, (
+        TaskSubmissionState(task_id=task_id, student_id=student_id, latest_solution_id=pk, graded=mark is not None)
+        for pk, task_id, student_id, mark in solution_rows()
+    ))
+
+    teacher_of_course = {course.pk: course.created_by_id for course in course_rows}
+    course_of_task = {task.pk: course_of_lecture[task.lecture_id] for task in task_rows}
+    comment_count = copy_create(Comment, (
+        Comment(text='Looks good.', solution_id=pk, author_id=teacher_of_course[course_of_task[task_id]])
+        for pk, task_id, _, _ in solution_rows() for _ in range(comments)
+    ))
+
+    Enrollment.objects.filter(course__in=course_rows).recompute_grades()
+    return {
+        'teachers': len(teacher_rows), 'students': len(student_rows), 'courses': len(course_rows),
+        'lectures': len(lecture_rows), 'tasks': len(task_rows), 'enrollments': enrollment_count,
+        'solutions': solution_count, 'comments': comment_count, 'attachments': len(slides),
+    }
+
+
+def corpus_vocabulary(size=5000, seed=0):
+    """Return ``size`` distinct pronounceable words; seed_corpus draws word i with weight 1 / (i + 1)."""
+    rng = random.Random(seed)
+    words = {}
+    while len(words) < size:
+        word = ''.join(rng.choice('bcdfghklmnprstvz') + rng.choice('aeiou') for _ in range(rng.randint(2, 4)))
+        words.setdefault(word, None)
+    return list(words)
+
+
+def seed_corpus(lectures=100000, courses=100, tasks=1, words=60, vocabulary=5000, seed=0, prefix='bench'):
+    """Bulk-create lectures and tasks with Zipf-distributed text for search benchmarks.
+
+    One teacher owns ``courses`` courses that share the lectures evenly; every
+    lecture has ``tasks`` tasks. Texts are drawn from corpus_vocabulary(), so
+    its first words are in most texts and its last ones in few.
+    """
+    rng = random.Random(seed)
+    vocabulary = corpus_vocabulary(vocabulary, seed)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+    def text(length):
+        return ' '.join(rng.choices(vocabulary, weights, k=length))
+
+    teacher = User.objects.create(email=f'{prefix}-corpus-teacher@example.com', full_name='Corpus Teacher',
+                                  role=User.RoleTypes.TEACHER, password=make_password(prefix))
+    course_rows = Course.objects.bulk_create([
+        Course(name=f'Corpus course {i}', created_by=teacher) for i in range(courses)
+    ])
+    CourseVersion.objects.bulk_create([CourseVersion(course=course) for course in course_rows])
+    lecture_rows = Lecture.objects.bulk_create([
+        Lecture(name=text(4).capitalize(), text=text(words), course=course_rows[i % courses])
+        for i in range(lectures)
+    ], batch_size=1000)
+    deadline = timezone.now() + timedelta(days=30)
+    task_rows = Task.objects.bulk_create([
+        Task(title=text(4).capitalize(), description=text(words // 3), deadline=deadline, lecture=lecture)
+        for lecture in lecture_rows for _ in range(tasks)
+    ], batch_size=1000)
+    return {'courses': len(course_rows), 'lectures': len(lecture_rows), 'tasks': len(task_rows)}
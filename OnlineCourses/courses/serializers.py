@@ -1,17 +1,88 @@
 from rest_framework import serializers
+from rest_framework.serializers import ListSerializer
+from django.conf import settings
 from django.utils import timezone
 
-from .models import Course, Lecture, Task, Solution, Comment, Attachment, Enrollment
+from .authz import CourseAccessRelatedField
+from .models import (
+    Course, Lecture, Task, Solution, Comment, Attachment, AttachmentUpload, Enrollment, TaskSubmissionState
+)
 from accounts.serializers import UserSerializer
 from accounts.models import User
 
 
-class AttachmentSerializer(serializers.ModelSerializer):
+def _field_tree(value):
+    """Parse 'id,lectures.name,lectures.tasks' into {'id': {}, 'lectures': {'name': {}, 'tasks': {}}}."""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in filter(None, path.strip().split('.')):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class FieldSpec:
+    """The fields to render at one level of a serializer tree, from ?fields= and ?expand=.
+
+    ``fields`` restricts a level to the listed names; a level without listed
+    names keeps all its fields. Nested lists (lectures, tasks, solutions,
+    comments, attachments) are left out unless they are listed in
+    ``fields`` or ``expand``. Dots address nested levels, e.g.
+    ``?expand=lectures&fields=id,name,lectures.name``.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields or {}
+        self.expand = expand or {}
+
+    @classmethod
+    def from_query(cls, params):
+        """Return the spec of a request's query parameters, or None to render every field."""
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        return cls(_field_tree(params.get('fields')), _field_tree(params.get('expand')))
+
+    def select(self, fields):
+        selected = {}
+        for name, field in fields.items():
+            if self.fields:
+                wanted = name in self.fields or name in self.expand
+            else:
+                wanted = not isinstance(field, ListSerializer) or name in self.expand
+            if wanted:
+                selected[name] = field
+        return selected
+
+    def nested(self, name):
+        return FieldSpec(self.fields.get(name), self.expand.get(name))
+
+
+class SparseFieldsMixin:
+    """Renders only the fields chosen by the ``fieldspec`` argument and passes the rest of it down."""
+
+    def __init__(self, *args, fieldspec=None, **kwargs):
+        self.fieldspec = fieldspec
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldspec is None:
+            return fields
+        fields = self.fieldspec.select(fields)
+        for name, field in fields.items():
+            nested = field.child if isinstance(field, ListSerializer) else field
+            if isinstance(nested, SparseFieldsMixin):
+                nested.fieldspec = self.fieldspec.nested(name)
+        return fields
+
+
+class AttachmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     uploaded_by = UserSerializer(read_only=True)
 
     class Meta:
         model = Attachment
-        fields = ['id', 'file', 'uploaded_at', 'uploaded_by']
+        fields = ['id', 'file', 'name', 'uploaded_at', 'uploaded_by']
+        read_only_fields = ['name']
 
 
 class AttachmentCreateSerializer(serializers.ModelSerializer):
@@ -20,7 +91,25 @@ class AttachmentCreateSerializer(serializers.ModelSerializer):
         fields = ['id', 'file']
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class AttachmentUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AttachmentUpload
+        fields = ['id', 'filename', 'size', 'offset', 'created_at']
+        read_only_fields = ['id', 'offset', 'created_at']
+
+    def validate_size(self, value):
+        if value > settings.ATTACHMENT_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Uploads are limited to {settings.ATTACHMENT_UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+
+class AttachmentUploadFinishSerializer(serializers.Serializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
+
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    solution = CourseAccessRelatedField(queryset=Solution.objects.all())
     author = UserSerializer(read_only=True)
 
     class Meta:
@@ -29,7 +118,13 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'created_at']
 
 
-class SolutionSerializer(serializers.ModelSerializer):
+class CommentFeedSerializer(serializers.Serializer):
+    results = CommentSerializer(many=True)
+    cursor = serializers.CharField(allow_null=True, help_text="Pass as ?since= to get the comments after these.")
+    has_more = serializers.BooleanField(help_text="Whether more comments follow the cursor already.")
+
+
+class SolutionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     comments = CommentSerializer(many=True, read_only=True)
     attachments = AttachmentSerializer(many=True, read_only=True)
     submitted_by = UserSerializer(read_only=True)
@@ -41,6 +136,7 @@ class SolutionSerializer(serializers.ModelSerializer):
 
 
 class CreateSolutionSerializer(serializers.ModelSerializer):
+    task = CourseAccessRelatedField(queryset=Task.objects.all())
     attachments = serializers.PrimaryKeyRelatedField(queryset=Attachment.objects.all(), many=True, required=False)
 
     class Meta:
@@ -55,8 +151,8 @@ class CreateSolutionSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         task = attrs.get('task')
         user = self.context['request'].user
-        last = Solution.objects.filter(task=task, submitted_by=user).order_by('submitted_at').last()
-        if last and last.mark is None:
+        if TaskSubmissionState.objects.filter(task=task, student=user, latest_solution__isnull=False,
+                                              graded=False).exists():
             raise serializers.ValidationError("Previous solution is not graded yet; cannot submit a new one.")
         return attrs
 
@@ -68,13 +164,34 @@ class SolutionMarkSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class SolutionBulkMarkItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    mark = serializers.IntegerField(allow_null=True, min_value=1, max_value=10)
+
+
+class SolutionBulkMarkSerializer(serializers.Serializer):
+    marks = SolutionBulkMarkItemSerializer(many=True, allow_empty=False, max_length=1000)
+
+    def validate_marks(self, value):
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each solution may appear only once.")
+        return value
+
+
+class SolutionBulkMarkResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['updated', 'unchanged', 'not_found'])
+    mark = serializers.IntegerField(allow_null=True, required=False)
+
+
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     solutions = SolutionSerializer(many=True, read_only=True)
 
     class Meta:
         model = Task
-        fields = ['id', 'title', 'description', 'deadline', 'lecture', 'created_at', 'solutions']
-        read_only_fields = ['created_at', 'solutions']
+        fields = ['id', 'title', 'description', 'deadline', 'lecture', 'created_at', 'updated_at', 'solutions']
+        read_only_fields = ['created_at', 'updated_at', 'solutions']
 
 
 class CreateTaskSerializer(serializers.ModelSerializer):
@@ -83,14 +200,14 @@ class CreateTaskSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'deadline', 'lecture']
 
 
-class LectureSerializer(serializers.ModelSerializer):
+class LectureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tasks = TaskSerializer(many=True, read_only=True)
     attachments = AttachmentSerializer(many=True, read_only=True)
 
     class Meta:
         model = Lecture
-        fields = ['id', 'name', 'text', 'course', 'created_at', 'tasks', 'attachments']
-        read_only_fields = ['created_at', 'tasks', 'attachments']
+        fields = ['id', 'name', 'text', 'course', 'created_at', 'updated_at', 'tasks', 'attachments']
+        read_only_fields = ['created_at', 'updated_at', 'tasks', 'attachments']
 
 
 class CreateLectureSerializer(serializers.ModelSerializer):
@@ -101,14 +218,14 @@ class CreateLectureSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'text', 'course', 'attachments']
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     lectures = LectureSerializer(many=True, read_only=True)
 
     class Meta:
         model = Course
-        fields = ['id', 'name', 'created_by', 'created_at', 'lectures']
-        read_only_fields = ['created_by', 'created_at', 'lectures']
+        fields = ['id', 'name', 'created_by', 'created_at', 'updated_at', 'lectures']
+        read_only_fields = ['created_by', 'created_at', 'updated_at', 'lectures']
 
 
 class CourseCreateSerializer(serializers.ModelSerializer):
@@ -117,15 +234,46 @@ class CourseCreateSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 
-class CourseListSerializer(serializers.ModelSerializer):
+class CourseListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
 
     class Meta:
         model = Course
-        fields = ['id', 'name', 'created_by', 'created_at']
+        fields = ['id', 'name', 'created_by', 'created_at', 'updated_at']
+
+
+class GradebookStatsSerializer(serializers.Serializer):
+    mean = serializers.FloatField(allow_null=True)
+    median = serializers.FloatField(allow_null=True)
+    stddev = serializers.FloatField(allow_null=True)
+    p25 = serializers.FloatField(allow_null=True)
+    p75 = serializers.FloatField(allow_null=True)
+    p90 = serializers.FloatField(allow_null=True)
+    submission_rate = serializers.FloatField(allow_null=True)
+    graded = serializers.IntegerField()
+
+
+class GradebookTaskSerializer(GradebookStatsSerializer):
+    id = serializers.IntegerField()
+    lecture = serializers.CharField()
+    title = serializers.CharField()
 
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class GradebookStudentSerializer(GradebookStatsSerializer):
+    id = serializers.IntegerField()
+    email = serializers.EmailField()
+    full_name = serializers.CharField()
+    average_grade = serializers.FloatField(allow_null=True)
+
+
+class GradebookSerializer(serializers.Serializer):
+    tasks = GradebookTaskSerializer(many=True)
+    students = GradebookStudentSerializer(many=True)
+    marks = serializers.ListField(child=serializers.ListField(child=serializers.IntegerField(allow_null=True)),
+                                  help_text="Latest mark per student (row) and task (column), null if none.")
+
+
+class EnrollmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     student = UserSerializer(read_only=True)
     course = CourseListSerializer(read_only=True)
 
@@ -158,3 +306,51 @@ class EnrollmentCreateSerializer(serializers.ModelSerializer):
         if Enrollment.objects.filter(student=student, course=course).exists():
             raise serializers.ValidationError("Enrollment already exists for this student and course.")
         return attrs
+
+
+class EnrollmentIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=5000)
+
+
+class EnrollmentBatchResultSerializer(serializers.Serializer):
+    updated = serializers.ListField(child=serializers.IntegerField())
+    not_found = serializers.ListField(child=serializers.IntegerField())
+
+
+class EnrollmentImportItemSerializer(serializers.Serializer):
+    student = serializers.IntegerField()
+    course = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Enrollment.Status.choices, default=Enrollment.Status.PENDING)
+
+
+class EnrollmentImportSerializer(serializers.Serializer):
+    enrollments = EnrollmentImportItemSerializer(many=True, allow_empty=False, max_length=5000)
+
+
+class EnrollmentImportResultSerializer(serializers.Serializer):
+    requested = serializers.IntegerField()
+    created = serializers.IntegerField()
+    rejected = serializers.ListField(child=serializers.DictField())
+
+
+class ResponseCacheStatsSerializer(serializers.Serializer):
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    hit_rate = serializers.FloatField(allow_null=True)
+
+
+class SearchParamsSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200, help_text="Words that must all occur in the name or text.")
+    type = serializers.ChoiceField(choices=['lecture', 'task'], required=False,
+                                   help_text="Search only lectures or only tasks.")
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=20)
+
+
+class SearchResultSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['lecture', 'task'])
+    id = serializers.IntegerField()
+    course = serializers.IntegerField()
+    lecture = serializers.IntegerField(allow_null=True, help_text="Lecture of a task, null for lectures.")
+    title = serializers.CharField(help_text="Name of a lecture or title of a task.")
+    rank = serializers.FloatField(help_text="Relevance relative to the best match of the same type, which "
+                                            "scores 1.0; lectures and tasks are scaled separately.")
@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import blobs, feeds, response_cache
+from .access import invalidate_course_access
+from .models import Course, CourseVersion, Lecture, Task, Solution, Comment, Attachment, Enrollment, content_changed
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    invalidate_course_access(instance.student_id)
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    invalidate_course_access(instance.created_by_id)
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    # Also runs for attachments removed by cascade, e.g. with their uploader.
+    if instance.blob_id is not None:
+        blobs.release(instance.blob_id)
+
+
+# Content versions: every change rendered by CourseSerializer/LectureSerializer
+# bumps the version of the course it belongs to. Queryset updates do not send
+# signals, so bulk code paths bump the version themselves.
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, raw=False, **kwargs):
+    if created:
+        CourseVersion.objects.get_or_create(course=instance)
+    elif not raw:
+        Course.objects.filter(pk=instance.pk).bump_content_version()
+
+
+@receiver(pre_save, sender=Lecture)
+def lecture_moving(sender, instance, raw=False, **kwargs):
+    # A lecture moved to another course also changes the course it left.
+    if instance.pk is not None and not raw:
+        Course.objects.filter(lectures=instance.pk).exclude(pk=instance.course_id).bump_content_version()
+
+
+@receiver(pre_save, sender=Task)
+def task_moving(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        Course.objects.filter(lectures__tasks=instance.pk).exclude(lectures=instance.lecture_id).bump_content_version()
+
+
+@receiver([post_save, post_delete], sender=Lecture)
+def lecture_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Course.objects.filter(pk=instance.course_id).bump_content_version()
+
+
+@receiver([post_save, post_delete], sender=Task)
+def task_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Course.objects.filter(lectures=instance.lecture_id).bump_content_version()
+
+
+@receiver([post_save, post_delete], sender=Solution)
+def solution_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Course.objects.filter(lectures__tasks=instance.task_id).bump_content_version()
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Course.objects.filter(lectures__tasks__solutions=instance.solution_id).bump_content_version()
+
+
+@receiver(post_save, sender=Attachment)
+def attachment_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Course.objects.with_attachments([instance.pk]).bump_content_version()
+
+
+@receiver(pre_delete, sender=Attachment)
+def attachment_deleting(sender, instance, **kwargs):
+    # The M2M rows are gone by post_delete, so the courses are found beforehand.
+    Course.objects.with_attachments([instance.pk]).bump_content_version()
+
+
+@receiver(m2m_changed, sender=Lecture.attachments.through)
+@receiver(m2m_changed, sender=Solution.attachments.through)
+def attachments_changed(sender, instance, action, reverse, **kwargs):
+    if reverse:
+        # From the attachment side the courses are found through the M2M rows,
+        # so removals are handled before the rows go away.
+        if action in ('post_add', 'pre_remove', 'pre_clear'):
+            Course.objects.with_attachments([instance.pk]).bump_content_version()
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if isinstance(instance, Lecture):
+            Course.objects.filter(pk=instance.course_id).bump_content_version()
+        else:
+            Course.objects.filter(lectures__tasks=instance.task_id).bump_content_version()
+
+
+# Response cache: entries of a course and its lectures, including the lecture
+# list pages showing it, follow its content version; course list pages are
+# dropped whenever a course changes.
+
+
+@receiver(content_changed)
+def course_content_changed(sender, course_ids, **kwargs):
+    response_cache.invalidate(*(f'course:{pk}' for pk in course_ids))
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_listing_changed(sender, instance, **kwargs):
+    response_cache.invalidate('list:course', 'list:lecture', f'course:{instance.pk}')
+
+
+# Comment streams: wake the hubs once a new comment is visible to their polls.
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(feeds.notify_comment_saved)
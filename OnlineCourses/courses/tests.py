@@ -1,3 +1,1593 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import hashlib
+import json
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.http import UnreadablePostError
+from django.db import connection
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.pagination import _reverse_ordering
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import AsyncAuthenticatedView, AsyncJWTAuthentication, ClaimsJWTAuthentication
+from accounts.models import ClaimsUser, User
+from accounts.tokens import UserAccessToken
+from core import metrics
+from .access import accessible_course_ids
+from .checks import check_shared_cache
+from .pagination import CreatedAtPagination, RequestedAtPagination, SubmittedAtPagination
+from . import feeds, jobs, uploads
+from .seeding import seed_dataset
+from .views import CourseViewSet, EnrollmentViewSet
+from .models import (
+    Course, CourseVersion, Lecture, Task, Solution, Comment, Attachment, AttachmentUpload, Blob, Enrollment, Job,
+    TaskSubmissionState
+)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class CoursesTestCase(TestCase):
+    def setUp(self):
+        # Access sets and cached responses outlive the per-test transaction.
+        cache.clear()
+        self.client = APIClient()
+
+
+def seed_course(teacher, students, lectures=3, tasks=2, name='Course'):
+    course = Course.objects.create(name=name, created_by=teacher)
+    deadline = timezone.now() + timedelta(days=7)
+    for student in students:
+        Enrollment.objects.create(student=student, course=course, status=Enrollment.Status.APPROVED)
+    for i in range(lectures):
+        lecture = Lecture.objects.create(name=f'Lecture {i}', text='text', course=course)
+        lecture.attachments.add(Attachment.objects.create(file=ContentFile(b'x', name='slides.pdf'),
+                                                          uploaded_by=teacher))
+        for j in range(tasks):
+            task = Task.objects.create(title=f'Task {i}.{j}', description='d', deadline=deadline, lecture=lecture)
+            for student in students:
+                solution = Solution.objects.create(text='answer', task=task, submitted_by=student, mark=7)
+                solution.attachments.add(Attachment.objects.create(file=ContentFile(b'y', name='answer.txt'),
+                                                                   uploaded_by=student))
+                Comment.objects.create(text='ok', solution=solution, author=teacher)
+    return course
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RESPONSE_CACHE_TIMEOUT=0)
+class CoursePrefetchTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        students = [
+            User.objects.create_user(email=f's{i}@example.com', password='x', full_name=f'S{i}',
+                                     role=User.RoleTypes.STUDENT)
+            for i in range(4)
+        ]
+        cls.student = students[0]
+        cls.small = seed_course(cls.teacher, students[:1], lectures=1, tasks=1, name='Small')
+        cls.large = seed_course(cls.teacher, students, lectures=4, tasks=3, name='Large')
+
+    def count_queries(self, url, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_course_detail_query_count_is_constant(self):
+        small, _ = self.count_queries(f'/api/courses/courses/{self.small.pk}/', self.teacher)
+        large, response = self.count_queries(f'/api/courses/courses/{self.large.pk}/', self.teacher)
+        self.assertEqual(small, large)
+        # validators, course + created_by, lectures, lecture attachments, tasks, solutions, comments,
+        # solution attachments
+        self.assertEqual(large, 8)
+        self.assertEqual(len(response.data['lectures']), 4)
+        self.assertEqual(len(response.data['lectures'][0]['tasks'][0]['solutions']), 4)
+
+    def test_lecture_detail_query_count_is_constant(self):
+        small_lecture = self.small.lectures.first()
+        large_lecture = self.large.lectures.first()
+        small, _ = self.count_queries(f'/api/courses/lectures/{small_lecture.pk}/', self.student)
+        # The first request also loaded the student's access set into the cache.
+        small, _ = self.count_queries(f'/api/courses/lectures/{small_lecture.pk}/', self.student)
+        large, _ = self.count_queries(f'/api/courses/lectures/{large_lecture.pk}/', self.student)
+        self.assertEqual(small, large)
+
+    def test_nested_list_query_counts(self):
+        for url in ['/api/courses/courses/', '/api/courses/tasks/', '/api/courses/solutions/',
+                    '/api/courses/comments/', '/api/courses/attachments/', '/api/courses/enrollments/']:
+            queries, _ = self.count_queries(url, self.teacher)
+            self.assertLessEqual(queries, 6, url)
+
+    def test_sparse_fieldsets_skip_unused_relations(self):
+        url = f'/api/courses/courses/{self.large.pk}/'
+        # validators and the course row only
+        queries, response = self.count_queries(url + '?fields=id,name', self.teacher)
+        self.assertEqual((queries, response.data), (2, {'id': self.large.pk, 'name': 'Large'}))
+
+        queries, response = self.count_queries(url + '?expand=lectures&fields=name,lectures.name', self.teacher)
+        self.assertEqual(queries, 3)
+        self.assertEqual(response.data['lectures'][0], {'name': 'Lecture 0'})
+
+        queries, response = self.count_queries(url + '?expand=lectures,lectures.tasks', self.teacher)
+        self.assertEqual(queries, 4)
+        self.assertIn('created_by', response.data)
+        lecture = response.data['lectures'][0]
+        self.assertNotIn('attachments', lecture)
+        self.assertNotIn('solutions', lecture['tasks'][0])
+        self.assertIn('deadline', lecture['tasks'][0])
+
+    def test_sparse_fieldsets_on_lists(self):
+        _, response = self.count_queries('/api/courses/lectures/?fields=id,course', self.teacher)
+        self.assertTrue(response.data['results'])
+        self.assertTrue(all(set(item) == {'id', 'course'} for item in response.data['results']))
+        _, response = self.count_queries('/api/courses/enrollments/?fields=status,course.name', self.teacher)
+        self.assertEqual(response.data['results'][0], {'status': 'approved', 'course': {'name': 'Large'}})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class KeysetPaginationTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        students = [
+            User.objects.create_user(email=f's{i}@example.com', password='x', full_name=f'S{i}',
+                                     role=User.RoleTypes.STUDENT)
+            for i in range(5)
+        ]
+        seed_course(cls.teacher, students, lectures=1, tasks=1)
+
+    def walk(self, url, link):
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('OFFSET' in q['sql'] for q in ctx.captured_queries))
+            seen.append([item['id'] for item in response.data['results']])
+            url = response.data[link]
+        return seen, response
+
+    def test_pages_cover_all_rows_without_offset(self):
+        pages, _ = self.walk('/api/courses/solutions/?page_size=2', 'next')
+        expected = list(Solution.objects.order_by('-submitted_at', '-id').values_list('id', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_equal_timestamps_are_paged_by_id(self):
+        Solution.objects.update(submitted_at=timezone.now())
+        pages, response = self.walk('/api/courses/solutions/?page_size=2', 'next')
+        expected = list(Solution.objects.order_by('-id').values_list('id', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+
+        back, _ = self.walk(response.data['previous'], 'previous')
+        self.assertEqual(back, [pages[1], pages[0]])
+
+    def test_malformed_cursor_is_not_found(self):
+        self.client.force_authenticate(self.teacher)
+        for position in ['notadate|5', '2020-13-45 00:00:00|5', '2020-01-01 00:00:00|x', 'nopk']:
+            cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+            response = self.client.get('/api/courses/solutions/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RunningAverageTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        cls.course = seed_course(cls.teacher, [cls.student], lectures=1, tasks=2)
+        Enrollment.objects.all().recompute_grades()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.teacher)
+        self.enrollment = Enrollment.objects.get(student=self.student, course=self.course)
+        self.first, self.second = Solution.objects.order_by('id')
+
+    def grade(self, solution, mark):
+        response = self.client.patch(f'/api/courses/solutions/{solution.pk}/', {'mark': mark}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.enrollment.refresh_from_db()
+
+    def test_mark_set_changed_and_cleared(self):
+        self.assertEqual((self.enrollment.mark_sum, self.enrollment.mark_count), (14, 2))
+        self.grade(self.first, 10)
+        self.assertEqual((self.enrollment.mark_sum, self.enrollment.mark_count), (17, 2))
+        self.assertEqual(self.enrollment.average_grade, 8.5)
+        self.grade(self.first, None)
+        self.assertEqual((self.enrollment.mark_sum, self.enrollment.mark_count), (7, 1))
+        self.assertEqual(self.enrollment.average_grade, 7.0)
+        self.grade(self.second, None)
+        self.assertEqual((self.enrollment.mark_sum, self.enrollment.mark_count), (0, 0))
+        self.assertIsNone(self.enrollment.average_grade)
+
+    def test_delete_graded_solution(self):
+        self.client.delete(f'/api/courses/solutions/{self.first.pk}/')
+        self.enrollment.refresh_from_db()
+        self.assertEqual((self.enrollment.mark_sum, self.enrollment.mark_count), (7, 1))
+
+    def test_recompute_command_repairs_totals(self):
+        Enrollment.objects.update(mark_sum=0, mark_count=0, average_grade=None)
+        Solution.objects.filter(pk=self.first.pk).update(mark=9)
+        call_command('recompute_grades', stdout=StringIO())
+        self.enrollment.refresh_from_db()
+        self.assertEqual((self.enrollment.mark_sum, self.enrollment.mark_count), (16, 2))
+        self.assertEqual(self.enrollment.average_grade, 8.0)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BulkMarkTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.other_teacher = User.objects.create_user(email='other@example.com', password='x', full_name='O',
+                                                     role=User.RoleTypes.TEACHER)
+        cls.students = [
+            User.objects.create_user(email=f's{i}@example.com', password='x', full_name=f'S{i}',
+                                     role=User.RoleTypes.STUDENT)
+            for i in range(3)
+        ]
+        cls.course = seed_course(cls.teacher, cls.students, lectures=1, tasks=2)
+        cls.foreign = seed_course(cls.other_teacher, cls.students[:1], lectures=1, tasks=1)
+        Solution.objects.update(mark=None)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.teacher)
+
+    def bulk_mark(self, marks):
+        return self.client.post('/api/courses/solutions/bulk-mark/', {'marks': marks}, format='json')
+
+    def test_marks_are_applied_in_one_round_trip(self):
+        solutions = list(Solution.objects.filter(task__lecture__course=self.course))
+        marks = [{'id': solution.pk, 'mark': 8} for solution in solutions]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.bulk_mark(marks)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(item['status'] == 'updated' for item in response.data))
+        # savepoint, locked select, bulk update, content version (select + update), graded flags and one
+        # average update per enrollment
+        self.assertLessEqual(len(ctx.captured_queries), 8 + len(self.students))
+        for enrollment in Enrollment.objects.filter(course=self.course):
+            self.assertEqual((enrollment.mark_sum, enrollment.mark_count, enrollment.average_grade), (16, 2, 8.0))
+
+    def test_foreign_and_unchanged_solutions_are_reported(self):
+        own = Solution.objects.filter(task__lecture__course=self.course).first()
+        foreign = Solution.objects.get(task__lecture__course=self.foreign)
+        self.bulk_mark([{'id': own.pk, 'mark': 5}])
+        response = self.bulk_mark([{'id': own.pk, 'mark': 5}, {'id': foreign.pk, 'mark': 9}])
+        self.assertEqual(response.data, [{'id': own.pk, 'status': 'unchanged', 'mark': 5},
+                                         {'id': foreign.pk, 'status': 'not_found'}])
+        foreign.refresh_from_db()
+        self.assertIsNone(foreign.mark)
+
+    def test_invalid_items_reject_the_batch(self):
+        own = Solution.objects.filter(task__lecture__course=self.course).first()
+        response = self.bulk_mark([{'id': own.pk, 'mark': 11}, {'id': own.pk, 'mark': 2}])
+        self.assertEqual(response.status_code, 400)
+
+
+class EnrollmentBatchTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.other_teacher = User.objects.create_user(email='other@example.com', password='x', full_name='O',
+                                                     role=User.RoleTypes.TEACHER)
+        cls.students = [
+            User.objects.create_user(email=f's{i}@example.com', password='x', full_name=f'S{i}',
+                                     role=User.RoleTypes.STUDENT)
+            for i in range(4)
+        ]
+        cls.course = Course.objects.create(name='Course', created_by=cls.teacher)
+        cls.foreign = Course.objects.create(name='Foreign', created_by=cls.other_teacher)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.teacher)
+
+    def test_bulk_approve_and_reject(self):
+        own = [Enrollment.objects.create(student=s, course=self.course) for s in self.students[:2]]
+        foreign = Enrollment.objects.create(student=self.students[0], course=self.foreign)
+        response = self.client.post('/api/courses/enrollments/bulk-approve/',
+                                    {'ids': [own[0].pk, own[1].pk, foreign.pk]}, format='json')
+        self.assertEqual(response.data, {'updated': [own[0].pk, own[1].pk], 'not_found': [foreign.pk]})
+        self.assertEqual(Enrollment.objects.filter(status=Enrollment.Status.APPROVED).count(), 2)
+
+        self.client.post('/api/courses/enrollments/bulk-reject/', {'ids': [own[1].pk]}, format='json')
+        own[1].refresh_from_db()
+        self.assertEqual(own[1].status, Enrollment.Status.REJECTED)
+
+    def test_bulk_import_skips_existing_pairs(self):
+        Enrollment.objects.create(student=self.students[0], course=self.course)
+        items = [{'student': s.pk, 'course': self.course.pk, 'status': 'approved'} for s in self.students]
+        items.append({'student': self.students[1].pk, 'course': self.foreign.pk})
+        items.append({'student': self.teacher.pk, 'course': self.course.pk})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/courses/enrollments/bulk-import/', {'enrollments': items},
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['requested'], response.data['created']), (6, 3))
+        self.assertEqual(len(response.data['rejected']), 2)
+        self.assertEqual(self.course.enrollments.count(), 4)
+        self.assertFalse(any('EXISTS' in q['sql'].upper() for q in ctx.captured_queries))
+
+
+class CourseAccessTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        cls.course = Course.objects.create(name='Course', created_by=cls.teacher)
+        cls.lecture = Lecture.objects.create(name='Lecture', course=cls.course)
+
+    def test_access_set_is_cached_and_invalidated(self):
+        self.assertEqual(accessible_course_ids(self.student), [])
+        with self.assertNumQueries(0):
+            accessible_course_ids(self.student)
+        enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        enrollment.status = Enrollment.Status.APPROVED
+        enrollment.save()
+        self.assertEqual(accessible_course_ids(self.student), [self.course.pk])
+
+        other = Course.objects.create(name='Other', created_by=self.teacher)
+        self.assertEqual(accessible_course_ids(self.teacher), [self.course.pk, other.pk])
+
+    def test_access_cached_before_commit_is_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=self.student, course=self.course, status=Enrollment.Status.APPROVED)
+            # A concurrent request does not see the enrollment yet and caches the old set.
+            with mock.patch('courses.access._course_ids_query', return_value=[]):
+                self.assertEqual(accessible_course_ids(self.student), [])
+        self.assertEqual(accessible_course_ids(self.student), [self.course.pk])
+
+    def test_bulk_approve_invalidates_access(self):
+        enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get('/api/courses/lectures/').data['results'], [])
+        self.client.force_authenticate(self.teacher)
+        self.client.post('/api/courses/enrollments/bulk-approve/', {'ids': [enrollment.pk]}, format='json')
+        self.client.force_authenticate(self.student)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/courses/lectures/')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.lecture.pk])
+        self.assertFalse(any('DISTINCT' in q['sql'] for q in ctx.captured_queries))
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['courses.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                                   'LOCATION': 'redis://localhost:6379/0'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+# Plan lines that mean a whole table is read, per database vendor.
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?! USING)'),
+}
+# A scan of the index with a bound on its leading column, i.e. a range scan.
+INDEX_RANGE = {
+    'postgresql': r'Index (?:Only )?Scan(?: Backward)? using {index} on \w+.*\n.*Index Cond: \(+{column} [<>]',
+    'sqlite': r'SEARCH \w+ USING (?:COVERING )?INDEX {index} \({column}[<>]',
+}
+
+
+class QueryPlanTests(CoursesTestCase):
+    """EXPLAIN the hot lookups against a seeded database and reject sequential scans."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(teachers=2, students=100, courses=2, lectures=5, tasks=3, enrollments=40)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.solution = Solution.objects.order_by('id')[50]
+        cls.enrollment = Enrollment.objects.order_by('id')[10]
+
+    def hot_queries(self):
+        solution, enrollment = self.solution, self.enrollment
+        return {
+            'latest submission': Solution.objects.filter(
+                task=solution.task_id, submitted_by=solution.submitted_by_id).order_by('-submitted_at')[:1],
+            'approved enrollments': Enrollment.objects.filter(
+                student=enrollment.student_id, status=Enrollment.Status.APPROVED).values_list('course_id'),
+            'ungraded solutions': Solution.objects.filter(task=solution.task_id, mark__isnull=True),
+            'solution comments': Comment.objects.filter(solution=solution.pk).order_by('created_at'),
+        }
+
+    def test_hot_queries_use_indexes(self):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f"No plan checks for {connection.vendor}")
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(pattern.search(plan), f"{name} falls back to a sequential scan:\n{plan}")
+
+    def test_keyset_pages_start_at_the_cursor(self):
+        pattern = INDEX_RANGE.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f"No plan checks for {connection.vendor}")
+        pages = [
+            (SubmittedAtPagination, Solution, 'solution_submitted_id_idx'),
+            (CreatedAtPagination, Comment, 'comment_created_id_idx'),
+            (RequestedAtPagination, Enrollment, 'enrollment_requested_id_idx'),
+        ]
+        for pagination_class, model, index in pages:
+            with self.subTest(model.__name__):
+                pagination = pagination_class()
+                column = pagination.ordering[0].lstrip('-')
+                row = model.objects.order_by('id')[len(pages) * 10]
+                position = f'{getattr(row, column).isoformat()}|{row.pk}'
+                for reverse in (False, True):
+                    ordering = _reverse_ordering(pagination.ordering) if reverse else pagination.ordering
+                    plan = model.objects.order_by(*ordering).filter(
+                        pagination._after(position, reverse))[:pagination.page_size + 1].explain()
+                    self.assertRegex(plan, pattern.format(index=index, column=column))
+
+
+class SubmissionStateTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        course = Course.objects.create(name='Course', created_by=cls.teacher)
+        Enrollment.objects.create(student=cls.student, course=course, status=Enrollment.Status.APPROVED)
+        lecture = Lecture.objects.create(name='Lecture', course=course)
+        cls.task = Task.objects.create(title='Task', description='d', lecture=lecture,
+                                       deadline=timezone.now() + timedelta(days=1))
+
+    def submit(self):
+        self.client.force_authenticate(self.student)
+        return self.client.post('/api/courses/solutions/', {'text': 'answer', 'task': self.task.pk}, format='json')
+
+    def test_next_submission_waits_for_grade(self):
+        first = self.submit()
+        self.assertEqual(first.status_code, 201)
+        state = TaskSubmissionState.objects.get(task=self.task, student=self.student)
+        self.assertEqual((state.latest_solution_id, state.graded), (first.data['id'], False))
+
+        self.assertEqual(self.submit().status_code, 400)
+
+        self.client.force_authenticate(self.teacher)
+        self.client.patch(f'/api/courses/solutions/{first.data["id"]}/', {'mark': 6}, format='json')
+        state.refresh_from_db()
+        self.assertTrue(state.graded)
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.submit()
+        self.assertEqual(second.status_code, 201)
+        self.assertFalse(any('ORDER BY' in q['sql'] and 'courses_solution' in q['sql']
+                             for q in ctx.captured_queries))
+        state.refresh_from_db()
+        self.assertEqual((state.latest_solution_id, state.graded), (second.data['id'], False))
+
+    def test_bulk_mark_updates_graded_flag(self):
+        solution_id = self.submit().data['id']
+        self.client.force_authenticate(self.teacher)
+        self.client.post('/api/courses/solutions/bulk-mark/', {'marks': [{'id': solution_id, 'mark': 9}]},
+                         format='json')
+        self.assertTrue(TaskSubmissionState.objects.get(latest_solution=solution_id).graded)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AttachmentDownloadTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                             role=User.RoleTypes.STUDENT)
+        cls.stranger = User.objects.create_user(email='o@example.com', password='x', full_name='O',
+                                                role=User.RoleTypes.STUDENT)
+        cls.attachment = Attachment.objects.create(file=ContentFile(b'0123456789', name='notes.txt'),
+                                                   uploaded_by=cls.owner)
+        cls.url = f'/api/courses/attachments/{cls.attachment.pk}/download/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=20-').status_code, 416)
+        invalid = self.client.get(self.url, HTTP_RANGE='bytes=5-3')
+        self.assertEqual((invalid.status_code, b''.join(invalid.streaming_content)), (200, b'0123456789'))
+
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_conditional_request(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_visibility_rules_apply(self):
+        self.client.force_authenticate(self.stranger)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(ATTACHMENT_SENDFILE_HEADER='X-Accel-Redirect', ATTACHMENT_SENDFILE_PREFIX='/protected/')
+    def test_sendfile_offload(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/plain')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.attachment.file.name)
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ChunkedUploadTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                             role=User.RoleTypes.STUDENT)
+        cls.stranger = User.objects.create_user(email='o@example.com', password='x', full_name='O',
+                                                role=User.RoleTypes.STUDENT)
+        cls.payload = bytes(range(256)) * 1024
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def start(self):
+        response = self.client.post('/api/courses/attachments/uploads/',
+                                    {'filename': 'video.bin', 'size': len(self.payload)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return f"/api/courses/attachments/uploads/{response.data['id']}/"
+
+    def append(self, url, offset, data):
+        return self.client.generic('POST', url, data, content_type='application/offset+octet-stream',
+                                   HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resumed_upload_becomes_attachment(self):
+        url = self.start()
+        half = len(self.payload) // 2
+        self.assertEqual(self.append(url, 0, self.payload[:half]).data['offset'], half)
+
+        # The next chunk lands on a worker that has no running digest.
+        uploads._digests.clear()
+        self.assertEqual(self.client.get(url).data['offset'], half)
+        self.assertEqual(self.append(url, half, self.payload[half:]).data['offset'], len(self.payload))
+
+        response = self.client.post(url + 'finalize/', {'sha256': hashlib.sha256(self.payload).hexdigest()},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get(pk=response.data['id'])
+        with attachment.file.open('rb') as file:
+            self.assertEqual(file.read(), self.payload)
+        self.assertEqual(attachment.uploaded_by, self.owner)
+
+    def test_failed_chunk_is_discarded_and_resumed(self):
+        url = self.start()
+        half = len(self.payload) // 2
+        self.append(url, 0, self.payload[:half])
+        upload = AttachmentUpload.objects.get()
+
+        class Disconnecting:
+            # One block arrives, then the client goes away.
+            def __init__(self, data):
+                self.data, self.calls = data, 0
+
+            def read(self, size):
+                self.calls += 1
+                if self.calls > 1:
+                    raise UnreadablePostError("connection reset")
+                return self.data[:size]
+
+        with self.assertRaises(UnreadablePostError):
+            uploads.append_chunk(upload, half, Disconnecting(b'\0' * half), half)
+        self.assertNotIn(upload.pk, uploads._digests)
+        self.assertEqual(self.client.get(url).data['offset'], half)
+
+        self.assertEqual(self.append(url, half, self.payload[half:]).data['offset'], len(self.payload))
+        response = self.client.post(url + 'finalize/', {'sha256': hashlib.sha256(self.payload).hexdigest()},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_stale_uploads_expire(self):
+        stale, fresh = self.start(), self.start()
+        self.append(stale, 0, self.payload[:100])
+        upload = AttachmentUpload.objects.get(pk=stale.split('/')[-2])
+        AttachmentUpload.objects.filter(pk=upload.pk).update(
+            created_at=timezone.now() - uploads.UPLOAD_EXPIRY - timedelta(seconds=1))
+        self.assertEqual(Job.objects.get().name, 'expire_uploads')
+
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(jobs.work(), 1)
+        self.assertEqual(self.client.get(stale).status_code, 404)
+        self.assertFalse(default_storage.exists(upload.partial_name))
+        self.assertNotIn(upload.pk, uploads._digests)
+        self.assertEqual(self.client.get(fresh).status_code, 200)
+        # Queued again for the upload that is left.
+        self.assertGreater(Job.objects.get().run_at, timezone.now() + uploads.UPLOAD_EXPIRY - timedelta(minutes=1))
+
+    def test_offset_mismatch_reports_current_offset(self):
+        url = self.start()
+        self.append(url, 0, self.payload[:100])
+        response = self.append(url, 50, self.payload[50:150])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 100)
+        self.assertEqual(self.append(url, 100, self.payload).status_code, 413)
+
+    def test_finalize_checks_size_and_checksum(self):
+        url = self.start()
+        self.append(url, 0, self.payload[:100])
+        self.assertEqual(self.client.post(url + 'finalize/', {}, format='json').status_code, 400)
+        self.append(url, 100, self.payload[100:])
+        response = self.client.post(url + 'finalize/', {'sha256': '0' * 64}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attachment.objects.exists())
+
+    def test_uploads_are_private(self):
+        url = self.start()
+        self.client.force_authenticate(self.stranger)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.append(url, 0, self.payload[:10]).status_code, 404)
+
+    def test_malformed_upload_id_is_not_found(self):
+        url = '/api/courses/attachments/uploads/abc/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.append(url, 0, self.payload[:10]).status_code, 404)
+        self.assertEqual(self.client.post(url + 'finalize/', {}, format='json').status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BlobStorageTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.student)
+
+    def upload(self, name, content):
+        response = self.client.post('/api/courses/attachments/', {'file': SimpleUploadedFile(name, content)},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Attachment.objects.get(pk=response.data['id'])
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload('slides.pdf', b'%PDF same deck')
+        second = self.upload('copy of slides.pdf', b'%PDF same deck')
+        other = self.upload('other.pdf', b'%PDF other deck')
+
+        self.assertEqual(first.blob, second.blob)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get(pk=first.blob_id).ref_count, 2)
+        self.assertNotEqual(other.blob, first.blob)
+        self.assertEqual(second.filename, 'copy of slides.pdf')
+
+        response = self.client.get(f'/api/courses/attachments/{second.pk}/download/')
+        self.assertIn('copy of slides.pdf', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF same deck')
+
+    def test_blob_is_collected_with_its_last_reference(self):
+        first = self.upload('a.pdf', b'shared')
+        second = self.upload('b.pdf', b'shared')
+        name = first.file.name
+
+        self.assertEqual(self.client.delete(f'/api/courses/attachments/{first.pk}/').status_code, 204)
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertFalse(Job.objects.exists())
+
+        self.client.delete(f'/api/courses/attachments/{second.pk}/')
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+        self.assertTrue(default_storage.exists(name))
+        call_command('runworker', '--once', stdout=StringIO())
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_content_stored_again_before_collection_keeps_its_file(self):
+        first = self.upload('a.pdf', b'again')
+        name = first.file.name
+        self.client.delete(f'/api/courses/attachments/{first.pk}/')
+        second = self.upload('b.pdf', b'again')
+        self.assertEqual(second.blob_id, first.blob_id)
+
+        call_command('runworker', '--once', stdout=StringIO())
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        # A collection that deleted the file but not the row: the next upload writes it again.
+        self.client.delete(f'/api/courses/attachments/{second.pk}/')
+        default_storage.delete(name)
+        third = self.upload('c.pdf', b'again')
+        with third.file.open('rb') as file:
+            self.assertEqual(file.read(), b'again')
+
+    def test_chunked_upload_reuses_existing_blob(self):
+        existing = self.upload('deck.pdf', b'0123456789')
+        response = self.client.post('/api/courses/attachments/uploads/', {'filename': 'deck.pdf', 'size': 10},
+                                    format='json')
+        url = f"/api/courses/attachments/uploads/{response.data['id']}/"
+        self.client.generic('POST', url, b'0123456789', content_type='application/offset+octet-stream',
+                            HTTP_UPLOAD_OFFSET='0')
+        attachment = Attachment.objects.get(pk=self.client.post(url + 'finalize/', {}, format='json').data['id'])
+        self.assertEqual(attachment.blob, existing.blob)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    def test_legacy_attachments_are_moved_into_blobs(self):
+        legacy = [
+            Attachment.objects.create(file=ContentFile(b'old deck', name='deck.pdf'), uploaded_by=self.student)
+            for _ in range(2)
+        ]
+        old_names = [attachment.file.name for attachment in legacy]
+        call_command('dedupe_attachments', stdout=StringIO())
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        for attachment, old_name in zip(legacy, old_names):
+            attachment.refresh_from_db()
+            self.assertEqual(attachment.blob, blob)
+            self.assertEqual(attachment.filename, old_name.rsplit('/', 1)[-1])
+            self.assertFalse(default_storage.exists(old_name))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class JobQueueTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        cls.course = seed_course(cls.teacher, [cls.student], lectures=1, tasks=2)
+
+    def test_enrollment_grades_are_recomputed_by_the_worker(self):
+        # Re-enrolling brings back the marks of the earlier enrollment's solutions.
+        Enrollment.objects.all().delete()
+        self.client.force_authenticate(self.teacher)
+        response = self.client.post('/api/courses/enrollments/',
+                                    {'student': self.student.pk, 'course': self.course.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Job.objects.get().dedupe_key, f"grades:enrollment:{response.data['id']}")
+
+        self.assertEqual(jobs.work(), 1)
+        enrollment = Enrollment.objects.get()
+        self.assertEqual((enrollment.mark_sum, enrollment.mark_count, enrollment.average_grade), (14, 2, 7.0))
+        self.assertFalse(Job.objects.exists())
+
+    def test_waiting_jobs_coalesce_but_running_ones_do_not(self):
+        for _ in range(3):
+            jobs.recompute_grades_later(course=self.course.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+        claimed, = jobs.claim()
+        jobs.recompute_grades_later(course=self.course.pk)
+        self.assertEqual(Job.objects.filter(status=Job.Status.QUEUED).count(), 1)
+        self.assertTrue(jobs.run(claimed))
+        self.assertEqual(jobs.work(), 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_jobs_retry_with_backoff(self):
+        calls = []
+
+        @jobs.register('flaky')
+        def flaky(n):
+            calls.append(n)
+            raise RuntimeError("storage is down")
+
+        self.addCleanup(jobs.HANDLERS.pop, 'flaky')
+        jobs.enqueue('flaky', {'n': 1})
+        delays = []
+        for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+            Job.objects.update(run_at=timezone.now())
+            self.assertEqual(jobs.work(), 1)
+            job = Job.objects.get()
+            delays.append(job.run_at - timezone.now())
+        self.assertEqual(calls, [1] * jobs.MAX_ATTEMPTS)
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, jobs.MAX_ATTEMPTS))
+        self.assertIn("storage is down", job.last_error)
+        self.assertGreater(delays[1], delays[0] * 1.5)
+        self.assertEqual(jobs.work(), 0)
+
+
+class GradebookTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.ann = User.objects.create_user(email='ann@example.com', password='x', full_name='Ann',
+                                           role=User.RoleTypes.STUDENT)
+        cls.bob = User.objects.create_user(email='bob@example.com', password='x', full_name='=Bob',
+                                           role=User.RoleTypes.STUDENT)
+        pending = User.objects.create_user(email='p@example.com', password='x', full_name='P',
+                                           role=User.RoleTypes.STUDENT)
+        cls.course = Course.objects.create(name='Course', created_by=cls.teacher)
+        for student in (cls.ann, cls.bob):
+            Enrollment.objects.create(student=student, course=cls.course, status=Enrollment.Status.APPROVED)
+        Enrollment.objects.create(student=pending, course=cls.course)
+
+        deadline = timezone.now() + timedelta(days=1)
+        cls.tasks = [
+            Task.objects.create(title=f'Task {i}', description='d', deadline=deadline,
+                                lecture=Lecture.objects.create(name=f'Lecture {i}', course=cls.course))
+            for i in range(2)
+        ]
+        for student, task, mark in [(cls.ann, cls.tasks[0], 4), (cls.ann, cls.tasks[0], 8),
+                                    (cls.ann, cls.tasks[1], None), (cls.bob, cls.tasks[1], 6),
+                                    (pending, cls.tasks[0], 5)]:
+            solution = Solution.objects.create(text='answer', task=task, submitted_by=student, mark=mark)
+            TaskSubmissionState.objects.update_or_create(
+                task=task, student=student, defaults={'latest_solution': solution, 'graded': mark is not None})
+        Enrollment.objects.filter(course=cls.course).recompute_grades()
+
+    def test_csv_export(self):
+        self.client.force_authenticate(self.teacher)
+        response = self.client.get(f'/api/courses/courses/{self.course.pk}/gradebook.csv/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['student_id', 'email', 'full_name', 'Lecture 0 / Task 0', 'Lecture 1 / Task 1',
+                                   'average_grade'])
+        self.assertEqual(rows[1:], [
+            [str(self.ann.pk), 'ann@example.com', 'Ann', '8', '', '6.0'],
+            [str(self.bob.pk), 'bob@example.com', "'=Bob", '', '6', '6.0'],
+        ])
+
+    def test_matrix_and_statistics(self):
+        self.client.force_authenticate(self.teacher)
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/courses/courses/{self.course.pk}/grade-matrix/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertEqual([student['id'] for student in data['students']], [self.ann.pk, self.bob.pk])
+        self.assertEqual([task['id'] for task in data['tasks']], [task.pk for task in self.tasks])
+        self.assertEqual(data['marks'], [[8, None], [None, 6]])
+
+        first, second = data['tasks']
+        self.assertEqual((first['mean'], first['stddev'], first['submission_rate'], first['graded']),
+                         (8.0, 0.0, 0.5, 1))
+        self.assertEqual((second['median'], second['submission_rate'], second['graded']), (6.0, 1.0, 1))
+        ann = data['students'][0]
+        self.assertEqual((ann['mean'], ann['submission_rate'], ann['graded'], ann['average_grade']),
+                         (8.0, 1.0, 1, 6.0))
+
+    def test_deleted_solution_is_not_a_submission(self):
+        Solution.objects.get(submitted_by=self.bob).delete()
+        self.client.force_authenticate(self.teacher)
+        data = self.client.get(f'/api/courses/courses/{self.course.pk}/grade-matrix/').json()
+        self.assertEqual(data['marks'], [[8, None], [None, None]])
+        self.assertEqual((data['tasks'][1]['submission_rate'], data['students'][1]['submission_rate']), (0.5, 0.0))
+
+        response = self.client.get(f'/api/courses/courses/{self.course.pk}/gradebook.csv/')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[2][3:5], ['', ''])
+
+    def test_empty_course_matrix(self):
+        course = Course.objects.create(name='Empty', created_by=self.teacher)
+        self.client.force_authenticate(self.teacher)
+        data = self.client.get(f'/api/courses/courses/{course.pk}/grade-matrix/').json()
+        self.assertEqual(data, {'tasks': [], 'students': [], 'marks': []})
+
+    def test_only_course_teacher_can_export(self):
+        other = User.objects.create_user(email='other@example.com', password='x', full_name='O',
+                                         role=User.RoleTypes.TEACHER)
+        for user in (other, self.ann):
+            self.client.force_authenticate(user)
+            for path in ('grade-matrix', 'gradebook.csv'):
+                response = self.client.get(f'/api/courses/courses/{self.course.pk}/{path}/')
+                self.assertEqual(response.status_code, 403)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RESPONSE_CACHE_TIMEOUT=0)
+class ConditionalGetTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        cls.course = seed_course(cls.teacher, [cls.student], lectures=2, tasks=1)
+        Enrollment.objects.filter(course=cls.course).recompute_grades()
+        cls.lecture = cls.course.lectures.first()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.teacher)
+
+    def assertRevalidates(self, url, change):
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Content versions are bumped once the change commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_course_detail(self):
+        url = f'/api/courses/courses/{self.course.pk}/'
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        task = Task.objects.filter(lecture__course=self.course).first()
+        self.assertRevalidates(url, lambda: Task.objects.filter(pk=task.pk).first().save())
+        self.assertRevalidates(url, lambda: Comment.objects.filter(solution__task=task).delete())
+        self.assertRevalidates(url, lambda: self.lecture.attachments.clear())
+
+    def test_course_detail_after_bulk_mark(self):
+        solution = Solution.objects.filter(task__lecture__course=self.course).first()
+        self.assertRevalidates(f'/api/courses/courses/{self.course.pk}/', lambda: self.client.post(
+            '/api/courses/solutions/bulk-mark/', {'marks': [{'id': solution.pk, 'mark': 3}]}, format='json'))
+
+    def test_lecture_detail_and_lists(self):
+        self.assertRevalidates(f'/api/courses/lectures/{self.lecture.pk}/',
+                               lambda: Attachment.objects.filter(lectures=self.lecture).delete())
+        self.assertRevalidates('/api/courses/lectures/', lambda: self.lecture.delete())
+        self.assertRevalidates('/api/courses/courses/',
+                               lambda: Course.objects.create(name='Another', created_by=self.teacher))
+
+    def test_unknown_object_is_not_found(self):
+        self.assertEqual(self.client.get('/api/courses/courses/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/courses/courses/abc/').status_code, 404)
+        self.assertEqual(self.client.get('/api/courses/lectures/abc/').status_code, 404)
+
+    def test_comments_bump_the_version_after_commit(self):
+        solution = Solution.objects.filter(task__lecture__course=self.course).first()
+        version = CourseVersion.objects.get(course=self.course).version
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post('/api/courses/comments/', {'solution': solution.pk, 'text': 'hi'},
+                                            format='json')
+            self.assertEqual(response.status_code, 201)
+            # Nothing in the request's transaction writes to the course or its version.
+            self.assertFalse(any(q['sql'].startswith('UPDATE') for q in ctx.captured_queries))
+        self.assertEqual(CourseVersion.objects.get(course=self.course).version, version + 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ResponseCacheTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        cls.outsider = User.objects.create_user(email='o@example.com', password='x', full_name='O',
+                                                role=User.RoleTypes.STUDENT)
+        cls.course = seed_course(cls.teacher, [cls.student], lectures=2, tasks=1)
+        cls.other = seed_course(cls.teacher, [cls.outsider], lectures=1, tasks=1, name='Other')
+        cls.lecture = cls.course.lectures.first()
+
+    def get(self, url, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(url)
+        return response.status_code, response.get('X-Cache')
+
+    def test_hits_skip_the_database(self):
+        url = f'/api/courses/courses/{self.course.pk}/'
+        self.assertEqual(self.get(url, self.teacher), (200, 'MISS'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(url, self.teacher), (200, 'HIT'))
+
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_signals_invalidate_affected_entries(self):
+        course_url = f'/api/courses/courses/{self.course.pk}/'
+        other_url = f'/api/courses/courses/{self.other.pk}/'
+        lecture_url = f'/api/courses/lectures/{self.lecture.pk}/'
+        changes = [
+            lambda: Task.objects.filter(lecture=self.lecture).first().save(),
+            lambda: self.lecture.attachments.add(Attachment.objects.create(file='attachments/new.pdf',
+                                                                           uploaded_by=self.teacher)),
+            lambda: Attachment.objects.filter(lectures=self.lecture).first().delete(),
+            lambda: Course.objects.get(pk=self.course.pk).save(),
+        ]
+        for change in changes:
+            for url in (course_url, other_url, lecture_url):
+                self.get(url, self.teacher)
+            change()
+            self.assertEqual(self.get(course_url, self.teacher), (200, 'MISS'))
+            self.assertEqual(self.get(lecture_url, self.teacher), (200, 'MISS'))
+            self.assertEqual(self.get(other_url, self.teacher), (200, 'HIT'))
+
+    def test_entries_respect_visibility(self):
+        lecture_url = f'/api/courses/lectures/{self.lecture.pk}/'
+        self.assertEqual(self.get(lecture_url, self.student), (200, 'MISS'))
+        self.assertEqual(self.get(lecture_url, self.student), (200, 'HIT'))
+        self.assertEqual(self.get(lecture_url, self.outsider)[0], 404)
+
+        self.get('/api/courses/lectures/', self.student)
+        self.client.force_authenticate(self.outsider)
+        response = self.client.get('/api/courses/lectures/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([lecture['course'] for lecture in response.data['results']], [self.other.pk])
+
+        # Approving an enrollment changes the set of courses the list is keyed by.
+        Enrollment.objects.create(student=self.outsider, course=self.course, status=Enrollment.Status.APPROVED)
+        self.assertEqual(len(self.client.get('/api/courses/lectures/').data['results']), 3)
+
+    def test_lecture_lists_follow_only_their_courses(self):
+        url = '/api/courses/lectures/'
+        self.assertEqual(self.get(url, self.student), (200, 'MISS'))
+        Comment.objects.create(text='elsewhere', solution=Solution.objects.filter(task__lecture__course=self.other)
+                               .first(), author=self.teacher)
+        self.assertEqual(self.get(url, self.student), (200, 'HIT'))
+        Comment.objects.create(text='here', solution=Solution.objects.filter(task__lecture__course=self.course)
+                               .first(), author=self.teacher)
+        self.assertEqual(self.get(url, self.student), (200, 'MISS'))
+
+        staff = User.objects.create_user(email='staff@example.com', password='x', full_name='A',
+                                         role=User.RoleTypes.TEACHER, is_staff=True)
+        self.get(url, staff)
+        self.assertEqual(self.get(url, staff), (200, None))
+
+    def test_file_based_backend(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': location}}
+        with self.settings(CACHES=caches):
+            url = f'/api/courses/courses/{self.course.pk}/'
+            self.assertEqual(self.get(url, self.teacher), (200, 'MISS'))
+            self.assertEqual(self.get(url, self.teacher), (200, 'HIT'))
+            self.lecture.save()
+            self.assertEqual(self.get(url, self.teacher), (200, 'MISS'))
+
+    def test_stats_are_staff_only(self):
+        url = f'/api/courses/courses/{self.course.pk}/'
+        self.get(url, self.teacher)
+        self.get(url, self.teacher)
+        self.assertEqual(self.get('/api/courses/courses/cache-stats/', self.teacher)[0], 403)
+
+        staff = User.objects.create_user(email='staff@example.com', password='x', full_name='A',
+                                         role=User.RoleTypes.TEACHER, is_staff=True)
+        self.client.force_authenticate(staff)
+        self.assertEqual(self.client.get('/api/courses/courses/cache-stats/').data,
+                         {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class FastListTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='Tëacher 😀',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='student@example.com', password='x',
+                                               full_name='Line\u2028separator "quoted" \x01',
+                                               role=User.RoleTypes.STUDENT)
+        for i in range(5):
+            course = Course.objects.create(name=f'Kurs {i} ✓', created_by=cls.teacher)
+            enrollment = Enrollment.objects.create(student=cls.student, course=course)
+        Enrollment.objects.filter(pk=enrollment.pk).update(average_grade=20 / 3)
+
+    def get_both(self, url):
+        self.client.force_authenticate(self.teacher)
+        with mock.patch.object(CourseViewSet, 'fast_list', False), \
+                mock.patch.object(EnrollmentViewSet, 'fast_list', False):
+            expected = self.client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            actual = self.client.get(url)
+        self.assertEqual(actual.status_code, 200)
+        return expected, actual, len(ctx.captured_queries)
+
+    def test_fast_lists_are_byte_identical(self):
+        for url in ['/api/courses/courses/?page_size=2', '/api/courses/enrollments/?page_size=2']:
+            pages = 0
+            while url:
+                expected, actual, _ = self.get_both(url)
+                self.assertEqual(actual.content, expected.content, url)
+                url = actual.json()['next']
+                pages += 1
+            self.assertEqual(pages, 3)
+
+    def test_fast_enrollment_list_is_a_single_query(self):
+        _, actual, queries = self.get_both('/api/courses/enrollments/')
+        self.assertEqual(queries, 1)
+        self.assertIn(b'\\u2028', actual.content)
+        self.assertEqual(actual.json()['results'][0]['average_grade'], 20 / 3)
+
+    def test_floats_orjson_prints_differently_fall_back(self):
+        Enrollment.objects.update(average_grade=1e-05)
+        expected, actual, _ = self.get_both('/api/courses/enrollments/')
+        self.assertEqual(actual.content, expected.content)
+        self.assertIn(b'1e-05', actual.content)
+
+    def test_sparse_fieldsets_and_indent_use_the_regular_path(self):
+        for url in ['/api/courses/enrollments/?fields=id,course.name', '/api/courses/courses/?expand=lectures']:
+            expected, actual, _ = self.get_both(url)
+            self.assertEqual(actual.content, expected.content, url)
+        self.client.force_authenticate(self.teacher)
+        response = self.client.get('/api/courses/courses/', HTTP_ACCEPT='application/json; indent=2')
+        self.assertTrue(response.content.startswith(b'{\n  "next"'))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RESPONSE_CACHE_TIMEOUT=0)
+class AsyncReadTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='student@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        cls.course = seed_course(cls.teacher, [cls.student], lectures=3, tasks=2)
+        cls.other = seed_course(cls.teacher, [], lectures=1, tasks=1, name='Other')
+
+    def get(self, url, user, **headers):
+        self.client.force_authenticate(user)
+        sync = self.client.get(url)
+        self.client.force_authenticate(None)
+        token = UserAccessToken.for_user(user)
+        response = self.client.get(url.replace('/api/courses/', '/api/courses/async/', 1),
+                                   HTTP_AUTHORIZATION=f'Bearer {token}', **headers)
+        return sync, response
+
+    def test_async_views_render_like_the_viewsets(self):
+        lecture = self.course.lectures.first()
+        for url in ['/api/courses/courses/', f'/api/courses/courses/{self.course.pk}/',
+                    '/api/courses/lectures/?page_size=2', f'/api/courses/lectures/{lecture.pk}/',
+                    '/api/courses/tasks/?page_size=4', f'/api/courses/tasks/{lecture.tasks.first().pk}/']:
+            sync, response = self.get(url, self.student)
+            self.assertEqual(response.status_code, 200, url)
+            # Pagination links point back to the async views.
+            self.assertEqual(response.content.replace(b'/async/', b'/'), sync.content, url)
+
+    def test_async_views_follow_course_access(self):
+        lecture = self.other.lectures.first()
+        sync, response = self.get(f'/api/courses/lectures/{lecture.pk}/', self.student)
+        self.assertEqual((sync.status_code, response.status_code), (404, 404))
+        _, response = self.get('/api/courses/tasks/', self.student)
+        self.assertEqual(len(response.json()['results']), 6)
+
+    def test_async_views_answer_conditional_requests(self):
+        url = f'/api/courses/courses/{self.course.pk}/'
+        _, response = self.get(url, self.teacher)
+        _, response = self.get(url, self.teacher, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_async_views_require_a_token(self):
+        response = self.client.get('/api/courses/async/courses/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        response = self.client.get('/api/accounts/async/profile/', HTTP_AUTHORIZATION='Bearer nonsense')
+        self.assertEqual((response.status_code, response.json()['code']), (401, 'token_not_valid'))
+
+    def test_views_without_a_handler_answer_405(self):
+        view = AsyncAuthenticatedView.as_view()
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {UserAccessToken.for_user(self.student)}')
+        response = async_to_sync(view)(request)
+        self.assertEqual(response.status_code, 405)
+
+    def test_async_profile(self):
+        for token_class in (AccessToken, UserAccessToken):
+            token = token_class.for_user(self.student)
+            response = self.client.get('/api/accounts/async/profile/', HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(response.json(), {'id': self.student.pk, 'email': 'student@example.com',
+                                               'full_name': 'S', 'role': 'student'})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RESPONSE_CACHE_TIMEOUT=0)
+class ClaimsTokenTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='student@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        seed_course(cls.teacher, [cls.student], lectures=1, tasks=1)
+
+    def authorize(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_token_endpoints_sign_the_claims(self):
+        response = self.client.post('/api/token/', {'email': 'student@example.com', 'password': 'x'})
+        claims = UserAccessToken(response.json()['access'])
+        self.assertEqual((claims['role'], claims['is_staff'], claims['full_name']), ('student', False, 'S'))
+
+        User.objects.filter(pk=self.student.pk).update(full_name='Renamed')
+        response = self.client.post('/api/token/refresh/', {'refresh': response.json()['refresh']})
+        self.assertEqual(UserAccessToken(response.json()['access'])['full_name'], 'Renamed')
+
+    def test_claims_token_skips_the_user_query(self):
+        counts = []
+        for token in (AccessToken.for_user(self.student), UserAccessToken.for_user(self.student)):
+            self.authorize(token)
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/api/courses/lectures/')
+            self.assertEqual(len(response.json()['results']), 1)
+            counts.append(len(ctx))
+        self.assertEqual(counts[1], counts[0] - 1)
+
+    def test_other_fields_load_on_access(self):
+        self.authorize(UserAccessToken.for_user(self.student))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/accounts/profile/')
+        self.assertEqual(response.json()['email'], 'student@example.com')
+        self.assertEqual(len(ctx), 1)
+
+        self.authorize(UserAccessToken.for_user(self.teacher))
+        response = self.client.post('/api/courses/courses/', {'name': 'New'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Course.objects.get(name='New').created_by, self.teacher)
+
+    def test_saving_the_user_revokes_the_claims(self):
+        staff = User.objects.create_user(email='staff@example.com', password='x', full_name='A',
+                                         role=User.RoleTypes.TEACHER, is_staff=True)
+        token = UserAccessToken.for_user(staff)
+        staff.is_staff = False
+        staff.save()
+        user = ClaimsJWTAuthentication().get_user(token)
+        self.assertNotIsInstance(user, ClaimsUser)
+        self.assertFalse(user.is_staff)
+
+        token = UserAccessToken.for_user(self.student)
+        self.authorize(token)
+        self.student.is_active = False
+        self.student.save()
+        self.assertEqual(self.client.get('/api/courses/lectures/').status_code, 401)
+        with self.assertRaises(AuthenticationFailed):
+            async_to_sync(AsyncJWTAuthentication().aget_user)(token)
+
+    def test_claims_user(self):
+        user = ClaimsJWTAuthentication().get_user(UserAccessToken.for_user(self.teacher))
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.pk, user.role, user.is_staff), (self.teacher.pk, 'teacher', False))
+        self.assertEqual(user, self.teacher)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class WriteAuthorizationTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher, cls.other_teacher = [
+            User.objects.create_user(email=f't{i}@example.com', password='x', full_name='T',
+                                     role=User.RoleTypes.TEACHER)
+            for i in range(2)
+        ]
+        cls.owner, cls.peer, cls.pending, cls.stranger = [
+            User.objects.create_user(email=f's{i}@example.com', password='x', full_name='S',
+                                     role=User.RoleTypes.STUDENT)
+            for i in range(4)
+        ]
+        cls.course = seed_course(cls.teacher, [cls.owner, cls.peer], lectures=1, tasks=2)
+        Enrollment.objects.create(student=cls.pending, course=cls.course)
+        cls.solution = Solution.objects.filter(submitted_by=cls.owner).first()
+        cls.task = Task.objects.exclude(pk=cls.solution.task_id).get()
+
+    def post(self, user, url, data):
+        self.client.force_authenticate(user)
+        return self.client.post(url, data, format='json')
+
+    def test_comment_query_budget(self):
+        for user in (self.teacher, self.owner, self.peer):
+            # The solution with its course access, the insert and the course lookup for the content
+            # version, which is bumped after commit.
+            with self.assertNumQueries(3):
+                response = self.post(user, '/api/courses/comments/', {'solution': self.solution.pk, 'text': 'hi'})
+            self.assertEqual(response.status_code, 201)
+
+    def test_comment_permissions(self):
+        for user, message in [(self.other_teacher, "Only teacher of this course can comment."),
+                              (self.pending, "Your enrollment is not approved; you cannot comment."),
+                              (self.stranger, "You are not enrolled in this course.")]:
+            response = self.post(user, '/api/courses/comments/', {'solution': self.solution.pk, 'text': 'hi'})
+            self.assertEqual((response.status_code, response.json()['detail']), (403, message))
+
+    def test_solution_query_budget(self):
+        # The task with its course access, the ungraded check, the locked submission state (get_or_create in a
+        # savepoint: 5), the insert, the course lookup for the version bump (run after commit), the state update,
+        # the release and the attachments.
+        with self.assertNumQueries(12):
+            response = self.post(self.peer, '/api/courses/solutions/', {'task': self.task.pk, 'text': 'a'})
+        self.assertEqual(response.status_code, 201)
+
+        for user, message in [(self.pending, "Your enrollment is not approved; you cannot submit solutions."),
+                              (self.stranger, "You are not enrolled in this course.")]:
+            response = self.post(user, '/api/courses/solutions/', {'task': self.task.pk, 'text': 'a'})
+            self.assertEqual((response.status_code, response.json()['detail']), (403, message))
+
+
+class SearchTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='student@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        cls.course = Course.objects.create(name='Algorithms', created_by=cls.teacher)
+        cls.hidden = Course.objects.create(name='Hidden', created_by=cls.teacher)
+        Enrollment.objects.create(student=cls.student, course=cls.course, status=Enrollment.Status.APPROVED)
+        cls.trees = Lecture.objects.create(name='Binary trees', text='Balancing and rotations.', course=cls.course)
+        cls.graphs = Lecture.objects.create(name='Graphs', text='Shortest paths; trees as graphs.', course=cls.course)
+        Lecture.objects.create(name='Binary trees again', text='Hidden course.', course=cls.hidden)
+        cls.task = Task.objects.create(title='Rotate a tree', description='Implement rotations.',
+                                       deadline=timezone.now() + timedelta(days=1), lecture=cls.trees)
+
+    def search(self, user=None, **params):
+        self.client.force_authenticate(user or self.student)
+        response = self.client.get('/api/courses/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['id']) for result in response.json()]
+
+    def test_ranked_and_visible(self):
+        # A match in the name ranks above a match in the text; the hidden course is left out.
+        self.assertEqual(self.search(q='trees', type='lecture'),
+                         [('lecture', self.trees.pk), ('lecture', self.graphs.pk)])
+        self.assertEqual(len(self.search(self.teacher, q='binary trees')), 2)
+        # Words are stemmed and must all match.
+        self.assertEqual(sorted(self.search(q='rotating')), [('lecture', self.trees.pk), ('task', self.task.pk)])
+        self.assertEqual(self.search(q='binary paths'), [])
+
+    def test_ranks_are_scaled_per_type(self):
+        self.client.force_authenticate(self.student)
+        results = self.client.get('/api/courses/search/', {'q': 'trees rotations'}).json()
+        self.assertEqual([(result['type'], result['rank']) for result in results], [('lecture', 1.0), ('task', 1.0)])
+        ranks = [result['rank'] for result in self.client.get('/api/courses/search/', {'q': 'trees'}).json()]
+        self.assertEqual(ranks[0], 1.0)
+        self.assertTrue(all(0 < rank <= 1 for rank in ranks))
+
+    def test_index_follows_changes(self):
+        Lecture.objects.filter(pk=self.graphs.pk).update(text='Dijkstra')
+        self.assertEqual(self.search(q='trees', type='lecture'), [('lecture', self.trees.pk)])
+        self.task.delete()
+        self.assertEqual(self.search(q='rotations', type='task'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search(q='"trees*', type='lecture'),
+                         [('lecture', self.trees.pk), ('lecture', self.graphs.pk)])
+        self.assertEqual(self.search(q='trees OR nothing'), [])
+        self.assertEqual(self.search(q='*'), [])
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get('/api/courses/search/').status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CommentFeedTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student, cls.stranger = [
+            User.objects.create_user(email=f's{i}@example.com', password='x', full_name='S',
+                                     role=User.RoleTypes.STUDENT)
+            for i in range(2)
+        ]
+        cls.course = seed_course(cls.teacher, [cls.student], lectures=1, tasks=2)
+        cls.solution, cls.other = Solution.objects.order_by('pk')
+
+    def comment(self, solution=None, text='new'):
+        return Comment.objects.create(text=text, solution=solution or self.solution, author=self.teacher)
+
+    def feed(self, user=None, **params):
+        self.client.force_authenticate(user or self.student)
+        return self.client.get('/api/courses/comments/feed/', params)
+
+    def test_since_returns_only_new_comments(self):
+        data = self.feed(solution=self.solution.pk).json()
+        self.assertEqual([comment['text'] for comment in data['results']], ['ok'])
+        first, second = self.comment(text='first'), self.comment(text='second')
+        self.comment(solution=self.other)
+
+        with self.assertNumQueries(2):
+            data = self.feed(solution=self.solution.pk, since=data['cursor']).json()
+        self.assertEqual([comment['id'] for comment in data['results']], [first.pk, second.pk])
+        self.assertEqual(data['cursor'], feeds.format_cursor(second))
+        data = self.feed(solution=self.solution.pk, since=data['cursor']).json()
+        self.assertEqual((data['results'], data['cursor'], data['has_more']), ([], feeds.format_cursor(second), False))
+
+        data = self.feed(course=self.course.pk, since=feeds.format_cursor(first)).json()
+        self.assertEqual(len(data['results']), 2)
+
+    def test_access_and_validation(self):
+        self.assertEqual(self.feed(self.stranger, solution=self.solution.pk).status_code, 403)
+        self.assertEqual(self.feed(self.stranger, course=self.course.pk).status_code, 403)
+        self.assertEqual(self.feed(course=0).status_code, 404)
+        self.assertEqual(self.feed(course=self.course.pk, solution=self.solution.pk).status_code, 400)
+        self.assertEqual(self.feed(course=self.course.pk, since='yesterday').status_code, 400)
+        self.assertEqual(self.feed(course=self.course.pk, since='2020-13-45T00:00:00|1').status_code, 400)
+
+    async def test_hub_serves_all_streams_with_one_query(self):
+        hub = feeds.get_hub()
+        by_solution = hub.subscribe(feeds.Topic(solution_id=self.solution.pk))
+        by_course = hub.subscribe(feeds.Topic(course_id=self.course.pk))
+        unrelated = hub.subscribe(feeds.Topic(course_id=0))
+        comment = await sync_to_async(self.comment)()
+
+        ctx = CaptureQueriesContext(connection)
+        await sync_to_async(ctx.__enter__)()
+        await hub.poll()
+        await hub.poll()
+        await sync_to_async(ctx.__exit__)(None, None, None)
+        self.assertEqual(await sync_to_async(len)(ctx), 2)
+        for subscription, expected in ((by_solution, 1), (by_course, 1), (unrelated, 0)):
+            self.assertEqual(subscription.queue.qsize(), expected)
+        pk, event = by_solution.queue.get_nowait()
+        self.assertEqual(pk, comment.pk)
+        self.assertIn(f'id: {feeds.format_cursor(comment)}\nevent: comment\n'.encode(), event)
+
+        for subscription in (by_solution, by_course, unrelated):
+            subscription.close()
+        await hub.task
+
+    async def test_stream_replays_then_follows(self):
+        first = await sync_to_async(self.comment)(text='first')
+        stream = feeds.stream_comments(feeds.Topic(solution_id=self.solution.pk), (first.created_at, first.pk))
+        await sync_to_async(self.comment)(text='second')
+        self.assertIn(b'"text":"second"', await anext(stream))
+
+        # The hub also finds "second", which the stream has sent already.
+        await sync_to_async(self.comment)(text='third')
+        feeds.get_hub().notify()
+        self.assertIn(b'"text":"third"', await asyncio.wait_for(anext(stream), 5))
+        await stream.aclose()
+        await feeds.get_hub().task
+
+    async def test_stream_ends_when_access_is_lost(self):
+        stream = feeds.stream_comments(feeds.Topic(course_id=self.course.pk), None, self.student, keepalive=0.05)
+        self.assertEqual(await asyncio.wait_for(anext(stream), 5), b': keepalive\n\n')
+
+        def reject():
+            with self.captureOnCommitCallbacks(execute=True):
+                enrollment = Enrollment.objects.get(student=self.student)
+                enrollment.status = Enrollment.Status.REJECTED
+                enrollment.save()
+
+        await sync_to_async(reject)()
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(anext(stream), 5)
+        await feeds.get_hub().task
+
+    async def test_stream_view(self):
+        token = UserAccessToken.for_user(self.student)
+        client = AsyncClient()
+
+        def stream(params, **headers):
+            return client.get('/api/courses/async/comments/stream/', params,
+                              headers={'Authorization': f'Bearer {token}', **headers})
+
+        self.assertEqual((await stream({'course': 0})).status_code, 404)
+        self.assertEqual((await stream({'course': self.course.pk}, last_event_id='yesterday')).status_code, 400)
+        response = await stream({'course': self.course.pk}, last_event_id='2020-13-45T00:00:00|1')
+        self.assertEqual(response.status_code, 400)
+
+        first = await sync_to_async(self.comment)(text='first')
+        response = await stream({'solution': self.solution.pk}, last_event_id=feeds.format_cursor(first))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/event-stream'))
+        await sync_to_async(self.comment)(text='second')
+        self.assertIn(b'"text":"second"', await anext(aiter(response.streaming_content)))
+        hub = feeds.get_hub()
+        for subscription in list(hub.subscriptions):
+            subscription.close()
+        await hub.task
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, SERVER_TIMING_HEADER=True)
+class ServerTimingTests(CoursesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(email='teacher@example.com', password='x', full_name='T',
+                                               role=User.RoleTypes.TEACHER)
+        cls.student = User.objects.create_user(email='s@example.com', password='x', full_name='S',
+                                               role=User.RoleTypes.STUDENT)
+        cls.staff = User.objects.create_user(email='staff@example.com', password='x', full_name='A',
+                                             role=User.RoleTypes.TEACHER, is_staff=True)
+        seed_course(cls.teacher, [cls.student], lectures=2, tasks=2)
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+
+    def test_header_reports_queries_and_phases(self):
+        self.client.force_authenticate(self.student)
+        with CaptureQueriesContext(connection) as ctx:
+            # ?fields= takes the serializer rather than the fast list path.
+            response = self.client.get('/api/courses/courses/', {'fields': 'id,name'})
+        timings = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        self.assertEqual(list(timings), list(metrics.PHASES))
+        self.assertIn(f'desc="{len(ctx)} queries"', timings['db'])
+        for phase in ('db', 'permissions', 'serialize', 'render', 'total'):
+            self.assertGreater(metrics.registry.durations['CourseViewSet.list', phase].sum, 0)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_is_opt_in(self):
+        self.client.force_authenticate(self.student)
+        response = self.client.get('/api/courses/courses/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.registry.durations['CourseViewSet.list', 'total'].count, 1)
+
+    def test_metrics_are_staff_only_and_labelled_by_action(self):
+        self.client.force_authenticate(self.student)
+        for _ in range(3):
+            self.client.get('/api/courses/courses/')
+        self.client.get('/api/courses/lectures/')
+        response = self.client.get('/api/_metrics')
+        self.assertEqual((response.status_code, response['Content-Type']), (403, 'application/json'))
+        self.assertEqual(json.loads(response.content), {'detail': 'You do not have permission to perform this action.'})
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/_metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('http_request_duration_seconds_bucket{view="CourseViewSet.list",phase="total",le="+Inf"} 3',
+                      text)
+        self.assertIn('http_request_db_queries_count{view="LectureViewSet.list"} 1', text)
+
+
+class BenchmarkCommandTests(CoursesTestCase):
+    def test_seed_bench_then_bench_endpoints(self):
+        call_command('seed_bench', '--teachers', '1', '--students', '5', '--courses', '1', '--lectures', '2',
+                     '--tasks', '2', '--enrollments', '3', '--solution-rate', '1', stdout=StringIO())
+        self.assertEqual(Solution.objects.count(), 12)
+        self.assertEqual(TaskSubmissionState.objects.filter(latest_solution__isnull=False).count(), 12)
+        self.assertEqual(Comment.objects.count(), 12)
+        enrollment = Enrollment.objects.first()
+        self.assertEqual(enrollment.mark_count, Solution.objects.filter(
+            submitted_by=enrollment.student_id, mark__isnull=False).count())
+        with self.assertRaises(CommandError):
+            call_command('seed_bench', stdout=StringIO())
+
+        output = Path(MEDIA_ROOT) / 'bench.json'
+        call_command('bench_endpoints', '--requests', '2', '--warmup', '0', '--output', str(output),
+                     stdout=StringIO())
+        run = json.loads(output.read_text())
+        results = {(result['endpoint'], result['role']): result for result in run['results']}
+        self.assertEqual({role for _, role in results}, {'student', 'teacher', 'staff'})
+        for endpoint in ('course-list', 'course-detail', 'solution-detail', 'profile'):
+            result = results[endpoint, 'student']
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['bytes'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(run['dataset']['solution'], 12)
@@ -0,0 +1,161 @@
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from . import blobs, jobs
+from .models import Attachment, AttachmentUpload
+
+CHUNK_SIZE = 64 * 1024
+# Uploads, finished or not, are deleted this long after they started;
+# unfinished ones with their partial files.
+UPLOAD_EXPIRY = timedelta(seconds=getattr(settings, 'ATTACHMENT_UPLOAD_EXPIRY', 24 * 3600))
+MAX_CACHED_DIGESTS = 1000
+
+# Running digests of the uploads this process has been appending to, keyed by
+# upload id and stored with the offset they cover. An entry is taken out while
+# a chunk is appended and put back once it is written, so a failed chunk or
+# finalize leaves none behind. A request served by another worker (or after a
+# restart or an eviction) rebuilds the digest from the partial file once.
+_digests = {}
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}.")
+        self.offset = offset
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadIncomplete(Exception):
+    pass
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def _partial_path(upload):
+    return default_storage.path(upload.partial_name)
+
+
+def _keep_digest(upload, digest):
+    _digests.pop(upload.pk, None)
+    _digests[upload.pk] = (upload.offset, digest)
+    if len(_digests) > MAX_CACHED_DIGESTS:
+        # The least recently written upload, likely abandoned.
+        _digests.pop(next(iter(_digests)), None)
+
+
+def _digest_at(upload):
+    cached = _digests.pop(upload.pk, None)
+    if cached is not None and cached[0] == upload.offset:
+        return cached[1]
+    digest = hashlib.sha256()
+    if upload.offset:
+        with open(_partial_path(upload), 'rb') as partial:
+            remaining = upload.offset
+            while remaining:
+                block = partial.read(min(CHUNK_SIZE, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+    return digest
+
+
+def start_upload(user, filename, size):
+    upload = AttachmentUpload.objects.create(uploaded_by=user, filename=os.path.basename(filename), size=size)
+    path = _partial_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    _keep_digest(upload, hashlib.sha256())
+    jobs.enqueue('expire_uploads', dedupe_key='uploads:expire', delay=UPLOAD_EXPIRY)
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    """Append ``length`` bytes read from ``stream`` at ``offset`` and return the new offset.
+
+    The body is copied block by block into the partial file and the digest,
+    so neither Django nor this function holds the chunk in memory. If the
+    body ends early the bytes that did arrive are kept and the upload resumes
+    from there; if reading it fails the chunk is discarded, along with the
+    running digest, and the upload stays at ``offset``.
+    """
+    with transaction.atomic():
+        upload = AttachmentUpload.objects.select_for_update().get(pk=upload.pk)
+        if offset != upload.offset or upload.attachment_id is not None:
+            raise OffsetMismatch(upload.offset)
+        if offset + length > upload.size:
+            raise UploadTooLarge(f"Chunk ends past the declared size of {upload.size} bytes.")
+
+        digest = _digest_at(upload)
+        written = 0
+        with open(_partial_path(upload), 'r+b') as partial:
+            partial.seek(offset)
+            partial.truncate()
+            while written < length:
+                block = stream.read(min(CHUNK_SIZE, length - written))
+                if not block:
+                    break
+                partial.write(block)
+                digest.update(block)
+                written += len(block)
+
+        upload.offset = offset + written
+        upload.save(update_fields=['offset'])
+        _keep_digest(upload, digest)
+    return upload.offset
+
+
+def finish_upload(upload, sha256=None):
+    """Turn a fully received upload into an Attachment, verifying the digest if given."""
+    with transaction.atomic():
+        upload = AttachmentUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.attachment_id is not None:
+            return upload.attachment
+        if upload.offset != upload.size:
+            raise UploadIncomplete(f"Received {upload.offset} of {upload.size} bytes.")
+        digest = _digest_at(upload).hexdigest()
+        if sha256 and sha256.lower() != digest:
+            raise ChecksumMismatch(f"Expected sha256 {sha256}, received {digest}.")
+
+        blob = blobs.adopt_path(_partial_path(upload), digest, upload.size)
+        attachment = Attachment.objects.create(file=blob.file.name, name=upload.filename, blob=blob,
+                                               uploaded_by=upload.uploaded_by)
+        upload.attachment = attachment
+        upload.save(update_fields=['attachment'])
+    return attachment
+
+
+@jobs.register('expire_uploads')
+def expire_uploads():
+    """Delete the uploads started more than UPLOAD_EXPIRY ago and the partial files of unfinished ones.
+
+    start_upload queues this job; it queues itself again for the uploads
+    that remain, including those locked by an append right now, so every
+    upload is eventually expired.
+    """
+    now = timezone.now()
+    expired = list(
+        AttachmentUpload.objects.select_for_update(skip_locked=True)
+        .filter(created_at__lte=now - UPLOAD_EXPIRY)
+    )
+    AttachmentUpload.objects.filter(pk__in=[upload.pk for upload in expired]).delete()
+    for upload in expired:
+        _digests.pop(upload.pk, None)
+        if upload.attachment_id is None:
+            default_storage.delete(upload.partial_name)
+
+    oldest = AttachmentUpload.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    if oldest is not None:
+        jobs.enqueue('expire_uploads', dedupe_key='uploads:expire',
+                     delay=max(oldest + UPLOAD_EXPIRY - now, jobs.RETRY_DELAY))
@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import AsyncCourseView, AsyncLectureView, AsyncTaskView, CommentStreamView
 from .views import (CourseViewSet, LectureViewSet, TaskViewSet, SolutionViewSet, CommentViewSet,
-                    AttachmentViewSet, EnrollmentViewSet)
+                    AttachmentViewSet, EnrollmentViewSet, SearchView)
 
 router = DefaultRouter()
 router.register('courses', CourseViewSet)
@@ -14,4 +15,12 @@ router.register('enrollments', EnrollmentViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('search/', SearchView.as_view(), name='search'),
+    path('async/courses/', AsyncCourseView.as_view(), name='async-course-list'),
+    path('async/courses/<int:pk>/', AsyncCourseView.as_view(), name='async-course-detail'),
+    path('async/lectures/', AsyncLectureView.as_view(), name='async-lecture-list'),
+    path('async/lectures/<int:pk>/', AsyncLectureView.as_view(), name='async-lecture-detail'),
+    path('async/tasks/', AsyncTaskView.as_view(), name='async-task-list'),
+    path('async/tasks/<int:pk>/', AsyncTaskView.as_view(), name='async-task-detail'),
+    path('async/comments/stream/', CommentStreamView.as_view(), name='async-comment-stream'),
 ]
\ No newline at end of file
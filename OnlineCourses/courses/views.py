@@ -1,25 +1,273 @@
-from django.db import models
+import hashlib
+import os
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models, transaction
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
 from rest_framework.exceptions import ValidationError, PermissionDenied
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework import status
 from rest_framework.decorators import action
 from django.utils import timezone
 
-from drf_spectacular.utils import extend_schema_view, extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter
 
 from accounts.models import User
-from .models import Course, Lecture, Task, Solution, Comment, Attachment, Enrollment
+from core.metrics import TimedViewMixin, timed
+from .access import accessible_course_ids, invalidate_course_access
+from .downloads import PassthroughRenderer, serve_attachment
+from .fastpath import FastJSONRenderer, Unsupported, row_shaper
+from .feeds import Topic, feed_page, format_cursor, parse_cursor
+from .gradebook import gradebook_matrix, iter_gradebook_csv
+from . import authz, blobs, jobs, response_cache, uploads
+from .models import (
+    Course, Lecture, Task, Solution, Comment, Attachment, AttachmentUpload, Enrollment, TaskSubmissionState,
+    mark_delta
+)
 from .serializers import (
-    CourseSerializer, CourseCreateSerializer, CourseListSerializer,
+    CourseSerializer, CourseCreateSerializer, CourseListSerializer, GradebookSerializer,
     LectureSerializer, CreateLectureSerializer,
     TaskSerializer, CreateTaskSerializer,
     SolutionSerializer, CreateSolutionSerializer, SolutionMarkSerializer,
-    CommentSerializer, AttachmentSerializer, AttachmentCreateSerializer,
-    EnrollmentSerializer, EnrollmentCreateSerializer
+    SolutionBulkMarkSerializer, SolutionBulkMarkResultSerializer,
+    CommentSerializer, CommentFeedSerializer, AttachmentSerializer, AttachmentCreateSerializer,
+    AttachmentUploadSerializer, AttachmentUploadFinishSerializer,
+    EnrollmentSerializer, EnrollmentCreateSerializer, EnrollmentIdsSerializer, EnrollmentBatchResultSerializer,
+    EnrollmentImportSerializer, EnrollmentImportResultSerializer, ResponseCacheStatsSerializer,
+    SearchParamsSerializer, SearchResultSerializer, FieldSpec
+)
+from .pagination import CreatedAtPagination, SubmittedAtPagination, RequestedAtPagination, UploadedAtPagination
+from .prefetch import (
+    with_tree, prune_tree, COURSE_TREE, COURSE_LIST_TREE, LECTURE_TREE, TASK_TREE, SOLUTION_TREE, COMMENT_TREE,
+    ATTACHMENT_TREE, ENROLLMENT_TREE
 )
+from .search import scale_ranks, search
 from accounts.permissions import IsTeacher, IsStudent
 
+SPARSE_FIELDSET_PARAMETERS = [
+    OpenApiParameter('fields', str, description="Comma-separated fields to render; dots select nested fields, "
+                                                "e.g. id,name,lectures.name"),
+    OpenApiParameter('expand', str, description="Comma-separated nested lists to include when fields or expand "
+                                                "is given, e.g. lectures,lectures.tasks"),
+]
+
+class PrefetchTreeMixin:
+    """Loads the relations rendered by the read serializers in a fixed number of queries.
+
+    List and retrieve also accept ?fields= and ?expand= (see FieldSpec); the
+    relations of fields that are not rendered are not loaded either.
+    """
+    prefetch_tree = None
+
+    def get_prefetch_tree(self):
+        return self.prefetch_tree
+
+    def get_fieldspec(self):
+        if self.action not in ('list', 'retrieve'):
+            return None
+        return FieldSpec.from_query(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('fieldspec', self.get_fieldspec())
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'retrieve'):
+            tree = self.get_prefetch_tree()
+            if self.get_fieldspec() is not None:
+                tree = prune_tree(tree, self.get_serializer())
+            queryset = with_tree(queryset, tree)
+        return queryset
+
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class FastListMixin:
+    """Lists through a RowShaper and FastJSONRenderer instead of the list serializer (see fastpath.py).
+
+    Requests with ?fields=/?expand=, serializers the shaper cannot reproduce
+    and pages holding values it cannot render identically take the regular
+    path. Set ``fast_list`` to False to turn it off.
+    """
+    fast_list = True
+
+    def list(self, request, *args, **kwargs):
+        shaper = row_shaper(self.get_serializer_class()) if self.fast_list else None
+        if shaper is None or FieldSpec.from_query(request.query_params) is not None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        paths = shaper.paths + [field.lstrip('-') for field in getattr(self.paginator, 'ordering', ())]
+        queryset = queryset.values(*dict.fromkeys(paths))
+        page = self.paginate_queryset(queryset)
+        tz = timezone.get_current_timezone()
+        try:
+            data = [shaper.shape(row, tz) for row in (queryset if page is None else page)]
+        except Unsupported:
+            return super().list(request, *args, **kwargs)
+
+        if type(request.accepted_renderer) is JSONRenderer:
+            request.accepted_renderer = FastJSONRenderer()
+        return Response(data) if page is None else self.get_paginated_response(data)
+
+
+class ConditionalGetMixin:
+    """Answers conditional list/retrieve requests from the course content versions.
+
+    ``course_path`` is the lookup prefix from the viewset's model to Course.
+    The validators take one small query, so a 304 costs neither the tree
+    queries nor serialization. Lists carry only an ETag, since deleting a
+    row cannot move a maximum timestamp backwards.
+    """
+    course_path = ''
+
+    def get_validators(self):
+        """Return (ETag, Last-Modified timestamp) for the current request, or (None, None)."""
+        queryset = self.get_queryset()
+        version, changed_at = self.course_path + 'content__version', self.course_path + 'content__updated_at'
+        if self.action == 'retrieve':
+            lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            try:
+                row = queryset.filter(**{self.lookup_field: lookup}).values_list(version, changed_at).first()
+            except (TypeError, ValueError, DjangoValidationError):
+                # A malformed id: get_object() answers it with a 404.
+                return None, None
+            if row is None:
+                return None, None
+            # Courses bulk-created without a version row have no Last-Modified.
+            return self.make_etag(row[0]), None if row[1] is None else int(row[1].timestamp())
+        totals = queryset.aggregate(count=models.Count('pk'), version=models.Sum(version),
+                                    changed_at=models.Max(changed_at))
+        return self.make_etag(totals['count'], totals['version'], totals['changed_at']), None
+
+    def make_etag(self, *parts):
+        key = '|'.join([self.request.get_full_path(), *map(str, parts)])
+        return '"%s"' % hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+    def conditional(self, handler, request, *args, **kwargs):
+        # Validators are taken before the body is built: if the content changes
+        # in between, the client gets a newer body under an older ETag and
+        # simply refetches next time.
+        etag, last_modified = self.get_validators()
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+class ResponseCacheMixin:
+    """Serves list/retrieve responses from the cache, see response_cache.py.
+
+    Entries are keyed by URL and the viewer's visibility class: staff, the
+    teacher of the course, an enrolled student or anyone else. List pages
+    depend on which courses the viewer can read, so they are keyed by that
+    set instead. With ``list_follows_courses`` list pages show content of
+    those courses and are dropped only when one of them changes; staff pages
+    would span every course and are not cached.
+    """
+    list_follows_courses = False
+
+    def get_cache_course_id(self):
+        """Return the id of the course the requested object belongs to, or None to skip caching."""
+        return None
+
+    def get_known_course_id(self):
+        """Return the course id if it is known without a query."""
+        return None
+
+    def get_cache_visibility(self):
+        user = self.request.user
+        if user.is_staff:
+            return 'staff'
+        if self.action == 'list':
+            course_ids = ','.join(map(str, accessible_course_ids(user)))
+            return hashlib.md5(f'{user.role}:{course_ids}'.encode(), usedforsecurity=False).hexdigest()
+        course_id = self.get_known_course_id()
+        if course_id is not None and course_id not in accessible_course_ids(user):
+            return 'public'
+        # Unless the course is known up front, access is checked against the
+        # course stored with the entry.
+        return user.role
+
+    def serve_cached(self, handler, request, *args, **kwargs):
+        if not response_cache.timeout() or (
+                self.action == 'list' and self.list_follows_courses and request.user.is_staff):
+            return handler(request, *args, **kwargs)
+        visibility = self.get_cache_visibility()
+        key = response_cache.entry_key(self.basename, self.action, visibility, request)
+
+        entry = response_cache.lookup(key)
+        if entry is not None and (visibility not in User.RoleTypes.values or
+                                  entry['course'] in accessible_course_ids(request.user)):
+            response_cache.record('hits')
+            headers = entry['headers']
+            response = get_conditional_response(
+                request, etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(headers.get('Last-Modified', ''))
+            ) or Response(entry['data'])
+            for name, value in headers.items():
+                response[name] = value
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response_cache.record('misses')
+        if self.action == 'list':
+            names, course_id = [f'list:{self.basename}'], None
+            if self.list_follows_courses:
+                names += [f'course:{pk}' for pk in accessible_course_ids(request.user)]
+        else:
+            course_id = self.get_cache_course_id()
+            names = [] if course_id is None else [f'course:{course_id}']
+        # The tokens are taken before the data is read, so a concurrent change
+        # always outdates the entry stored below.
+        tokens = response_cache.generations(names) if names else None
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {name: response[name] for name in ('ETag', 'Last-Modified', 'Cache-Control') if name in response}
+            response_cache.store(key, tokens, response.data, headers, course_id)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def list(self, request, *args, **kwargs):
+        return self.serve_cached(super().list, request, *args, **kwargs)
+
+    @extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS)
+    def retrieve(self, request, *args, **kwargs):
+        return self.serve_cached(super().retrieve, request, *args, **kwargs)
+
+
 @extend_schema_view(
     list=extend_schema(summary="List courses", tags=['Courses'], responses=CourseListSerializer),
     retrieve=extend_schema(summary="Retrieve course", tags=['Courses'], responses=CourseSerializer),
@@ -31,10 +279,18 @@ from accounts.permissions import IsTeacher, IsStudent
                                  request=CourseCreateSerializer, responses=CourseSerializer),
     destroy=extend_schema(summary="Delete course (teacher only)", tags=['Courses']),
 )
-class CourseViewSet(ModelViewSet):
+class CourseViewSet(TimedViewMixin, ResponseCacheMixin, ConditionalGetMixin, PrefetchTreeMixin, FastListMixin,
+                    ModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
+    prefetch_tree = COURSE_TREE
+    pagination_class = CreatedAtPagination
+
+    def get_prefetch_tree(self):
+        if self.action == 'list':
+            return COURSE_LIST_TREE
+        return COURSE_TREE
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -49,8 +305,57 @@ class CourseViewSet(ModelViewSet):
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsTeacher()]
+        if self.action == 'cache_stats':
+            return [IsAdminUser()]
         return [IsAuthenticated()]
 
+    def get_known_course_id(self):
+        try:
+            return int(self.kwargs['pk'])
+        except ValueError:
+            return None
+
+    def get_cache_course_id(self):
+        return self.get_known_course_id()
+
+    @extend_schema(
+        summary="Response cache hit/miss counters (staff only)",
+        tags=['Courses'],
+        responses=ResponseCacheStatsSerializer
+    )
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        return Response(response_cache.stats())
+
+    def get_gradebook_course(self):
+        course = self.get_object()
+        user = self.request.user
+        if course.created_by_id != user.pk and not user.is_staff:
+            raise PermissionDenied("Only teacher of this course can see its gradebook.")
+        return course
+
+    @extend_schema(
+        summary="Course grade matrix with per-task and per-student statistics (course teacher only)",
+        tags=['Courses'],
+        responses=GradebookSerializer
+    )
+    @action(detail=True, methods=['get'], url_path='grade-matrix')
+    def grade_matrix(self, request, pk=None):
+        return Response(gradebook_matrix(self.get_gradebook_course()))
+
+    @extend_schema(
+        summary="Export the course gradebook as CSV (course teacher only)",
+        tags=['Courses'],
+        responses={(200, 'text/csv'): OpenApiTypes.BINARY}
+    )
+    @action(detail=True, methods=['get'], url_path=r'gradebook\.csv', url_name='gradebook-csv',
+            renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def gradebook_csv(self, request, pk=None):
+        course = self.get_gradebook_course()
+        response = StreamingHttpResponse(iter_gradebook_csv(course), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="gradebook-{course.pk}.csv"'
+        return response
+
 
 @extend_schema_view(
     list=extend_schema(summary="List lectures (only lectures of courses you have access to)", tags=['Lectures']),
@@ -63,10 +368,14 @@ class CourseViewSet(ModelViewSet):
                                  request=CreateLectureSerializer, responses=LectureSerializer),
     destroy=extend_schema(summary="Delete lecture (teacher only)", tags=['Lectures']),
 )
-class LectureViewSet(ModelViewSet):
+class LectureViewSet(TimedViewMixin, ResponseCacheMixin, ConditionalGetMixin, PrefetchTreeMixin, ModelViewSet):
     queryset = Lecture.objects.all()
     serializer_class = LectureSerializer
     permission_classes = [IsAuthenticated]
+    prefetch_tree = LECTURE_TREE
+    pagination_class = CreatedAtPagination
+    course_path = 'course__'
+    list_follows_courses = True
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -77,12 +386,7 @@ class LectureViewSet(ModelViewSet):
         user = self.request.user
         if user.is_staff:
             return Lecture.objects.all()
-        if getattr(user, 'role', None) == user.RoleTypes.TEACHER:
-            return Lecture.objects.filter(course__created_by=user)
-        return Lecture.objects.filter(
-            course__enrollments__student=user,
-            course__enrollments__status='approved'
-        ).distinct()
+        return Lecture.objects.filter(course__in=accessible_course_ids(user))
 
     def perform_create(self, serializer):
         lecture = serializer.save()
@@ -95,6 +399,12 @@ class LectureViewSet(ModelViewSet):
             return [IsTeacher()]
         return [IsAuthenticated()]
 
+    def get_cache_course_id(self):
+        try:
+            return self.get_queryset().filter(pk=self.kwargs['pk']).values_list('course_id', flat=True).first()
+        except ValueError:
+            return None
+
 @extend_schema_view(
     list=extend_schema(summary="List tasks (only tasks of courses you have access to)", tags=['Tasks']),
     retrieve=extend_schema(summary="Retrieve task", tags=['Tasks'], responses=TaskSerializer),
@@ -106,10 +416,12 @@ class LectureViewSet(ModelViewSet):
                                  request=CreateTaskSerializer, responses=TaskSerializer),
     destroy=extend_schema(summary="Delete task (teacher only)", tags=['Tasks']),
 )
-class TaskViewSet(ModelViewSet):
+class TaskViewSet(TimedViewMixin, PrefetchTreeMixin, ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
+    prefetch_tree = TASK_TREE
+    pagination_class = CreatedAtPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -120,12 +432,7 @@ class TaskViewSet(ModelViewSet):
         user = self.request.user
         if user.is_staff:
             return Task.objects.all()
-        if getattr(user, 'role', None) == User.RoleTypes.TEACHER:
-            return Task.objects.filter(lecture__course__created_by=user)
-        return Task.objects.filter(
-            lecture__course__enrollments__student=user,
-            lecture__course__enrollments__status='approved'
-        ).distinct()
+        return Task.objects.filter(lecture__course__in=accessible_course_ids(user))
 
     def perform_create(self, serializer):
         serializer.save()
@@ -148,32 +455,41 @@ class TaskViewSet(ModelViewSet):
                                  responses=SolutionSerializer),
     destroy=extend_schema(summary="Delete solution (teacher only)", tags=['Solutions']),
 )
-class SolutionViewSet(ModelViewSet):
+class SolutionViewSet(TimedViewMixin, PrefetchTreeMixin, ModelViewSet):
     queryset = Solution.objects.all()
     serializer_class = SolutionSerializer
     permission_classes = [IsAuthenticated]
+    prefetch_tree = SOLUTION_TREE
+    pagination_class = SubmittedAtPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
             return CreateSolutionSerializer
         if self.action in ['update', 'partial_update']:
             return SolutionMarkSerializer
+        if self.action == 'bulk_mark':
+            return SolutionBulkMarkSerializer
         return SolutionSerializer
 
     def get_permissions(self):
         if self.action == 'create':
             return [IsStudent()]
-        if self.action in ['update', 'partial_update', 'destroy']:
+        if self.action in ['update', 'partial_update', 'destroy', 'bulk_mark']:
             return [IsTeacher()]
         return [IsAuthenticated()]
 
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return Solution.objects.all()
-        if getattr(user, 'role', None) == User.RoleTypes.TEACHER:
-            return Solution.objects.filter(task__lecture__course__created_by=user)
-        return Solution.objects.filter(submitted_by=user)
+            queryset = Solution.objects.all()
+        elif getattr(user, 'role', None) == User.RoleTypes.TEACHER:
+            queryset = Solution.objects.filter(task__lecture__course__in=accessible_course_ids(user))
+        else:
+            queryset = Solution.objects.filter(submitted_by=user)
+        if self.action in ['update', 'partial_update', 'destroy']:
+            # The grade bookkeeping below needs the course of the solution.
+            queryset = authz.with_course_access(queryset, user)
+        return queryset
 
     def perform_create(self, serializer):
         task = serializer.validated_data['task']
@@ -181,30 +497,88 @@ class SolutionViewSet(ModelViewSet):
         if task.deadline < timezone.now():
             raise ValidationError("Deadline passed")
 
-        try:
-            enrollment = Enrollment.objects.get(student=user, course=task.lecture.course)
-        except Enrollment.DoesNotExist:
-            raise PermissionDenied("You are not enrolled in this course.")
-        if enrollment.status != Enrollment.Status.APPROVED:
-            raise PermissionDenied("Your enrollment is not approved; you cannot submit solutions.")
-
-        last_solution = Solution.objects.filter(task=task, submitted_by=user).order_by('submitted_at').last()
-        if last_solution and last_solution.mark is None:
-            raise ValidationError("Previous solution not graded")
-
-        solution = serializer.save(submitted_by=user)
-        attachments = serializer.validated_data.get('attachments', [])
-        if attachments:
-            solution.attachments.set(attachments)
+        # The serializer loaded the task with_course_access().
+        authz.require_approved_enrollment(task, "submit solutions")
+
+        with transaction.atomic():
+            # The state row is locked until commit, so concurrent submits for the
+            # same task are serialized and only one can pass the graded check.
+            state, _ = TaskSubmissionState.objects.select_for_update().get_or_create(task=task, student=user)
+            if state.latest_solution_id is not None and not state.graded:
+                raise ValidationError("Previous solution not graded")
+
+            solution = serializer.save(submitted_by=user)
+            attachments = serializer.validated_data.get('attachments', [])
+            if attachments:
+                solution.attachments.set(attachments)
+            state.latest_solution = solution
+            state.graded = False
+            state.save(update_fields=['latest_solution', 'graded'])
 
     def perform_update(self, serializer):
-        instance = serializer.save()
-        if instance.mark is not None:
-            try:
-                enrollment = Enrollment.objects.get(student=instance.submitted_by, course=instance.task.lecture.course)
-                enrollment.update_average_grade()
-            except Enrollment.DoesNotExist:
-                pass
+        with transaction.atomic():
+            old_mark = Solution.objects.select_for_update().values_list('mark', flat=True).get(
+                pk=serializer.instance.pk)
+            instance = serializer.save()
+            Enrollment.objects.filter(
+                student=instance.submitted_by_id, course=instance.course_id
+            ).record_mark_change(old_mark, instance.mark)
+            TaskSubmissionState.objects.filter(latest_solution=instance.pk).update(graded=instance.mark is not None)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Enrollment.objects.filter(
+                student=instance.submitted_by_id, course=instance.course_id
+            ).record_mark_change(instance.mark, None)
+
+    @extend_schema(
+        summary="Set marks for many solutions at once (teacher only)",
+        tags=['Solutions'],
+        request=SolutionBulkMarkSerializer,
+        responses={200: SolutionBulkMarkResultSerializer(many=True)}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-mark')
+    def bulk_mark(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        marks = {item['id']: item['mark'] for item in serializer.validated_data['marks']}
+
+        results = {pk: {'id': pk, 'status': 'not_found'} for pk in marks}
+        with transaction.atomic():
+            solutions = list(
+                self.get_queryset().select_for_update(of=('self',))
+                .filter(pk__in=marks)
+                .annotate(course_id=models.F('task__lecture__course_id'))
+                .only('id', 'mark', 'submitted_by_id')
+            )
+            deltas = defaultdict(lambda: [0, 0])
+            changed = []
+            for solution in solutions:
+                new_mark = marks[solution.pk]
+                results[solution.pk] = {'id': solution.pk, 'status': 'unchanged', 'mark': new_mark}
+                if solution.mark == new_mark:
+                    continue
+                sum_delta, count_delta = mark_delta(solution.mark, new_mark)
+                delta = deltas[(solution.submitted_by_id, solution.course_id)]
+                delta[0] += sum_delta
+                delta[1] += count_delta
+                solution.mark = new_mark
+                changed.append(solution)
+                results[solution.pk]['status'] = 'updated'
+
+            Solution.objects.bulk_update(changed, ['mark'])
+            Course.objects.filter(pk__in={solution.course_id for solution in changed}).bump_content_version()
+            for graded in (True, False):
+                TaskSubmissionState.objects.filter(
+                    latest_solution__in=[solution.pk for solution in changed if (solution.mark is not None) == graded]
+                ).update(graded=graded)
+            for (student_id, course_id), (sum_delta, count_delta) in deltas.items():
+                if sum_delta or count_delta:
+                    Enrollment.objects.filter(student=student_id, course=course_id).apply_mark_delta(
+                        sum_delta, count_delta)
+
+        return Response(list(results.values()))
 
 
 @extend_schema_view(
@@ -218,45 +592,61 @@ class SolutionViewSet(ModelViewSet):
                                  responses=CommentSerializer),
     destroy=extend_schema(summary="Delete comment", tags=['Comments']),
 )
-class CommentViewSet(ModelViewSet):
+class CommentViewSet(TimedViewMixin, PrefetchTreeMixin, ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    prefetch_tree = COMMENT_TREE
+    pagination_class = CreatedAtPagination
 
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
             return Comment.objects.all()
+        course_ids = accessible_course_ids(user)
         if getattr(user, 'role', None) == User.RoleTypes.TEACHER:
-            return Comment.objects.filter(solution__task__lecture__course__created_by=user)
+            return Comment.objects.filter(solution__task__lecture__course__in=course_ids)
         return Comment.objects.filter(
             models.Q(solution__submitted_by=user) |
-            models.Q(solution__task__lecture__course__enrollments__student=user,
-                     solution__task__lecture__course__enrollments__status='approved')
-        ).distinct()
+            models.Q(solution__task__lecture__course__in=course_ids)
+        )
 
     def perform_create(self, serializer):
         user = self.request.user
+        # The serializer loaded the solution with_course_access().
         solution = serializer.validated_data.get('solution')
-        course = solution.task.lecture.course
 
         if getattr(user, 'role', None) == User.RoleTypes.TEACHER:
-            if course.created_by != user and not user.is_staff:
+            if not authz.is_course_teacher(solution, user):
                 raise PermissionDenied("Only teacher of this course can comment.")
-            serializer.save(author=user)
-            return
+        elif solution.submitted_by_id != user.pk:
+            authz.require_approved_enrollment(solution, "comment")
+        serializer.save(author=user)
 
-        if solution.submitted_by == user:
-            serializer.save(author=user)
-            return
+    @extend_schema(
+        summary="Comments of a solution or course after a cursor, oldest first",
+        tags=['Comments'],
+        parameters=[
+            OpenApiParameter('solution', int, description="Solution whose comments to list."),
+            OpenApiParameter('course', int, description="Course whose comments to list (instead of solution)."),
+            OpenApiParameter('since', str, description="Cursor from a previous response; without it the latest "
+                                                       "comments are returned."),
+        ],
+        responses=CommentFeedSerializer
+    )
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        """Polling endpoint: one access check and one index range scan, instead of the full list."""
+        topic = Topic.from_params(request.query_params)
+        topic.authorize(request.user)
+        since = request.query_params.get('since')
+        comments, has_more = feed_page(topic, parse_cursor(since) if since else None)
+        return Response({
+            'results': timed(CommentSerializer(comments, many=True)).data,
+            'cursor': format_cursor(comments[-1]) if comments else since,
+            'has_more': has_more,
+        })
 
-        try:
-            enrollment = Enrollment.objects.get(student=user, course=course)
-        except Enrollment.DoesNotExist:
-            raise PermissionDenied("You are not enrolled in this course.")
-        if enrollment.status != Enrollment.Status.APPROVED:
-            raise PermissionDenied("Your enrollment is not approved; you cannot comment.")
-        serializer.save(author=user)
 
 @extend_schema_view(
     list=extend_schema(summary="List attachments (only attachments user can access)", tags=['Attachments']),
@@ -265,10 +655,12 @@ class CommentViewSet(ModelViewSet):
                          responses=AttachmentSerializer),
     destroy=extend_schema(summary="Delete attachment", tags=['Attachments']),
 )
-class AttachmentViewSet(ModelViewSet):
+class AttachmentViewSet(TimedViewMixin, PrefetchTreeMixin, ModelViewSet):
     queryset = Attachment.objects.all()
     serializer_class = AttachmentSerializer
     permission_classes = [IsAuthenticated]
+    prefetch_tree = ATTACHMENT_TREE
+    pagination_class = UploadedAtPagination
     http_method_names = ['get', 'post', 'delete']
 
     def get_queryset(self):
@@ -277,19 +669,112 @@ class AttachmentViewSet(ModelViewSet):
         if user.is_staff:
             return Attachment.objects.all()
 
+        # Membership through the M2M tables is tested with IN subqueries so the
+        # result needs no DISTINCT.
         if getattr(user, 'role', None) == User.RoleTypes.TEACHER:
+            course_ids = accessible_course_ids(user)
             return Attachment.objects.filter(
-                models.Q(lectures__course__created_by=user) |
-                models.Q(solutions__task__lecture__course__created_by=user)
-            ).distinct()
+                models.Q(pk__in=Lecture.attachments.through.objects.filter(
+                    lecture__course__in=course_ids).values('attachment')) |
+                models.Q(pk__in=Solution.attachments.through.objects.filter(
+                    solution__task__lecture__course__in=course_ids).values('attachment'))
+            )
 
         return Attachment.objects.filter(
             models.Q(uploaded_by=user) |
-            models.Q(solutions__submitted_by=user)
-        ).distinct()
+            models.Q(pk__in=Solution.attachments.through.objects.filter(
+                solution__submitted_by=user).values('attachment'))
+        )
 
     def perform_create(self, serializer):
-        serializer.save(uploaded_by=self.request.user)
+        # Identical content is stored once; the attachment points at the shared blob.
+        upload = serializer.validated_data['file']
+        with transaction.atomic():
+            blob = blobs.store_file(upload)
+            serializer.save(uploaded_by=self.request.user, file=blob.file.name, blob=blob,
+                            name=os.path.basename(upload.name))
+
+    @extend_schema(
+        summary="Download attachment file (supports Range and conditional requests)",
+        tags=['Attachments'],
+        responses={(200, 'application/octet-stream'): OpenApiTypes.BINARY,
+                   (206, 'application/octet-stream'): OpenApiTypes.BINARY,
+                   304: None, 416: None}
+    )
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def download(self, request, pk=None):
+        return serve_attachment(request, self.get_object())
+
+    def get_upload(self, upload_id):
+        return get_object_or_404(AttachmentUpload, pk=upload_id, uploaded_by=self.request.user)
+
+    @extend_schema(
+        summary="Start a resumable upload",
+        tags=['Attachments'],
+        request=AttachmentUploadSerializer,
+        responses={201: AttachmentUploadSerializer}
+    )
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def start_upload(self, request):
+        serializer = AttachmentUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = uploads.start_upload(request.user, serializer.validated_data['filename'],
+                                      serializer.validated_data['size'])
+        return Response(timed(AttachmentUploadSerializer(upload)).data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        summary="Resumable upload status (the offset to continue from)",
+        tags=['Attachments'],
+        responses=AttachmentUploadSerializer
+    )
+    @action(detail=False, methods=['get'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)')
+    def upload_status(self, request, upload_id=None):
+        return Response(timed(AttachmentUploadSerializer(self.get_upload(upload_id))).data)
+
+    @extend_schema(
+        summary="Append a chunk (raw body, position in the Upload-Offset header)",
+        operation_id='courses_attachments_uploads_append',
+        tags=['Attachments'],
+        request={'application/offset+octet-stream': OpenApiTypes.BINARY},
+        responses={200: AttachmentUploadSerializer, 409: AttachmentUploadSerializer}
+    )
+    @upload_status.mapping.post
+    def append_chunk(self, request, upload_id=None):
+        upload = self.get_upload(upload_id)
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError({'detail': "Upload-Offset and Content-Length headers are required."})
+
+        # The body is read straight from the request stream; touching
+        # request.data would buffer the whole chunk first.
+        try:
+            upload.offset = uploads.append_chunk(upload, offset, request.stream, length)
+        except uploads.OffsetMismatch as e:
+            upload.offset = e.offset
+            return Response(timed(AttachmentUploadSerializer(upload)).data, status=status.HTTP_409_CONFLICT)
+        except uploads.UploadTooLarge as e:
+            return Response({'detail': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return Response(timed(AttachmentUploadSerializer(upload)).data)
+
+    @extend_schema(
+        summary="Finish a resumable upload and create the attachment",
+        tags=['Attachments'],
+        request=AttachmentUploadFinishSerializer,
+        responses={201: AttachmentSerializer}
+    )
+    @action(detail=False, methods=['post'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/finalize')
+    def finalize_upload(self, request, upload_id=None):
+        upload = self.get_upload(upload_id)
+        serializer = AttachmentUploadFinishSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            attachment = uploads.finish_upload(upload, serializer.validated_data.get('sha256'))
+        except (uploads.UploadIncomplete, uploads.ChecksumMismatch) as e:
+            raise ValidationError({'detail': str(e)})
+        return Response(timed(AttachmentSerializer(attachment, context=self.get_serializer_context())).data,
+                        status=status.HTTP_201_CREATED)
 
 
 @extend_schema_view(
@@ -303,33 +788,48 @@ class AttachmentViewSet(ModelViewSet):
                                  request=EnrollmentCreateSerializer, responses=EnrollmentSerializer),
     destroy=extend_schema(summary="Delete enrollment", tags=['Enrollments']),
 )
-class EnrollmentViewSet(ModelViewSet):
+class EnrollmentViewSet(TimedViewMixin, PrefetchTreeMixin, FastListMixin, ModelViewSet):
     queryset = Enrollment.objects.all()
     serializer_class = EnrollmentSerializer
     permission_classes = [IsAuthenticated]
+    prefetch_tree = ENROLLMENT_TREE
+    pagination_class = RequestedAtPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
             return EnrollmentCreateSerializer
+        if self.action in ['bulk_approve', 'bulk_reject']:
+            return EnrollmentIdsSerializer
+        if self.action == 'bulk_import':
+            return EnrollmentImportSerializer
         return EnrollmentSerializer
 
     def get_permissions(self):
         if self.action == 'create':
             return [IsAuthenticated()]
-        if self.action in ['update', 'partial_update', 'destroy', 'approve', 'reject']:
+        if self.action in ['update', 'partial_update', 'destroy', 'approve', 'reject',
+                           'bulk_approve', 'bulk_reject', 'bulk_import']:
             return [ IsTeacher()]
         return [IsAuthenticated()]
 
+    def get_taught_courses(self):
+        user = self.request.user
+        if user.is_staff:
+            return Course.objects.all()
+        return Course.objects.filter(created_by=user)
+
     def perform_create(self, serializer):
         user = self.request.user
         if user.role == User.RoleTypes.STUDENT:
-            serializer.save(student=user, status=Enrollment.Status.PENDING)
+            fields = {'student': user, 'status': Enrollment.Status.PENDING}
         elif user.role == User.RoleTypes.TEACHER:
-            instance = serializer.save()
-            if instance.status == Enrollment.Status.APPROVED:
-                instance.update_average_grade()
+            fields = {}
         else:
             raise PermissionDenied("Only students or teachers can create enrollments.")
+        with transaction.atomic():
+            instance = serializer.save(**fields)
+            # Solutions from an earlier enrollment count again; a worker recomputes the average.
+            jobs.recompute_grades_later([instance.pk])
 
     @extend_schema(
         summary="Approve enrollment (teacher only)",
@@ -341,7 +841,6 @@ class EnrollmentViewSet(ModelViewSet):
         enrollment = self.get_object()
         enrollment.status = Enrollment.Status.APPROVED
         enrollment.save(update_fields=['status'])
-        enrollment.update_average_grade()
         return Response({'status': 'approved'})
 
     @extend_schema(
@@ -356,7 +855,116 @@ class EnrollmentViewSet(ModelViewSet):
         enrollment.save(update_fields=['status'])
         return Response({'status': 'rejected'})
 
-    def perform_update(self, serializer):
-        prev_instance = self.get_object()
-        instance = serializer.save()
-        instance.update_average_grade()
+    def set_status_in_bulk(self, request, status):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        with transaction.atomic():
+            found = dict(Enrollment.objects.select_for_update().filter(
+                pk__in=ids, course__in=self.get_taught_courses()
+            ).values_list('pk', 'student_id'))
+            Enrollment.objects.filter(pk__in=found).update(status=status)
+        invalidate_course_access(*found.values())
+        return Response({'updated': sorted(found), 'not_found': sorted(ids.difference(found))})
+
+    @extend_schema(
+        summary="Approve many enrollments (teacher only)",
+        tags=['Enrollments'],
+        request=EnrollmentIdsSerializer,
+        responses={200: EnrollmentBatchResultSerializer}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-approve')
+    def bulk_approve(self, request):
+        return self.set_status_in_bulk(request, Enrollment.Status.APPROVED)
+
+    @extend_schema(
+        summary="Reject many enrollments (teacher only)",
+        tags=['Enrollments'],
+        request=EnrollmentIdsSerializer,
+        responses={200: EnrollmentBatchResultSerializer}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-reject')
+    def bulk_reject(self, request):
+        return self.set_status_in_bulk(request, Enrollment.Status.REJECTED)
+
+    @extend_schema(
+        summary="Enroll many students at once (teacher only)",
+        tags=['Enrollments'],
+        request=EnrollmentImportSerializer,
+        responses={200: EnrollmentImportResultSerializer}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-import')
+    def bulk_import(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['enrollments']
+
+        course_ids = set(self.get_taught_courses().filter(
+            pk__in={item['course'] for item in items}
+        ).values_list('pk', flat=True))
+        student_ids = set(User.objects.filter(
+            pk__in={item['student'] for item in items}, role=User.RoleTypes.STUDENT
+        ).values_list('pk', flat=True))
+
+        accepted, rejected = [], []
+        for item in items:
+            if item['course'] not in course_ids:
+                rejected.append({**item, 'error': "Course not found or not taught by you."})
+            elif item['student'] not in student_ids:
+                rejected.append({**item, 'error': "Student not found."})
+            else:
+                accepted.append(Enrollment(student_id=item['student'], course_id=item['course'],
+                                           status=item['status']))
+
+        with transaction.atomic():
+            imported = Enrollment.objects.filter(course__in=course_ids, student__in=student_ids)
+            before = imported.count()
+            # Existing (student, course) pairs are skipped by the unique constraint.
+            Enrollment.objects.bulk_create(accepted, batch_size=1000, ignore_conflicts=True)
+            created = imported.count() - before
+            if created:
+                for course_id in {enrollment.course_id for enrollment in accepted}:
+                    jobs.recompute_grades_later(course=course_id)
+        invalidate_course_access(*{enrollment.student_id for enrollment in accepted})
+
+        return Response({'requested': len(items), 'created': created, 'rejected': rejected})
+
+
+@extend_schema(
+    summary="Search lectures and tasks you have access to, best match first",
+    tags=['Search'],
+    parameters=[SearchParamsSerializer],
+    responses=SearchResultSerializer(many=True)
+)
+class SearchView(TimedViewMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_querysets(self, user):
+        """The lectures and tasks the user may read, as in LectureViewSet and TaskViewSet."""
+        if user.is_staff:
+            return Lecture.objects.all(), Task.objects.all()
+        course_ids = accessible_course_ids(user)
+        return Lecture.objects.filter(course__in=course_ids), Task.objects.filter(lecture__course__in=course_ids)
+
+    def get(self, request):
+        params = SearchParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query, kind, limit = (params.validated_data['q'], params.validated_data.get('type'),
+                              params.validated_data['limit'])
+        lectures, tasks = self.get_querysets(request.user)
+
+        results = []
+        if kind in (None, 'lecture'):
+            results += scale_ranks([
+                {'type': 'lecture', 'id': pk, 'course': course, 'lecture': None, 'title': name, 'rank': rank}
+                for pk, course, name, rank in
+                search(lectures, query).values_list('id', 'course_id', 'name', 'rank')[:limit]
+            ])
+        if kind in (None, 'task'):
+            results += scale_ranks([
+                {'type': 'task', 'id': pk, 'course': course, 'lecture': lecture, 'title': title, 'rank': rank}
+                for pk, course, lecture, title, rank in
+                search(tasks, query).values_list('id', 'lecture__course_id', 'lecture_id', 'title', 'rank')[:limit]
+            ])
+        results.sort(key=lambda result: -result['rank'])
+        return Response(timed(SearchResultSerializer(results[:limit], many=True)).data)